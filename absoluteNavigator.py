@@ -7,6 +7,11 @@ from datetime import datetime
 import copy
 import json
 
+from cloud.gridIndex import GridIndex
+from cloud.tiledCloud import TiledCloud
+from cloud.compactCloud import CompactCloud
+from cloud.cloudPyramid import CloudPyramid
+
 class AbsoluteLidarNavigator(NavigatorBase):
 
     def __init__(self, args):
@@ -23,6 +28,32 @@ class AbsoluteLidarNavigator(NavigatorBase):
 
     def load_point_cloud(self, path):
 
+        # A tiled cloud is loaded lazily, tile by tile (see TiledCloud), and compact clouds (also the levels of a pyramid,
+        # see CloudPyramid) are memory mapped, instead of being read into memory at once. None of them are shown in the visualization.
+        if CloudPyramid.is_pyramid(path) or TiledCloud.is_tiled(path) or path.lower().endswith(CompactCloud.EXTENSION):
+            self.full_cloud = None
+
+            if CloudPyramid.is_pyramid(path):
+                self.cloud_index = CloudPyramid(path)
+                data = self.cloud_index.metadata
+            elif TiledCloud.is_tiled(path):
+                self.cloud_index = TiledCloud(path, self.args.cloud_memory_limit, self.args.cloud_index_cell_size)
+                data = self.cloud_index.get_metadata()
+            else:
+                self.cloud_index = CompactCloud(path)
+                data = self.cloud_index.metadata
+
+            self.full_point_cloud_offset = np.array([data["offset"][0], data["offset"][1], data["offset"][2]])
+
+            # The grid index of compact clouds is stored in the file, so the cell size can't be changed when loading them.
+            compact = self.cloud_index.levels[-1] if isinstance(self.cloud_index, CloudPyramid) else self.cloud_index
+            if isinstance(compact, CompactCloud) and compact.cell_size != self.args.cloud_index_cell_size:
+                tqdm.write(f"Warning: --cloud-index-cell-size {self.args.cloud_index_cell_size} is ignored, {path} is indexed with cell size {compact.cell_size} (see --index-cell-size of pointCloud.py).")
+
+            tqdm.write("Point cloud metadata:")
+            tqdm.write(json.dumps(data, indent=4, sort_keys=True))
+            return
+
         cloud_meta_data_path = path.replace(".pcd", "-meta.json")
 
         with tqdm(total=1, desc="Loading point cloud", **self.tqdm_config) as pbar:
@@ -33,10 +64,17 @@ class AbsoluteLidarNavigator(NavigatorBase):
             self.full_point_cloud_offset = np.array([data["offset"][0], data["offset"][1], data["offset"][2]])
             self.full_cloud = o3d.io.read_point_cloud(path)
 
-            self.full_cloud.paint_uniform_color([0.3, 0.6, 1.0])
+            # The colors are only used when the full cloud is shown, so don't allocate them otherwise.
+            if self.preview_always and not self.args.hide_point_cloud:
+                self.full_cloud.paint_uniform_color([0.3, 0.6, 1.0])
 
             pbar.update(1)
 
+        # Index the cloud once, so that the part around each position can be extracted without scanning the full cloud.
+        with tqdm(total=1, desc="Indexing point cloud", **self.tqdm_config) as pbar:
+            self.cloud_index = GridIndex(self.full_cloud, self.args.cloud_index_cell_size)
+            pbar.update(1)
+
         tqdm.write("Point cloud metadata:")
         tqdm.write(json.dumps(data, indent=4, sort_keys=True))
 
@@ -50,16 +88,13 @@ class AbsoluteLidarNavigator(NavigatorBase):
         
         self.initialize_navigation(rotate_sbet=False)
 
-        self.last_extracted_frame_coordinate = None
-        self.last_extracted_frame = None
-        
         # Initialize the visualizer
         self.initialize_plot_and_visualization()
 
         if self.preview_always:
             self.vis.refresh_non_blocking()
 
-            if not self.args.hide_point_cloud:
+            if not self.args.hide_point_cloud and self.full_cloud is not None:
                 self.vis.show_frame(self.full_cloud)
 
         self.is_first_frame = True
@@ -95,6 +130,9 @@ class AbsoluteLidarNavigator(NavigatorBase):
                 print(e)
                 
                 break
+
+        if isinstance(self.cloud_index, TiledCloud):
+            self.cloud_index.close()
         
         return self.finalize_navigation(navigation_exception)
 
@@ -108,7 +146,8 @@ class AbsoluteLidarNavigator(NavigatorBase):
     def throw_outside_of_cloud(self, actual_position, partial_radius):
         print("")
         print("")
-        self.print_cloud_info("Cloud", self.full_cloud, "    ")
+        if self.full_cloud is not None:
+            self.print_cloud_info("Cloud", self.full_cloud, "    ")
         print("Current position:", actual_position)
         print("Radius:", partial_radius)
         raise Exception("The point cloud contains no points around the current position.")
@@ -159,24 +198,26 @@ class AbsoluteLidarNavigator(NavigatorBase):
 
         # Extract a part of the cloud around the actual position. This is the cloud we are going to register against.
         partial_radius = self.args.cloud_part_radius
-        pr = np.array([partial_radius, partial_radius, partial_radius])
 
         previous_estimated_coordinate = self.current_estimated_coordinate.clone()
-
-        # Keep a slightly larger partial cloud to make it quicker to extract the actual partial cloud
-        # This reduced time usage from 27 to 9 seconds on first 20 frames of a random file.
         pec_np = previous_estimated_coordinate.np()
 
-        if self.last_extracted_frame_coordinate is None or self.last_extracted_frame_coordinate.distance2d(self.current_estimated_coordinate) >= partial_radius * 0.8:
-
-            bbox = o3d.geometry.AxisAlignedBoundingBox(min_bound=pec_np - pr * 2, max_bound=pec_np + pr * 2)
-            self.last_extracted_frame = self.full_cloud.crop(bbox)
-            self.last_extracted_frame_coordinate = self.current_estimated_coordinate.clone()
-           
-            self.time("larger partial cloud point extraction")
-
-        bbox = o3d.geometry.AxisAlignedBoundingBox(min_bound=pec_np - pr, max_bound=pec_np + pr)
-        partial_cloud = self.last_extracted_frame.crop(bbox)
+        # Start loading the tiles along the upcoming part of the trajectory in the background (only for tiled clouds).
+        # The upcoming actual coordinates are moved by the current estimation offset, since the extraction follows the estimate.
+        if isinstance(self.cloud_index, TiledCloud) and self.args.cloud_prefetch_frames > 0:
+            upcoming = self.sbet_coordinates[actual_coordinate.frame_ix + 1:actual_coordinate.frame_ix + 1 + self.args.cloud_prefetch_frames:10]
+            self.cloud_index.prefetch(upcoming.xyz() + (pec_np - actual_coordinate.np()), partial_radius)
+            self.time("tile prefetch")
+
+        # Only the grid cells around the position are searched (see GridIndex). With a pyramid, the coarse levels are
+        # extracted as well, and used for the early registration iterations.
+        coarse_targets = []
+        if isinstance(self.cloud_index, CloudPyramid):
+            levels = self.cloud_index.extract_levels(pec_np, partial_radius, self.args.cloud_part_shape == "cylinder")
+            partial_cloud = levels[-1][1]
+            coarse_targets = levels[:-1]
+        else:
+            partial_cloud = self.cloud_index.extract(pec_np, partial_radius, self.args.cloud_part_shape == "cylinder")
 
         if len(partial_cloud.points) < 10:
             self.throw_outside_of_cloud(self.current_estimated_coordinate, partial_radius)
@@ -191,14 +232,16 @@ class AbsoluteLidarNavigator(NavigatorBase):
         # Move the points so that the current coordinate is in the origin.
         # Now, both the current frame and this part of the cloud should be positioned very close to each other around the origin.
         partial_cloud.translate(-pec_np, relative=True)
+        for (_, coarse_target) in coarse_targets:
+            coarse_target.translate(-pec_np, relative=True)
         self.time("partial cloud point movement")
 
         # Estimate normals for the target frame
-        frame.estimate_normals(search_param=o3d.geometry.KDTreeSearchParamHybrid(radius=0.1, max_nn=30))
+        self.estimate_normals(frame)
 
         self.time("frame normal estimation")
 
-        reg = self.run_registration(frame, partial_cloud, previous_estimated_coordinate, actual_coordinate)
+        reg = self.run_registration(frame, partial_cloud, previous_estimated_coordinate, actual_coordinate, coarse_targets)
 
         # Update the visualization
         if self.preview_always:
@@ -221,9 +264,13 @@ class AbsoluteLidarNavigator(NavigatorBase):
     def read_args():
         parser = NavigatorBase.create_parser()
 
-        parser.add_argument('--point-cloud', type=str, required=True, help="An Open3D point cloud file to use for absolute navigation, preferably generated by pointCloud.py. Every frame in the PCAP file(s) is registered against this point cloud in order to geolocate the frames.")
+        parser.add_argument('--point-cloud', type=str, required=True, help="An Open3D point cloud file to use for absolute navigation, preferably generated by pointCloud.py (a .pcd file, a compact .cloud file, a directory of tiles, or a .pyramid.json file). Every frame in the PCAP file(s) is registered against this point cloud in order to geolocate the frames.")
         parser.add_argument('--hide-point-cloud', dest='hide_point_cloud', default=False, action='store_true', help="If set to true, the full point cloud will not be displayed in the visualization. Can be useful for a visualization performance boost, or if the frames drawn together with the cloud gets too chaotic.")
         parser.add_argument('--cloud-part-radius', type=float, default=30, required=False, help="The radius of the part of the cloud that is extracted for local registration -- frames are registered against these extracted parts of the full cloud, as registration against the full cloud is very time consuming, and gives poor results.")
+        parser.add_argument('--cloud-part-shape', type=str, default="box", choices=["box", "cylinder"], required=False, help="The shape of the extracted part of the cloud: a box with sides of 2 x --cloud-part-radius, or a vertical cylinder with radius --cloud-part-radius (and the same height as the box).")
+        parser.add_argument('--cloud-memory-limit', type=float, default=4096, required=False, help="The maximum memory usage (in MB) of the loaded tiles when --point-cloud is a tiled cloud (a directory or manifest written by pointCloud.py --write-tiles). The least recently used tiles are evicted when the limit is exceeded.")
+        parser.add_argument('--cloud-prefetch-frames', type=int, default=100, required=False, help="When --point-cloud is a tiled cloud, the tiles around the positions of this many upcoming frames are loaded in the background. Set to 0 to disable prefetching.")
+        parser.add_argument('--cloud-index-cell-size', type=float, default=5, required=False, help="The cell size (in meters) of the grid index used to extract parts of the point cloud quickly.")
         
         return NavigatorBase.add_standard_and_parse_args(parser)
         
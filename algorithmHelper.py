@@ -2,6 +2,7 @@ from matchers.nicp import NicpMatcher
 from matchers.downsamplefirst import DownsampleFirstNicpMatcher
 from matchers.globalregistrationfirst import GlobalFirstNicpMatcher
 from matchers.fastglobalregistrationfirst import FastGlobalFirstNicpMatcher
+from matchers.featureicp import FeatureIcpMatcher
 #from matchers.probregmatchers import CpdMatcher, FilterregMatcher
 
 class AlgorithmHelper:
@@ -20,6 +21,7 @@ class AlgorithmHelper:
         AlgorithmHelper._add_algorithm(DownsampleFirstNicpMatcher(0.05), "Downsample (0.05), then NICP")
         AlgorithmHelper._add_algorithm(GlobalFirstNicpMatcher(), "Global registration, then NICP")
         AlgorithmHelper._add_algorithm(FastGlobalFirstNicpMatcher(), "Fast global registration, then NICP")
+        AlgorithmHelper._add_algorithm(FeatureIcpMatcher(), "Feature ICP")
         #AlgorithmHelper._add_algorithm(CpdMatcher(tf_type_name="rigid"), "CPD rigid")
         #AlgorithmHelper._add_algorithm(CpdMatcher(tf_type_name="affine"), "CPD affine")
         #AlgorithmHelper._add_algorithm(CpdMatcher(tf_type_name="nonrigid"), "CPD nonrigid")
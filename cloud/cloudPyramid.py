@@ -0,0 +1,71 @@
+import os
+import json
+
+from cloud.compactCloud import CompactCloud
+
+class CloudPyramid:
+    """
+    A reference point cloud with multiple resolutions (levels), each stored as a compact cloud (see CompactCloud) with
+    normals, and described by a manifest (.pyramid.json) with the voxel size and file of each level, and the point cloud
+    metadata. All levels are moved with the same offset. Pyramids are written by pointCloud.py (--write-pyramid).
+
+    The coarse levels are used by the absolute navigator for the early registration iterations (see
+    NavigatorBase.run_registration), so that only the last iterations are run against the most detailed level.
+    """
+
+    EXTENSION = ".pyramid.json"
+    VERSION = 1
+
+    def __init__(self, path):
+        self.path = path
+        self.directory = os.path.dirname(path)
+
+        with open(path, "r") as f:
+            self.manifest = json.load(f)
+
+        if self.manifest.get("version") != CloudPyramid.VERSION:
+            raise Exception("Unsupported point cloud pyramid version: " + str(self.manifest.get("version")) + " (" + path + ")")
+
+        self.metadata = self.manifest["metadata"]
+
+        # The levels, from the coarsest to the most detailed.
+        levels = sorted(self.manifest["levels"], key=lambda x: x["voxel_size"], reverse=True)
+        self.voxel_sizes = [x["voxel_size"] for x in levels]
+        self.levels = [CompactCloud(os.path.join(self.directory, x["file"])) for x in levels]
+
+    @staticmethod
+    def is_pyramid(path):
+        return path.lower().endswith(CloudPyramid.EXTENSION)
+
+    @staticmethod
+    def get_level_path(path, voxel_size):
+        """Returns the path of the compact cloud with the given voxel size in the pyramid with the given manifest path
+        (for example reference.pyramid.json -> reference_500.cloud for 0.5)."""
+
+        root = path[:-len(CloudPyramid.EXTENSION)] if CloudPyramid.is_pyramid(path) else os.path.splitext(path)[0]
+        return root + "_" + str(int(round(voxel_size * 1000))).zfill(3) + CompactCloud.EXTENSION
+
+    @staticmethod
+    def write_manifest(path, levels):
+        """Writes the manifest for the given levels, a list of (voxel size, metadata) where all levels are written to
+        their level paths (see get_level_path). The metadata of the most detailed level is used for the pyramid."""
+
+        levels = sorted(levels, key=lambda x: x[0])
+
+        manifest = {
+            "version": CloudPyramid.VERSION,
+            "metadata": levels[0][1],
+            "levels": [{ "voxel_size": voxel_size, "file": os.path.basename(CloudPyramid.get_level_path(path, voxel_size)) } for (voxel_size, _) in levels]
+        }
+
+        with open(path, "w") as f:
+            json.dump(manifest, f)
+
+    def extract(self, center, radius, cylinder=False):
+        """Returns the part of the most detailed level within the given radius from the center (see GridIndex.extract)."""
+        return self.levels[-1].extract(center, radius, cylinder)
+
+    def extract_levels(self, center, radius, cylinder=False):
+        """Returns the part of each level within the given radius from the center, as a list of (voxel size, cloud) from
+        the coarsest to the most detailed level."""
+        return [(voxel_size, level.extract(center, radius, cylinder)) for (voxel_size, level) in zip(self.voxel_sizes, self.levels)]
@@ -0,0 +1,131 @@
+import json
+import numpy as np
+
+from cloud.gridIndex import GridIndex
+
+class CompactCloud(GridIndex):
+    """
+    A reference point cloud in a compact binary format (.cloud), which is memory mapped instead of read into memory.
+
+    The points are stored as float32 coordinates relative to an origin stored in the header (the center of the cloud),
+    optionally with normals packed as int8 (scaled by 127) or float16, and without colors. The points are sorted by
+    grid cell when written, and the cell offsets of the grid index (see GridIndex) are stored in the file, so the
+    index is ready as soon as the file is mapped. Only the extracted parts of the cloud are converted to float64
+    Open3D point clouds.
+
+    File layout: the magic bytes, the header length (uint64), the JSON header (padded to 64 bytes), the cell starts
+    (int64) and the point records (see get_dtype).
+    """
+
+    EXTENSION = ".cloud"
+    MAGIC = b"TPCLOUD\0"
+    VERSION = 1
+
+    normal_formats = ["int8", "float16", "none"]
+
+    def __init__(self, path):
+        self.path = path
+
+        with open(path, "rb") as f:
+            if f.read(len(CompactCloud.MAGIC)) != CompactCloud.MAGIC:
+                raise Exception("Not a compact point cloud file: " + path)
+            header_length = int(np.frombuffer(f.read(8), dtype="<u8")[0])
+            self.header = json.loads(f.read(header_length).decode("utf-8"))
+
+        if self.header["version"] != CompactCloud.VERSION:
+            raise Exception("Unsupported compact point cloud version: " + str(self.header["version"]) + " (" + path + ")")
+
+        self.metadata = self.header["metadata"]
+        self.origin = np.array(self.header["origin"])
+        self.normal_format = self.header["normals"]
+        self.cell_size = self.header["cell_size"]
+        self.min_bound = np.array(self.header["min_bound"])
+        (self.columns, self.rows) = (self.header["columns"], self.header["rows"])
+        self.count = self.header["count"]
+
+        cells_offset = CompactCloud.get_data_offset(header_length)
+        self.cell_starts = np.memmap(path, dtype="<i8", mode="r", offset=cells_offset, shape=(self.columns * self.rows + 1,))
+
+        dtype = CompactCloud.get_dtype(self.normal_format)
+        if self.count > 0:
+            self.records = np.memmap(path, dtype=dtype, mode="r", offset=cells_offset + self.cell_starts.nbytes, shape=(self.count,))
+        else:
+            self.records = np.zeros(0, dtype=dtype)
+
+    @staticmethod
+    def get_dtype(normal_format):
+        fields = [("xyz", "<f4", (3,))]
+        if normal_format == "int8":
+            fields.append(("normal", "i1", (3,)))
+        elif normal_format == "float16":
+            fields.append(("normal", "<f2", (3,)))
+        return np.dtype(fields)
+
+    @staticmethod
+    def get_data_offset(header_length):
+        """Returns the offset of the cell starts in the file (after the magic bytes, header length and padded header)."""
+        offset = len(CompactCloud.MAGIC) + 8 + header_length
+        return offset + (-offset % 64)
+
+    @staticmethod
+    def write(path, cloud, metadata, cell_size=5, normal_format="int8", chunk_size=10000000):
+        """Writes the given Open3D cloud to the given path. The points of the given cloud are sorted by grid cell in place."""
+
+        if normal_format not in CompactCloud.normal_formats:
+            raise ValueError("Unknown normal format: " + str(normal_format))
+        if not cloud.has_normals():
+            normal_format = "none"
+
+        index = GridIndex(cloud, cell_size)
+        points = np.asarray(cloud.points)
+        normals = np.asarray(cloud.normals)
+
+        origin = (points.min(axis=0) + points.max(axis=0)) / 2 if len(points) > 0 else np.zeros(3)
+
+        header = json.dumps({
+            "version": CompactCloud.VERSION,
+            "metadata": metadata,
+            "origin": origin.tolist(),
+            "normals": normal_format,
+            "cell_size": cell_size,
+            "min_bound": index.min_bound.tolist(),
+            "columns": int(index.columns),
+            "rows": int(index.rows),
+            "count": len(points)
+        }).encode("utf-8")
+
+        dtype = CompactCloud.get_dtype(normal_format)
+
+        with open(path, "wb") as f:
+            f.write(CompactCloud.MAGIC)
+            f.write(np.array(len(header), dtype="<u8").tobytes())
+            f.write(header)
+            f.write(b"\0" * (CompactCloud.get_data_offset(len(header)) - f.tell()))
+            f.write(index.cell_starts.astype("<i8").tobytes())
+
+            # Convert and write the points in chunks, to avoid another full copy of the cloud in memory.
+            for start in range(0, len(points), chunk_size):
+                end = min(start + chunk_size, len(points))
+                records = np.empty(end - start, dtype=dtype)
+                records["xyz"] = points[start:end] - origin
+                if normal_format == "int8":
+                    records["normal"] = np.clip(np.round(normals[start:end] * 127), -127, 127)
+                elif normal_format == "float16":
+                    records["normal"] = normals[start:end]
+                f.write(records.tobytes())
+
+    def get_points(self, indices):
+        return self.records["xyz"][indices].astype(np.float64) + self.origin
+
+    def get_colors(self, indices):
+        return None
+
+    def get_normals(self, indices):
+        if self.normal_format == "none":
+            return None
+
+        normals = self.records["normal"][indices].astype(np.float64)
+        if self.normal_format == "int8":
+            normals /= 127
+
+        return normals
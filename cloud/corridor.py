@@ -0,0 +1,79 @@
+import numpy as np
+
+class Corridor:
+    """
+    The area within a given distance (the width) from a driven route, used to crop the reference point cloud to the
+    parts that can actually be used for navigation along the route.
+
+    The route is resampled with the given resolution, and points are tested against a raster (with the same resolution)
+    where every cell within the width from a route sample is marked, so the corridor edge is accurate to about one
+    raster cell.
+    """
+
+    def __init__(self, xy, width, resolution=1):
+        self.width = width
+        self.resolution = resolution
+        self.route = Corridor.resample(np.asarray(xy, dtype=np.float64)[:, 0:2], resolution)
+
+        if len(self.route) < 1:
+            raise ValueError("The corridor route contains no positions.")
+
+        self.mins = self.route.min(axis=0) - width
+        self.maxes = self.route.max(axis=0) + width
+
+        # The raster cells (relative to the cell of a route sample) that are within the width from the sample.
+        r = int(np.ceil(width / resolution))
+        (dx, dy) = np.meshgrid(np.arange(-r, r + 1), np.arange(-r, r + 1))
+        inside = (dx * dx + dy * dy) * resolution * resolution <= width * width
+        self.stencil = np.column_stack([dx[inside], dy[inside]])
+
+    @staticmethod
+    def resample(xy, resolution):
+        """Returns the route with points at (at most) the given distance from each other along the route."""
+
+        if len(xy) < 2:
+            return xy
+
+        distances = np.concatenate([[0], np.cumsum(np.sqrt(np.sum(np.diff(xy, axis=0) ** 2, axis=1)))])
+        samples = np.arange(0, distances[-1] + resolution, resolution)
+
+        return np.column_stack([np.interp(samples, distances, xy[:, 0]), np.interp(samples, distances, xy[:, 1])])
+
+    def get_route_near(self, mins, maxes):
+        """Returns the route samples that are within the width from the given bounding box."""
+
+        mask = np.all(self.route >= np.asarray(mins)[0:2] - self.width, axis=1) & np.all(self.route <= np.asarray(maxes)[0:2] + self.width, axis=1)
+        return self.route[mask]
+
+    def intersects(self, mins, maxes):
+        """Returns True if the corridor (approximately) intersects the given bounding box."""
+        return len(self.get_route_near(mins, maxes)) > 0
+
+    def contains(self, xy):
+        """Returns a boolean mask with the given points that are inside the corridor."""
+
+        xy = np.asarray(xy)[:, 0:2]
+        if len(xy) < 1:
+            return np.zeros(0, dtype=bool)
+
+        mins = xy.min(axis=0)
+        maxes = xy.max(axis=0)
+
+        route = self.get_route_near(mins, maxes)
+        if len(route) < 1:
+            return np.zeros(len(xy), dtype=bool)
+
+        # Rasterize the part of the corridor that covers the points. The raster is aligned to the origin of the coordinate
+        # system, so that a point gets the same result no matter which other points it is tested together with.
+        origin = np.floor((mins - self.width) / self.resolution) * self.resolution
+        shape = (np.floor((maxes + self.width - origin) / self.resolution).astype(np.int64) + 1)
+        raster = np.zeros(shape, dtype=bool)
+
+        route_cells = np.floor((route - origin) / self.resolution).astype(np.int64)
+        for start in range(0, len(route_cells), 1000):
+            cells = (route_cells[start:start + 1000, None, :] + self.stencil[None, :, :]).reshape(-1, 2)
+            cells = cells[np.all(cells >= 0, axis=1) & np.all(cells < shape, axis=1)]
+            raster[cells[:, 0], cells[:, 1]] = True
+
+        point_cells = np.floor((xy - origin) / self.resolution).astype(np.int64)
+        return raster[point_cells[:, 0], point_cells[:, 1]]
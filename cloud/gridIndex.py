@@ -0,0 +1,99 @@
+import numpy as np
+import open3d as o3d
+
+class GridIndex:
+    """
+    A uniform 2D grid index over a point cloud. The points of the cloud are sorted (in place) by grid cell, with the
+    cells ordered row by row, so the points of each row of cells within an x range are a single contiguous slice of the
+    point array. Extracting the points around a position therefore only touches the points in the cells that overlap
+    the extracted area, instead of scanning the full cloud.
+    """
+
+    def __init__(self, cloud, cell_size=5):
+        self.cloud = cloud
+        self.cell_size = cell_size
+
+        points = np.asarray(cloud.points)
+        self.min_bound = points[:, 0:2].min(axis=0) if len(points) > 0 else np.zeros(2)
+        max_bound = points[:, 0:2].max(axis=0) if len(points) > 0 else np.zeros(2)
+        (self.columns, self.rows) = (np.floor((max_bound - self.min_bound) / cell_size).astype(np.int64) + 1)
+
+        cells = self.get_cells(points)
+        order = np.argsort(cells, kind="stable")
+
+        # Sort the points (and colors/normals) in place, so that the index doesn't need a copy of the cloud.
+        points[:] = points[order]
+        if cloud.has_colors():
+            colors = np.asarray(cloud.colors)
+            colors[:] = colors[order]
+        if cloud.has_normals():
+            normals = np.asarray(cloud.normals)
+            normals[:] = normals[order]
+
+        # The start of each cell in the sorted points (the last element is the total number of points).
+        self.cell_starts = np.searchsorted(cells[order], np.arange(self.columns * self.rows + 1))
+
+    def get_cells(self, points):
+        (column, row) = np.floor((points[:, 0:2] - self.min_bound) / self.cell_size).astype(np.int64).T
+        return row * self.columns + column
+
+    def get_indices(self, center, radius, cylinder=False):
+        """Returns the indices (in the sorted cloud) of the points within the given radius from the center, either in a box
+        (all three axes within the radius) or a vertical cylinder (2D distance within the radius, height within the radius)."""
+
+        (column_from, row_from) = np.floor((np.asarray(center[0:2]) - radius - self.min_bound) / self.cell_size).astype(np.int64)
+        (column_to, row_to) = np.floor((np.asarray(center[0:2]) + radius - self.min_bound) / self.cell_size).astype(np.int64)
+
+        column_from = max(column_from, 0)
+        column_to = min(column_to, self.columns - 1)
+        row_from = max(row_from, 0)
+        row_to = min(row_to, self.rows - 1)
+
+        if column_from > column_to or row_from > row_to:
+            return np.zeros(0, dtype=np.int64)
+
+        # The cells between column_from and column_to in each row are contiguous.
+        rows = np.arange(row_from, row_to + 1)
+        starts = self.cell_starts[rows * self.columns + column_from]
+        ends = self.cell_starts[rows * self.columns + column_to + 1]
+
+        candidates = np.concatenate([np.arange(s, e) for (s, e) in zip(starts, ends)])
+        if len(candidates) < 1:
+            return candidates
+
+        offsets = self.get_points(candidates) - np.asarray(center)
+        inside = np.abs(offsets[:, 2]) <= radius
+        if cylinder:
+            inside &= np.einsum("ij,ij->i", offsets[:, 0:2], offsets[:, 0:2]) <= radius * radius
+        else:
+            inside &= np.all(np.abs(offsets[:, 0:2]) <= radius, axis=1)
+
+        return candidates[inside]
+
+    def get_points(self, indices):
+        return np.asarray(self.cloud.points)[indices]
+
+    def get_colors(self, indices):
+        """Returns the colors of the given points, or None if the cloud has no colors."""
+        return np.asarray(self.cloud.colors)[indices] if self.cloud.has_colors() else None
+
+    def get_normals(self, indices):
+        """Returns the normals of the given points, or None if the cloud has no normals."""
+        return np.asarray(self.cloud.normals)[indices] if self.cloud.has_normals() else None
+
+    def extract(self, center, radius, cylinder=False):
+        """Returns a new point cloud with the points (and colors/normals) within the given radius from the center (see get_indices)."""
+
+        indices = self.get_indices(center, radius, cylinder)
+
+        part = o3d.geometry.PointCloud(o3d.utility.Vector3dVector(self.get_points(indices)))
+
+        colors = self.get_colors(indices)
+        if colors is not None:
+            part.colors = o3d.utility.Vector3dVector(colors)
+
+        normals = self.get_normals(indices)
+        if normals is not None:
+            part.normals = o3d.utility.Vector3dVector(normals)
+
+        return part
@@ -0,0 +1,207 @@
+import os
+import json
+import threading
+import numpy as np
+import open3d as o3d
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from cloud.gridIndex import GridIndex
+
+class TiledCloud:
+    """
+    A reference point cloud stored as one .pcd file per fixed size XY tile, plus a manifest (manifest.json) with the
+    tile size, the point cloud metadata (offset etc, the same as in the -meta.json file of a single .pcd cloud) and the
+    bounds and point count of each tile. Tiles are written by pointCloud.py (--write-tiles).
+
+    Tiles are only loaded when they are needed, either by extract (synchronously) or by prefetch (on a background
+    thread). Loaded tiles are kept in an LRU cache, and the least recently used tiles are evicted when the loaded
+    tiles use more memory than the given limit. This makes it possible to navigate against clouds covering an
+    entire region, without loading the full cloud into memory.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path, memory_limit_mb=4096, cell_size=5):
+        self.manifest_path = os.path.join(path, "manifest.json") if os.path.isdir(path) else path
+        self.directory = os.path.dirname(self.manifest_path)
+        self.memory_limit = memory_limit_mb * 1024 * 1024
+        self.cell_size = cell_size
+
+        with open(self.manifest_path, "r") as f:
+            self.manifest = json.load(f)
+
+        if self.manifest.get("version") != TiledCloud.VERSION:
+            raise Exception("Unsupported tiled point cloud version: " + str(self.manifest.get("version")) + " (" + self.manifest_path + ")")
+
+        self.tile_size = self.manifest["tile_size"]
+        self.tiles = { (t["x"], t["y"]): t for t in self.manifest["tiles"] }
+
+        # The loaded tiles (as GridIndex objects), with the least recently used first.
+        self.loaded = OrderedDict()
+        self.memory_usage = 0
+
+        # The tiles that are currently being loaded in the background (as futures), the tiles that must not be
+        # evicted because they are used by the current extraction, and the prefetched tiles that haven't been used yet
+        # (which are only evicted if evicting all other tiles isn't enough).
+        self.loading = {}
+        self.pinned = set()
+        self.prefetched = set()
+
+        self.lock = threading.RLock()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    @staticmethod
+    def is_tiled(path):
+        if os.path.isdir(path):
+            return os.path.isfile(os.path.join(path, "manifest.json"))
+        return os.path.basename(path) == "manifest.json"
+
+    @staticmethod
+    def write(cloud, directory, tile_size, metadata):
+        """Splits the given cloud into tiles of the given size, and writes them and the manifest to the given directory."""
+
+        os.makedirs(directory, exist_ok=True)
+
+        points = np.asarray(cloud.points)
+        keys = np.floor(points[:, 0:2] / tile_size).astype(np.int64)
+        (unique_keys, inverse) = np.unique(keys, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+
+        # Sort the point indices by tile, so that each tile is a contiguous slice of the order.
+        order = np.argsort(inverse, kind="stable")
+        starts = np.searchsorted(inverse[order], np.arange(len(unique_keys) + 1))
+
+        tiles = []
+        for (i, (x, y)) in enumerate(unique_keys):
+            indices = order[starts[i]:starts[i + 1]]
+            file = "tile_" + str(x) + "_" + str(y) + ".pcd"
+
+            tile = cloud.select_by_index(indices)
+            o3d.io.write_point_cloud(os.path.join(directory, file), tile, compressed=False)
+
+            tiles.append({
+                "x": int(x),
+                "y": int(y),
+                "file": file,
+                "count": int(len(indices)),
+                "mins": points[indices].min(axis=0).tolist(),
+                "maxes": points[indices].max(axis=0).tolist()
+            })
+
+        manifest = dict(metadata)
+        manifest["version"] = TiledCloud.VERSION
+        manifest["tile_size"] = tile_size
+        manifest["tiles"] = tiles
+
+        with open(os.path.join(directory, "manifest.json"), "w") as f:
+            json.dump(manifest, f)
+
+    def get_metadata(self):
+        """Returns the point cloud metadata from the manifest (without the list of tiles)."""
+        return { key: value for (key, value) in self.manifest.items() if key != "tiles" }
+
+    def get_tile_keys(self, center, radius):
+        """Returns the keys of the existing tiles that overlap the square with the given center and radius."""
+
+        (x_from, y_from) = np.floor((np.asarray(center[0:2]) - radius) / self.tile_size).astype(np.int64)
+        (x_to, y_to) = np.floor((np.asarray(center[0:2]) + radius) / self.tile_size).astype(np.int64)
+
+        return [(x, y) for x in range(x_from, x_to + 1) for y in range(y_from, y_to + 1) if (x, y) in self.tiles]
+
+    def load_tile(self, key, prefetched=False):
+        """Reads the given tile from disk, indexes it (see GridIndex), and adds it to the cache."""
+
+        cloud = o3d.io.read_point_cloud(os.path.join(self.directory, self.tiles[key]["file"]))
+        index = GridIndex(cloud, self.cell_size)
+
+        with self.lock:
+            self.loaded[key] = index
+            self.memory_usage += self.get_memory_usage(index)
+            self.loading.pop(key, None)
+            if prefetched:
+                self.prefetched.add(key)
+            self.evict()
+
+        return index
+
+    @staticmethod
+    def get_memory_usage(index):
+        arrays = [index.cloud.points] + ([index.cloud.colors] if index.cloud.has_colors() else []) + ([index.cloud.normals] if index.cloud.has_normals() else [])
+        return sum(np.asarray(x).nbytes for x in arrays) + index.cell_starts.nbytes
+
+    def evict(self):
+        """Evicts the least recently used tiles (except the pinned ones) until the memory usage is below the limit.
+        Prefetched tiles that haven't been used yet are only evicted after all other tiles."""
+
+        with self.lock:
+            for keep_prefetched in [True, False]:
+                for key in list(self.loaded.keys()):
+                    if self.memory_usage <= self.memory_limit:
+                        return
+                    if key in self.pinned or (keep_prefetched and key in self.prefetched):
+                        continue
+                    self.memory_usage -= self.get_memory_usage(self.loaded.pop(key))
+                    self.prefetched.discard(key)
+
+    def get_tile(self, key):
+        """Returns the given tile (as a GridIndex), loading it (or waiting for a background load to finish) if necessary."""
+
+        with self.lock:
+            self.prefetched.discard(key)
+            if key in self.loaded:
+                self.loaded.move_to_end(key)
+                return self.loaded[key]
+            future = self.loading.get(key)
+
+        if future is not None:
+            index = future.result()
+
+            # The tile was added to the cache when the prefetch finished, so mark it as used now.
+            with self.lock:
+                self.prefetched.discard(key)
+                if key in self.loaded:
+                    self.loaded.move_to_end(key)
+
+            return index
+
+        return self.load_tile(key)
+
+    def prefetch(self, positions, radius):
+        """Starts loading the tiles around the given positions (for example the upcoming positions along the trajectory)
+        on a background thread, nearest positions first."""
+
+        with self.lock:
+            for position in positions:
+                for key in self.get_tile_keys(position, radius):
+                    if key not in self.loaded and key not in self.loading:
+                        self.loading[key] = self.executor.submit(self.load_tile, key, True)
+
+    def extract(self, center, radius, cylinder=False):
+        """Returns a new point cloud with the points within the given radius from the center (see GridIndex.get_indices),
+        loading the tiles overlapping the extracted area if necessary."""
+
+        keys = self.get_tile_keys(center, radius)
+
+        # Pin the tiles while they are extracted, so that loading one of them doesn't evict another.
+        with self.lock:
+            self.pinned = set(keys)
+
+        try:
+            part = o3d.geometry.PointCloud()
+            for key in keys:
+                part += self.get_tile(key).extract(center, radius, cylinder)
+        finally:
+            with self.lock:
+                self.pinned = set()
+
+        return part
+
+    def close(self):
+        # Cancel the prefetches that haven't started yet (shutdown only does this by itself from Python 3.9).
+        with self.lock:
+            for future in self.loading.values():
+                future.cancel()
+            self.loading = {}
+
+        self.executor.shutdown(wait=False)
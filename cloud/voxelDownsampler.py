@@ -0,0 +1,120 @@
+import numpy as np
+
+class VoxelDownsampler:
+    """
+    Downsamples a point cloud that is added chunk by chunk, by replacing the points in each voxel with their average
+    (like the voxel_down_sample of Open3D), so that the full resolution cloud never has to be in memory at once.
+
+    The voxel grid is aligned to the origin of the coordinate system (not to the bounds of the cloud), so the result
+    doesn't depend on how the points are split into chunks or files. Each chunk is reduced to one point sum and count
+    per voxel, and the reduced chunks are merged when they have grown as large as the already merged voxels, so the
+    memory usage is bounded by the downsampled cloud plus a chunk.
+    """
+
+    def __init__(self, voxel_size, mins, maxes):
+        self.voxel_size = voxel_size
+
+        # The voxel indices within the given bounds, used to pack the voxel index into a single integer key.
+        self.base = np.floor(np.asarray(mins, dtype=np.float64) / voxel_size).astype(np.int64)
+        self.dims = np.floor(np.asarray(maxes, dtype=np.float64) / voxel_size).astype(np.int64) - self.base + 1
+
+        if np.prod(self.dims.astype(np.float64)) >= 2**63:
+            raise ValueError("The point cloud is too large for voxel size " + str(voxel_size) + " (the voxel index doesn't fit in 64 bits).")
+
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.sums = np.zeros((0, 3), dtype=np.float64)
+        self.counts = np.zeros(0, dtype=np.int64)
+
+        self.runs = []
+        self.pending = 0
+        self.point_count = 0
+
+    def get_keys(self, xyz):
+        """Returns the (packed) voxel index of each of the given points."""
+
+        cells = np.floor(xyz / self.voxel_size).astype(np.int64) - self.base
+
+        # The bounds from the file headers may be rounded slightly, so keep points on the edges inside the grid.
+        np.clip(cells, 0, self.dims - 1, out=cells)
+
+        return (cells[:, 0] * self.dims[1] + cells[:, 1]) * self.dims[2] + cells[:, 2]
+
+    @staticmethod
+    def reduce(keys, sums, counts):
+        """Returns the given (key, sum, count) runs with all entries for the same key summed."""
+
+        (unique_keys, inverse) = np.unique(keys, return_inverse=True)
+        inverse = inverse.reshape(-1)
+
+        summed = np.column_stack([np.bincount(inverse, weights=sums[:, i], minlength=len(unique_keys)) for i in range(3)])
+        counted = np.bincount(inverse, weights=counts, minlength=len(unique_keys)).astype(np.int64)
+
+        return (unique_keys, summed, counted)
+
+    def add(self, xyz, points=None):
+        """Adds a chunk of points. The voxels are found from xyz, while the averaged points are taken from points (if given,
+        for example the same points in another coordinate system), or xyz."""
+
+        points = xyz if points is None else points
+        self.add_run(*VoxelDownsampler.reduce(self.get_keys(xyz), points, np.ones(len(points), dtype=np.int64)))
+
+    def add_run(self, keys, sums, counts):
+        """Adds an already reduced run of voxels (for example from another VoxelDownsampler, see get_run)."""
+
+        self.runs.append((keys, sums, counts))
+        self.pending += len(keys)
+        self.point_count += int(counts.sum())
+
+        if self.pending > max(len(self.keys), 1000000):
+            self.merge()
+
+    def merge(self):
+        if len(self.runs) < 1:
+            return
+
+        runs = [(self.keys, self.sums, self.counts)] + self.runs
+        (self.keys, self.sums, self.counts) = VoxelDownsampler.reduce(np.concatenate([x[0] for x in runs]), np.concatenate([x[1] for x in runs]), np.concatenate([x[2] for x in runs]))
+
+        self.runs = []
+        self.pending = 0
+
+    def get_run(self):
+        """Returns all voxels as a single reduced run of (keys, sums, counts)."""
+
+        self.merge()
+        return (self.keys, self.sums, self.counts)
+
+    def get_cells(self):
+        """Returns the voxel index (in the grid aligned to the origin) of each voxel."""
+
+        self.merge()
+
+        z = self.keys % self.dims[2]
+        y = (self.keys // self.dims[2]) % self.dims[1]
+        x = self.keys // (self.dims[2] * self.dims[1])
+
+        return np.column_stack([x, y, z]) + self.base
+
+    def divides(self, voxel_size):
+        """Returns True if the given voxel size is a multiple of this voxel size (so that coarsen gives an exact result)."""
+        ratio = voxel_size / self.voxel_size
+        return abs(ratio - round(ratio)) < 1e-6
+
+    def coarsen(self, voxel_size):
+        """Returns a new VoxelDownsampler with the given (larger) voxel size, derived from the voxels of this one instead of
+        the original points. Each voxel is moved into the larger voxel containing its center, so the result is exactly the
+        same as downsampling the original points when the voxel size is a multiple of this voxel size (and approximate otherwise)."""
+
+        self.merge()
+
+        coarse = VoxelDownsampler(voxel_size, self.base * self.voxel_size, (self.base + self.dims) * self.voxel_size)
+        centers = (self.get_cells() + 0.5) * self.voxel_size
+        coarse.add_run(*VoxelDownsampler.reduce(coarse.get_keys(centers), self.sums, self.counts))
+
+        return coarse
+
+    def get_points(self):
+        """Returns the downsampled points (the average of the points in each voxel)."""
+
+        self.merge()
+        return self.sums / self.counts[:, None]
@@ -0,0 +1,63 @@
+import open3d as o3d
+import numpy as np
+import argparse
+import time
+
+import sys
+sys.path.append('..')
+from pcap.pcapReaderHelper import PcapReaderHelper
+
+# Compares normal estimation using a KD-tree search (as done by the navigators by default) with
+# normal estimation from the neighbours in the range image (--organized-normals), on the same frames.
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    PcapReaderHelper.add_path_arguments(parser, browsing_only=True)
+    parser.add_argument('--frames', type=int, default=20, required=False, help="The number of frames to run the benchmark on.")
+    args = parser.parse_args()
+
+    reader = PcapReaderHelper.from_path_args(args)
+    if hasattr(reader, "readers"):
+        reader = reader.readers[0]
+
+    range_image = reader.get_range_image()
+
+    kdtree_time = 0
+    organized_time = 0
+    agreements = []
+    missing = []
+    points = 0
+
+    for frame_ix in range(args.frames):
+        scan = reader.read_scan(frame_ix)
+        if scan is None:
+            break
+
+        xyz, _, pixels = reader.decode_scan(scan, True, reader.max_distance, False, with_pixels=True)
+        points += len(xyz)
+
+        cloud = o3d.geometry.PointCloud(o3d.utility.Vector3dVector(xyz))
+        start_time = time.perf_counter()
+        cloud.estimate_normals(search_param=o3d.geometry.KDTreeSearchParamHybrid(radius=0.1, max_nn=30))
+        kdtree_time += time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        normals = range_image.estimate_normals(xyz, pixels)
+        organized_time += time.perf_counter() - start_time
+
+        # Normals are only defined up to their sign, so compare the absolute cosine of the angle between them.
+        has_normal = np.any(normals != 0, axis=1)
+        agreements.append(np.mean(np.abs(np.einsum("ij,ij->i", normals[has_normal], np.asarray(cloud.normals)[has_normal]))))
+        missing.append(1 - np.mean(has_normal))
+
+    frames = len(agreements)
+    if frames < 1:
+        print("Found no frames to run the benchmark on.")
+        exit(1)
+
+    print(f"Frames: {frames}, average points per frame: {points / frames:.0f}")
+    print(f"KD-tree normals:   {kdtree_time / frames:0.4f} seconds per frame")
+    print(f"Organized normals: {organized_time / frames:0.4f} seconds per frame ({kdtree_time / max(organized_time, 1e-9):.1f}x)")
+    print(f"Average absolute cosine between the normals: {np.mean(agreements):.3f}")
+    print(f"Points without an organized normal: {100 * np.mean(missing):.2f} %")
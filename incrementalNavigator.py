@@ -2,7 +2,6 @@ from navigatorBase import NavigatorBase
 import numpy as np
 import os
 from tqdm import tqdm
-import open3d as o3d
 import copy
 from datetime import datetime
 
@@ -33,7 +32,7 @@ class LidarNavigator(NavigatorBase):
 
         # Estimate normals for the first source frame in order to speed up the 
         # alignment operation.
-        self.previous_frame.estimate_normals(search_param=o3d.geometry.KDTreeSearchParamHybrid(radius=0.1, max_nn=30))
+        self.estimate_normals(self.previous_frame)
 
         self.time("navigation preparations")
 
@@ -90,7 +89,7 @@ class LidarNavigator(NavigatorBase):
 
         # Estimate normals for the target frame (the source frame will always have
         # normals from the previous step).
-        frame.estimate_normals(search_param=o3d.geometry.KDTreeSearchParamHybrid(radius=0.1, max_nn=30))
+        self.estimate_normals(frame)
 
         self.time("normal estimation")
         
@@ -0,0 +1,132 @@
+import numpy as np
+import open3d as o3d
+
+class FeatureRegistrationResult:
+
+    def __init__(self, transformation, fitness, inlier_rmse):
+        self.transformation = transformation
+        self.fitness = fitness
+        self.inlier_rmse = inlier_rmse
+
+class FeatureIcpMatcher:
+    """
+    Registers LOAM-style edge and planar feature points (see RangeImage.extract_features) against a target cloud, using
+    point-to-line distances for the edge points and point-to-plane distances for the planar points. The lines and planes
+    are fitted to the nearest target points of each feature in every iteration, and the transformation is found by
+    Gauss-Newton iterations.
+
+    When used through match (without features), all source points are treated as planar points.
+    """
+
+    def __init__(self, neighbours=5, min_linearity=3, min_planarity=3):
+        self.neighbours = neighbours
+        self.min_linearity = min_linearity
+        self.min_planarity = min_planarity
+
+    def match(self, source, target, threshold=1, trans_init=None, max_iterations=100):
+        return self.match_features(None, source, target, threshold, trans_init, max_iterations)
+
+    def match_features(self, edges, planes, target, threshold=1, trans_init=None, max_iterations=100):
+
+        if trans_init is None:
+            trans_init = np.identity(4)
+
+        edge_points = np.zeros((0, 3)) if edges is None else np.asarray(edges.points)
+        plane_points = np.zeros((0, 3)) if planes is None else np.asarray(planes.points)
+        target_points = np.asarray(target.points)
+
+        nns = o3d.core.nns.NearestNeighborSearch(o3d.core.Tensor(target_points))
+        nns.knn_index()
+
+        transformation = np.array(trans_init, dtype=np.float64)
+        fitness = 0
+        rmse = 0
+
+        for i in range(max_iterations):
+
+            normals, points, residual_points = self._correspondences(nns, target_points, edge_points, plane_points, transformation, threshold)
+
+            if len(points) < 6:
+                break
+
+            # Each correspondence gives a residual r = n . (p - q), where n is the plane normal (or one of two normals
+            # perpendicular to the line) and q a point on the plane/line. For a small rotation w and translation t,
+            # the residual changes by (p x n) . w + n . t.
+            residuals = np.einsum("ij,ij->i", normals, points - residual_points)
+            jacobian = np.hstack([np.cross(points, normals), normals])
+
+            # Huber weights, to reduce the influence of bad correspondences.
+            delta = threshold / 3
+            weights = np.where(np.abs(residuals) <= delta, 1, delta / np.maximum(np.abs(residuals), 1e-12))
+
+            JtW = jacobian.T * weights
+            try:
+                step = np.linalg.solve(JtW @ jacobian + np.identity(6) * 1e-9, -(JtW @ residuals))
+            except np.linalg.LinAlgError:
+                break
+
+            update = np.identity(4)
+            update[0:3, 0:3] = o3d.geometry.get_rotation_matrix_from_axis_angle(step[0:3])
+            update[0:3, 3] = step[3:6]
+            transformation = update @ transformation
+
+            fitness = len(points) / max(len(edge_points) * 2 + len(plane_points), 1)
+            rmse = np.sqrt(np.mean(residuals ** 2))
+
+            if np.linalg.norm(step) < 1e-6:
+                break
+
+        return FeatureRegistrationResult(transformation, fitness, rmse)
+
+    def _correspondences(self, nns, target_points, edge_points, plane_points, transformation, threshold):
+        """Finds the line or plane in the target for each transformed feature point. Returns (normals, transformed points,
+        points on the line/plane), with two rows for each edge point and one for each planar point."""
+
+        rotation = transformation[0:3, 0:3]
+        translation = transformation[0:3, 3]
+
+        normals = []
+        points = []
+        residual_points = []
+
+        for feature_points, is_edge in [(edge_points, True), (plane_points, False)]:
+            if len(feature_points) < 1:
+                continue
+
+            transformed = feature_points @ rotation.T + translation
+
+            indices, distances = nns.knn_search(o3d.core.Tensor(transformed), self.neighbours)
+            indices = indices.numpy().astype(np.int64)
+            distances = distances.numpy()
+
+            # Only use features where all the neighbours are within the threshold (distances are squared).
+            close = np.all(distances <= threshold * threshold, axis=1)
+            if not np.any(close):
+                continue
+
+            neighbours = target_points[indices[close]]
+            transformed = transformed[close]
+
+            centroids = neighbours.mean(axis=1)
+            centered = neighbours - centroids[:, None, :]
+            covariances = np.einsum("nki,nkj->nij", centered, centered) / self.neighbours
+            eigenvalues, eigenvectors = np.linalg.eigh(covariances)
+
+            if is_edge:
+                # The neighbours must form a line: the largest eigenvalue must be much larger than the middle one.
+                ok = eigenvalues[:, 2] > self.min_linearity * eigenvalues[:, 1]
+                for axis in [0, 1]:
+                    normals.append(eigenvectors[ok, :, axis])
+                    points.append(transformed[ok])
+                    residual_points.append(centroids[ok])
+            else:
+                # The neighbours must form a plane: the smallest eigenvalue must be much smaller than the middle one.
+                ok = eigenvalues[:, 1] > self.min_planarity * eigenvalues[:, 0]
+                normals.append(eigenvectors[ok, :, 0])
+                points.append(transformed[ok])
+                residual_points.append(centroids[ok])
+
+        if len(points) < 1:
+            return np.zeros((0, 3)), np.zeros((0, 3)), np.zeros((0, 3))
+
+        return np.vstack(normals), np.vstack(points), np.vstack(residual_points)
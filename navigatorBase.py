@@ -10,9 +10,12 @@ from datetime import datetime
 from utils.taskTimer import TaskTimer
 from algorithmHelper import AlgorithmHelper
 from pcap.pcapReaderHelper import PcapReaderHelper
+from pcap.prefetchPcapReader import PrefetchPcapReader
+from pcap.preflight import Preflight
 from utils.open3dVisualizer import Open3DVisualizer
 from utils.plotter import Plotter
-from sbet.sbetParser import SbetRow
+from sbet.sbetRow import SbetRow
+from sbet.trajectory import Trajectory
 import argparse
 
 class NavigatorBase:
@@ -25,6 +28,14 @@ class NavigatorBase:
         self.visualization_window_name = self.args.visualization_window_name if self.args.visualization_window_name is not None else os.path.basename(os.path.normpath(args.pcap[0]))
 
         self.reader = PcapReaderHelper.from_lists(args.pcap, args.json, args.skip_every_frame, args=args)
+
+        # Build the frame indexes, frame counts and coordinates of all PCAP files that aren't cached yet, in parallel.
+        for (path, error) in Preflight.run_readers(self.reader, args.preflight_workers):
+            tqdm.write(f"Preflight failed for {path}: {error}")
+        self.time("preflight")
+
+        if args.prefetch > 0:
+            self.reader = PrefetchPcapReader(self.reader, args.prefetch)
         self.voxel_size = args.voxel_size
         self.matcher = AlgorithmHelper.get_algorithm(args.algorithm)
         self.remove_vehicle = True
@@ -93,8 +104,13 @@ class NavigatorBase:
 
     def skip_to_frame(self, frame_index, desc):
         self.frame_limit -= frame_index
-        for _ in tqdm(range(0, frame_index), desc=desc, **self.tqdm_config):
-            self.reader.next_frame(False, self.timer)
+
+        # The readers can seek directly to the given frame, so the skipped frames are never decoded.
+        with tqdm(total=1, desc=desc, **self.tqdm_config) as pbar:
+            self.reader.skip(frame_index)
+            pbar.update(1)
+
+        self.time("frame skipping")
 
     def skip_until_circle(self):
         """ The "skip until" circle is used to skip frames until the actual position has entered a circle given by the 
@@ -114,12 +130,11 @@ class NavigatorBase:
         self.skip_to_frame(skip_until, "Skipping until entering circle")
 
     def find_first_frame_entering_circle(self, circle):
-        for (ix, position) in enumerate(self.sbet_coordinates):
-            distance = circle.distance2d(position)
-            if distance <= circle.radius:
-                return (ix, position)
+        ix = self.sbet_coordinates.first_entering_circle(circle.x, circle.y, circle.radius)
+        if ix < 0:
+            return (-1, None)
 
-        return (-1, None)
+        return (ix, self.sbet_coordinates[ix])
 
     def initialize_navigation(self, initial_movement=[], rotate_sbet=False):
         self.timer.reset()
@@ -129,9 +144,9 @@ class NavigatorBase:
         # source frame.
         self.movements = []
         self.registration_configs = []
-        self.actual_coordinates = []
-        self.estimated_coordinates = []
-        self.sbet_coordinates = []
+        self.actual_coordinates = Trajectory()
+        self.estimated_coordinates = Trajectory()
+        self.sbet_coordinates = Trajectory()
         self.actual_movement_path = None
 
         self.movement_path = o3d.geometry.LineSet(
@@ -149,7 +164,7 @@ class NavigatorBase:
         # If there is no point cloud offset here (incremental navigation), create an
         # offset based on the SBET coordinates instead
         if self.full_point_cloud_offset is None:
-            points = [[c.x, c.y, c.alt] for c in self.sbet_coordinates]
+            points = self.sbet_coordinates.xyz()
             mins = np.amin(points, axis=0)
             maxes = np.amax(points, axis=0)
             self.full_point_cloud_offset = mins + (maxes - mins) / 2
@@ -159,8 +174,7 @@ class NavigatorBase:
 
         # Translate all coordinates towards origo with the same offset as
         # the point cloud.
-        for c in self.sbet_coordinates:
-            c.translate(-self.full_point_cloud_offset)
+        self.sbet_coordinates.translate(-self.full_point_cloud_offset)
 
         if self.skip_until_circle_center is not None:
             
@@ -170,7 +184,7 @@ class NavigatorBase:
             # Then skip frames until the skip circle
             self.skip_until_circle()
         
-        self.actual_movement_path = self.create_line([[p.x, p.y, p.alt] for p in self.sbet_coordinates], color=[0, 0, 1])
+        self.actual_movement_path = self.create_line(self.sbet_coordinates.xyz(), color=[0, 0, 1])
 
         self.actual_position_cylinder = self.create_cylinder(size_ratio=1, color=[0,0,1])
         self.estimated_position_cylinder = self.create_cylinder(size_ratio=1, color=[1,0,0])
@@ -289,6 +303,16 @@ class NavigatorBase:
 
         return pos
 
+    def estimate_normals(self, frame):
+        """ Estimates normals for the given frame using a KD-tree search, unless the frame already has normals
+        (which it has if the reader estimated them from the range image, see --organized-normals).
+        """
+
+        if frame.has_normals():
+            return
+
+        frame.estimate_normals(search_param=o3d.geometry.KDTreeSearchParamHybrid(radius=0.1, max_nn=30))
+
     def rotate_frame(self, frame, coordinate=None):
 
         if coordinate is None:
@@ -319,7 +343,26 @@ class NavigatorBase:
         return angle
 
 
-    def run_registration(self, source, target, previous_estimated_coordinate, actual_coordinate):
+    def match(self, source, target, transformation_matrix, threshold, iterations):
+        """ Runs the matcher on the given source and target. If the reader extracts feature points (see --range-image-features)
+        and the matcher can use them, only the feature points of the source are registered.
+        """
+
+        features = self.reader.get_frame_features() if self.args.range_image_features else None
+
+        if features is not None and hasattr(self.matcher, "match_features"):
+            edges = source.select_by_index(features[0])
+            planes = source.select_by_index(features[1])
+            return self.matcher.match_features(edges, planes, target, trans_init=transformation_matrix, threshold=threshold, max_iterations=iterations)
+
+        return self.matcher.match(source, target, trans_init=transformation_matrix, threshold=threshold, max_iterations=iterations)
+
+    def run_registration(self, source, target, previous_estimated_coordinate, actual_coordinate, coarse_targets=None):
+        """ Registers the source (frame) against the target, and updates the current estimate. If coarse targets are given
+        (a list of (voxel size, target) from coarsest to finest, see CloudPyramid), the early iterations are run against
+        them, with the source downsampled to the same voxel size, moving to the next level when the transformation has
+        converged on the current one.
+        """
 
         if self.args.show_debug_visualization:
             source = self.modify_cloud(source, color=[1,0,0])
@@ -342,9 +385,33 @@ class NavigatorBase:
         iterations = 25
         diffs = []
         transformation_matrix = np.identity(4) if self.previous_matrix is None else self.previous_matrix
-        for i in range(10):
-            threshold = max(1, 3 - len(diffs))
-            reg = self.matcher.match(source, target, trans_init=transformation_matrix, threshold=threshold, max_iterations=iterations)
+
+        coarse_diffs = []
+        coarse_levels = []
+        for (voxel_size, coarse_target) in (coarse_targets or []):
+            coarse_source = source.voxel_down_sample(voxel_size=voxel_size)
+            for i in range(5):
+                threshold = max(1, 2 * voxel_size, 3 - i)
+                reg = self.matcher.match(coarse_source, coarse_target, trans_init=transformation_matrix, threshold=threshold, max_iterations=iterations)
+
+                diff = np.abs(np.mean(reg.transformation[0:3, 3]-transformation_matrix[0:3, 3]))
+                coarse_diffs.append(diff)
+                transformation_matrix = reg.transformation
+                if diff < voxel_size / 10:
+                    break
+
+            coarse_levels.append({ "voxel_size": voxel_size, "threshold": threshold, "rounds": i + 1 })
+
+        # Without coarse levels, the threshold is lowered from 3 to 1 over up to 10 rounds. After the coarse levels, the
+        # most detailed level only refines the transformation, starting from the threshold of the last coarse level.
+        if len(coarse_levels) > 0:
+            (first_threshold, max_rounds) = (min(3, coarse_levels[-1]["threshold"]), 2)
+        else:
+            (first_threshold, max_rounds) = (3, 10)
+
+        for i in range(max_rounds):
+            threshold = max(1, first_threshold - len(diffs))
+            reg = self.match(source, target, transformation_matrix, threshold, iterations)
 
             # If the calculated transformation matrix is (almost) identical to the one we sent in, we are happy.
             diff = np.abs(np.mean(reg.transformation[0:3, 3]-transformation_matrix[0:3, 3]))
@@ -358,6 +425,9 @@ class NavigatorBase:
         metadata = {
             "iterations": len(diffs) * iterations,
             "diffs": diffs,
+            "coarse_iterations": len(coarse_diffs) * iterations,
+            "coarse_diffs": coarse_diffs,
+            "coarse_levels": coarse_levels,
             "frame_ix": actual_coordinate.frame_ix,
             "pcap": self.reader.get_pcap_path(),
             "threshold": threshold,
@@ -555,9 +625,9 @@ class NavigatorBase:
 
         self.plot = Plotter(self.preview_always)
 
-        # Add the first coordinates to the lists
-        self.estimated_coordinates.append(self.current_estimated_coordinate.clone())
-        self.actual_coordinates.append(self.initial_coordinate.clone())
+        # Add the first coordinates to the lists (appending stores a copy of the coordinate)
+        self.estimated_coordinates.append(self.current_estimated_coordinate)
+        self.actual_coordinates.append(self.initial_coordinate)
 
     def finish_plot_and_visualization(self):
         
@@ -617,8 +687,8 @@ class NavigatorBase:
         if self.current_estimated_coordinate is not None:
 
             # Add the current coordinate to the list of estimations
-            self.estimated_coordinates.append(self.current_estimated_coordinate.clone())
-            self.actual_coordinates.append(actual_coordinate.clone())
+            self.estimated_coordinates.append(self.current_estimated_coordinate)
+            self.actual_coordinates.append(actual_coordinate)
 
             # Calculate differences between the estimate and the actual coordinate
             dx = abs(self.current_estimated_coordinate.x - actual_coordinate.x)
@@ -791,7 +861,7 @@ class NavigatorBase:
                 arg_key = key.replace("--", "").replace("-", "_")
 
                 # Ignore absoluteNavigator arguments to allow common .json file
-                if arg_key in ["point_cloud", "hide_point_cloud", "cloud_part_radius"]:
+                if arg_key in ["point_cloud", "hide_point_cloud", "cloud_part_radius", "cloud_part_shape", "cloud_index_cell_size", "cloud_memory_limit", "cloud_prefetch_frames"]:
                     continue
 
                 if not arg_key in arg_keys:
@@ -810,12 +880,18 @@ class NavigatorBase:
         parser.add_argument('--skip-last-frame-in-pcap-file', type=bool, default=True, required=False, help="The last frame in each PCAP file is often corrupted. This flag makes the pcap reader skip the last frame in each file.")
         parser.add_argument('--build-cloud-after', type=int, default=1, required=False, help="How often registered frames should be added to the generated point cloud. 0 or lower deactivates the generated point cloud. 1 or higher generates a point cloud with details (and time usage) decreasing with higher numbers.")
         parser.add_argument('--voxel-size', type=float, default=0.1, required=False, help="The voxel size used for cloud downsampling. If less than or equal to zero, downsampling will be disabled.")
+        parser.add_argument('--organized-normals', action='store_true', help="If given, frame normals are estimated from the neighbouring pixels in the range image of each frame, instead of by a KD-tree search over the frame points.")
+        parser.add_argument('--structured-downsampling', type=int, default=0, required=False, help="If given a positive number larger than 0, every frame is reduced to at most this many points by decimating the beams and columns of the range image with a stride that increases closer to the sensor, which gives a roughly uniform point density (the near range is otherwise much denser than the far range). This affects both the registration and the generated point cloud.")
+        parser.add_argument('--range-image-features', action='store_true', help="If given, LOAM-style edge and planar feature points are extracted from the range image of each frame, and matchers that support it (currently 'Feature ICP') register only these few thousand points instead of the full frame.")
         parser.add_argument('--downsample-after', type=int, default=10, required=False, help="The cloud will be downsampled (which is an expensive operation for large clouds, so don't do it too often) after this many registered frames have been added. If this number is higher than the number of frames being read, it will be downsampled once at the end of the process (unless downsampling is disabled, see --voxel-size).")
         parser.add_argument('--wait-after-first-frame', type=int, default=0, required=False, help="If given, the analysis will wait for this many seconds after the first frame to allow the visualization to be manually adjusted (zooming, panning, etc).")
         parser.add_argument('--preview', type=str, default="always", choices=['always', 'end', 'never'], help="Show constantly updated point cloud and data plot previews while processing ('always'), show them only at the end ('end'), or don't show them at all ('never').")
         parser.add_argument('--show-debug-visualization', dest='show_debug_visualization', default=False, action='store_true', help="If set to true, the analysis will pause multiple times during each frame to show the different steps in the visualizer (zoom out and find the origin, that's where stuff happens).")
         parser.add_argument('--visualization-window-name', type=str, default=None, required=False, help="If set, the visualization window will have this title. If not set, the title will be based on the pcap file/folder path.")
 
+        parser.add_argument('--preflight-workers', type=int, default=4, required=False, help="The number of worker processes used to index, count and extract the coordinates of all PCAP files that are not already cached, before the analysis starts. 1 or lower runs them in the main process.")
+        parser.add_argument('--prefetch', type=int, default=0, required=False, help="If given a positive number larger than 0, up to this many frames will be read and prepared in a background thread while the current frame is being registered.")
+
         parser.add_argument('--skip-start', type=int, default=0, required=False, help="If given a positive number larger than 0, this many frames will be skipped before starting processing frames.")
         parser.add_argument('--skip-every-frame', type=int, default=0, required=False, help="If given a positive number larger than 0, this many frames will be skipped between every frame read from the PCAP file.")
         
@@ -1,8 +1,10 @@
 from ouster import client, pcap
 import open3d as o3d
+import numpy as np
 import argparse
+from collections import OrderedDict
 
-from pcap.colormaps import colorize, normalize
+from pcap.colormaps import normalize, colormap_indices, colorize_indices
 from pcap.pcapReader import PcapReader
 
 class BufferedPcapReader(PcapReader):
@@ -14,24 +16,59 @@ class BufferedPcapReader(PcapReader):
 
         PcapReader.__init__(self, pcap_path, metadata_path, 0, args)
 
-        self.prepared_clouds = []
+        # Raw (unfiltered) frames, with the least recently used first. Frames are thrown out when the
+        # total size exceeds the limit.
+        self.raw_frames = OrderedDict()
+        self.raw_frames_size = 0
+        self.max_raw_frames_size = (getattr(args, "frame_buffer_size", None) or 1024) * 1024 * 1024
+
+    def read_raw_frame(self, num:int):
+        """Returns (xyz, colormap indices) for all the pixels of the frame with the given index, without any filtering."""
+
+        if num in self.raw_frames:
+            self.raw_frames.move_to_end(num)
+            return self.raw_frames[num]
+
+        scan = self.read_scan(num)
+        if scan is None:
+            return None
+
+        xyz = self.xyzLut(scan).reshape((-1, 3)).astype(np.float32)
+        key = colormap_indices(normalize(scan.field(self.channels[4]))).reshape(-1) # Channel REFLECTIVITY
+
+        self.raw_frames[num] = (xyz, key)
+        self.raw_frames_size += xyz.nbytes + key.nbytes
+
+        # Throw out the least recently used frames until the buffer is small enough (but always keep the newest one).
+        while self.raw_frames_size > self.max_raw_frames_size and len(self.raw_frames) > 1:
+            _, (old_xyz, old_key) = self.raw_frames.popitem(last=False)
+            self.raw_frames_size -= old_xyz.nbytes + old_key.nbytes
+
+        return self.raw_frames[num]
 
     def read_frame(self, num:int, remove_vehicle:bool = False):
-        """Retrieves the current frame from an array of read frames. The array is lazily
-        filled with data from the pcap file as new frames are requested. Old frames are
-        never thrown out, so this will case memory issues if the pcap file gets large enough."""
+        """Retrieves the given frame. Raw frames are read from the pcap file when they are first requested, and
+        kept in a buffer with a limited size (see --frame-buffer-size). The filters (vehicle removal and max
+        distance) are applied every time a frame is retrieved, so changing them doesn't require reading the
+        frames again. If the pcap file has a frame index, any frame can be read directly, otherwise frames are
+        read sequentially (from the start of the file when going backwards)."""
 
-        # If given a negative index, return None.
-        if num < 0:
+        # If given a negative index, or the last frame (which is always skipped), return None.
+        if num < 0 or num >= self.count_frames() - 1:
             return None
 
-        # Lazily read frames until the given index is available.
-        while len(self.prepared_clouds) < num + 1:
-            self.prepared_clouds.append(self.next_frame(remove_vehicle))
+        raw = self.read_raw_frame(num)
+        if raw is None:
+            return None
+
+        xyz, key = self.get_filter_pipeline(remove_vehicle, self.max_distance).apply(raw[0].astype(np.float64), raw[1])
+
+        cloud = o3d.geometry.PointCloud(o3d.utility.Vector3dVector(xyz))
+        cloud.colors = o3d.utility.Vector3dVector(colorize_indices(key))
 
-        # Retrieve the requested frame, which will now be read.
-        return self.prepared_clouds[num]
+        return cloud
 
     def invalidate_cache(self):
-        self.prepared_clouds = []
-        self.reset()
\ No newline at end of file
+        self.raw_frames = OrderedDict()
+        self.raw_frames_size = 0
+        self.reset()
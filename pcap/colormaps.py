@@ -17,6 +17,33 @@ def colorize(image: np.ndarray):
                       [image.shape[0], image.shape[1], 3])
 
 
+def colormap_indices(image: np.ndarray):
+    """Convert values in the range [0, 1] to indices into the colormap.
+
+    These are the same indices that :func:`colorize` looks up, so storing them
+    is enough to reproduce the colors later using :func:`colorize_indices`.
+
+    Args:
+        image: array of values in the range [0, 1]
+
+    Returns:
+        Array of uint8 colormap indices with the same shape as ``image``
+    """
+    return (255 * image).astype(np.uint8)
+
+
+def colorize_indices(indices: np.ndarray):
+    """Use Ouster spezia colormap to get from colormap indices to color space.
+
+    Args:
+        indices: 1D array of colormap indices
+
+    Returns:
+        Array of RGB values with shape (len(indices), 3)
+    """
+    return np.take(spezia, indices, axis=0)
+
+
 def normalize(data: np.ndarray, percentile: float = 0.05):
     """Normalize and clamp data for better color mapping.
 
@@ -0,0 +1,156 @@
+import numpy as np
+import hashlib
+import json
+import os
+
+class FrameCache:
+    """
+    An on-disk cache of decoded and filtered frames from a single PCAP file. Each frame is stored as
+    millimetre-quantized integer coordinates followed by the (normalized) reflectivity as colormap
+    indices, and an offset table makes it possible to read any frame without reading the others.
+    If the parameters contain "pixels": True, the range image pixel of each point is stored as well
+    (see RangeImage).
+
+    Frames are identified by their index in the PCAP file (including skipped frames), so the same
+    cache can be used regardless of --skip-every-frame. Frames that have not yet been decoded are
+    simply missing from the offset table, and are added as they are read. The offset table is saved
+    every SAVE_INTERVAL frames and when the cache is closed.
+
+    The size and modification time of the PCAP file are stored in the manifest, so a replaced or
+    re-captured file with the same name doesn't use the frames of the old one.
+    """
+
+    # Coordinates are stored as integer millimetres.
+    SCALE = 1000
+
+    # Increased when the decoding or the file format changes, to invalidate existing caches.
+    VERSION = 1
+
+    # The number of written frames after which the offset table is saved.
+    SAVE_INTERVAL = 100
+
+    def __init__(self, pcap_path, parameters, frame_count, recreate=False):
+
+        self.parameters = parameters
+        self.frame_count = frame_count
+
+        key = hashlib.sha1(json.dumps(parameters, sort_keys=True).encode("utf-8")).hexdigest()[:10]
+        path_base = pcap_path.replace(".pcap", ".pcap.frames-" + key)
+
+        self.data_path = path_base + ".bin"
+        self.index_path = path_base + ".index.npy"
+        self.manifest_path = path_base + ".json"
+
+        stat = os.stat(pcap_path)
+        self.source = { "size": stat.st_size, "mtime": int(stat.st_mtime) }
+
+        # Coordinates fit in int16 if all points are within 32.767 meters from the sensor.
+        max_distance = parameters.get("max_distance", None)
+        self.coordinate_dtype = np.dtype(np.int16 if max_distance is not None and max_distance < 32.767 else np.int32)
+        self.with_pixels = parameters.get("pixels", False)
+
+        self.data_file = None
+        self.unsaved_frames = 0
+
+        self.index = None
+        if not recreate and os.path.isfile(self.manifest_path) and os.path.isfile(self.index_path) and os.path.isfile(self.data_path):
+            try:
+                with open(self.manifest_path) as f:
+                    manifest = json.load(f)
+                index = np.load(self.index_path)
+                if manifest.get("version", None) == FrameCache.VERSION and manifest["parameters"] == parameters and manifest.get("source", None) == self.source and len(index) == frame_count:
+                    self.coordinate_dtype = np.dtype(manifest["coordinate_dtype"])
+                    self.index = index
+            except:
+                self.index = None
+
+        if self.index is None:
+            self.index = np.full(frame_count, -1, dtype=[("offset", np.int64), ("points", np.int32)])
+            self.save_manifest()
+            self.save_index()
+
+            # Truncate any old data file, as it can no longer be trusted.
+            open(self.data_path, "wb").close()
+
+    def save_manifest(self):
+        with open(self.manifest_path, "w") as f:
+            json.dump({
+                "version": FrameCache.VERSION,
+                "parameters": self.parameters,
+                "source": self.source,
+                "coordinate_dtype": self.coordinate_dtype.name,
+                "frame_count": self.frame_count
+            }, f, indent=4)
+
+    def save_index(self):
+        """Saves the offset table. The data file is synced first, so the table never points at data that isn't on disk,
+        and the table is written to a temporary file that replaces the old one, so an interrupted run leaves either the
+        old or the new table."""
+
+        if self.data_file is not None:
+            self.data_file.flush()
+            os.fsync(self.data_file.fileno())
+
+        temporary_path = self.index_path + ".tmp"
+        with open(temporary_path, "wb") as f:
+            np.save(f, self.index)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary_path, self.index_path)
+
+        self.unsaved_frames = 0
+
+    def contains(self, frame_ix):
+        return 0 <= frame_ix < self.frame_count and self.index[frame_ix]["offset"] >= 0
+
+    def cached_frame_count(self):
+        return int(np.count_nonzero(self.index["offset"] >= 0))
+
+    def read(self, frame_ix):
+        """Returns (xyz, colormap indices, pixels) for the frame with the given index. The pixels are None
+        unless they are stored in this cache."""
+
+        offset = int(self.index[frame_ix]["offset"])
+        points = int(self.index[frame_ix]["points"])
+
+        with open(self.data_path, "rb") as f:
+            f.seek(offset)
+            xyz = np.fromfile(f, dtype=self.coordinate_dtype, count=points * 3).reshape((-1, 3))
+            key = np.fromfile(f, dtype=np.uint8, count=points)
+            pixels = np.fromfile(f, dtype=np.uint32, count=points).astype(np.int64) if self.with_pixels else None
+
+        return xyz.astype(np.float64) / FrameCache.SCALE, key, pixels
+
+    def write(self, frame_ix, xyz, key, pixels=None):
+        """Appends the frame with the given index to the data file, and updates the offset table (which
+        is saved every SAVE_INTERVAL frames, see save_index)."""
+
+        if self.contains(frame_ix) or frame_ix < 0 or frame_ix >= self.frame_count:
+            return
+
+        if self.data_file is None:
+            self.data_file = open(self.data_path, "ab")
+
+        quantized = np.round(xyz * FrameCache.SCALE).astype(self.coordinate_dtype)
+
+        offset = self.data_file.seek(0, os.SEEK_END)
+        self.data_file.write(quantized.tobytes())
+        self.data_file.write(key.astype(np.uint8).tobytes())
+        if self.with_pixels:
+            self.data_file.write(pixels.astype(np.uint32).tobytes())
+
+        self.index[frame_ix] = (offset, len(xyz))
+
+        self.unsaved_frames += 1
+        if self.unsaved_frames >= FrameCache.SAVE_INTERVAL:
+            self.save_index()
+
+    def close(self):
+        """Saves the offset table (if frames have been written since it was last saved) and closes the data file."""
+
+        if self.unsaved_frames > 0:
+            self.save_index()
+
+        if self.data_file is not None:
+            self.data_file.close()
+            self.data_file = None
@@ -0,0 +1,134 @@
+import numpy as np
+
+class VehicleFilter:
+    """Removes the vehicle, which is always stationary at the center. We don't want that
+    to interfere with the point cloud alignment. Note that this also removes invalid points
+    (which are placed in the origin)."""
+
+    name = "vehicle"
+
+    def __init__(self, width=0.7, length=2.2, front=0.2, top=0.3, bottom=-2):
+        self.width = width
+        self.length = length
+        self.front = front
+        self.top = top
+        self.bottom = bottom
+
+    def get_parameters(self):
+        return [self.name, self.width, self.length, self.front, self.top, self.bottom]
+
+    def mask(self, xyz):
+        x = xyz[:, 0]
+        y = xyz[:, 1]
+        z = xyz[:, 2]
+
+        inside = (x <= self.front) & (x >= -self.length)
+        inside &= (y <= self.width) & (y >= -self.width)
+        inside &= (z <= self.top) & (z >= self.bottom)
+
+        return ~inside
+
+class InvalidFilter:
+    """Removes invalid points (points without a return are placed in the origin)."""
+
+    name = "invalid"
+
+    def get_parameters(self):
+        return [self.name]
+
+    def mask(self, xyz):
+        return (xyz[:, 0] != 0) & (xyz[:, 1] != 0) & (xyz[:, 2] != 0)
+
+class RadiusFilter:
+    """Removes all points that are further away from the origin than the given radius. Compares
+    squared distances, so no square roots are calculated."""
+
+    name = "radius"
+
+    def __init__(self, radius):
+        self.radius = radius
+
+    def get_parameters(self):
+        return [self.name, self.radius]
+
+    def mask(self, xyz):
+        return np.einsum("ij,ij->i", xyz, xyz) <= self.radius * self.radius
+
+class HeightBandFilter:
+    """Removes all points below min_height or above max_height (relative to the sensor). Either
+    limit can be None."""
+
+    name = "height band"
+
+    def __init__(self, min_height=None, max_height=None):
+        self.min_height = min_height
+        self.max_height = max_height
+
+    def get_parameters(self):
+        return [self.name, self.min_height, self.max_height]
+
+    def mask(self, xyz):
+        z = xyz[:, 2]
+
+        if self.min_height is None:
+            return z <= self.max_height
+        if self.max_height is None:
+            return z >= self.min_height
+
+        return (z >= self.min_height) & (z <= self.max_height)
+
+class MaskFilter:
+    """A custom filter given by a function that takes an (n, 3) array of points and returns a
+    boolean array that is True for the points that should be kept. The name is used for timing,
+    and (since functions can't be compared) to tell frame caches for different filters apart."""
+
+    def __init__(self, name, mask_function):
+        self.name = name
+        self.mask_function = mask_function
+
+    def get_parameters(self):
+        return ["mask", self.name]
+
+    def mask(self, xyz):
+        return self.mask_function(xyz)
+
+class FrameFilterPipeline:
+    """
+    A composable set of frame filters. The filters are combined into one boolean mask per frame,
+    which is then applied once to the points and every other channel (colors etc), instead of
+    indexing all the arrays once for every filter.
+    """
+
+    def __init__(self, stages=None):
+        self.stages = [] if stages is None else stages
+
+    def add(self, stage):
+        self.stages.append(stage)
+        return self
+
+    def get_parameters(self):
+        return [stage.get_parameters() for stage in self.stages]
+
+    def mask(self, xyz, timer=None):
+        """Returns the combined mask for the given (n, 3) array of points. If a timer is given, the time
+        used by each stage is added to it."""
+
+        mask = np.ones(len(xyz), dtype=bool)
+
+        for stage in self.stages:
+            np.logical_and(mask, stage.mask(xyz), out=mask)
+            if timer is not None: timer.time("frame filter: " + stage.name)
+
+        return mask
+
+    def apply(self, xyz, *channels, timer=None):
+        """Filters the given (n, 3) array of points, and any number of other arrays with one row per point,
+        using the combined mask. Returns a list with the filtered points followed by the filtered channels."""
+
+        mask = self.mask(xyz, timer)
+
+        filtered = [xyz[mask]] + [None if channel is None else channel[mask] for channel in channels]
+
+        if timer is not None: timer.time("frame filter application")
+
+        return filtered
@@ -0,0 +1,259 @@
+from ouster import client
+import numpy as np
+import struct
+
+class PcapRecordReader:
+    """
+    A minimal reader for classic (libpcap) capture files. It only parses the record headers and the
+    Ethernet/IPv4/UDP headers, and yields the UDP payloads together with the byte offset of the record
+    they start in, which makes it possible to seek directly to a given packet later on. Fragmented IPv4
+    datagrams are reassembled.
+    """
+
+    LINK_TYPE_ETHERNET = 1
+    LINK_TYPE_RAW = 101
+    LINK_TYPE_LINUX_SLL = 113
+
+    def __init__(self, path):
+        self.path = path
+
+        with open(path, "rb") as f:
+            header = f.read(24)
+
+        if len(header) < 24:
+            raise ValueError("Not a valid pcap file: " + path)
+
+        magic = header[:4]
+        if magic in (b"\xd4\xc3\xb2\xa1", b"\x4d\x3c\xb2\xa1"):
+            self.endian = "<"
+        elif magic in (b"\xa1\xb2\xc3\xd4", b"\xa1\xb2\x3c\x4d"):
+            self.endian = ">"
+        else:
+            raise ValueError("Unsupported capture file format (only classic pcap files can be indexed): " + path)
+
+        self.link_type = struct.unpack(self.endian + "I", header[20:24])[0] & 0xFFFF
+        if self.link_type not in (PcapRecordReader.LINK_TYPE_ETHERNET, PcapRecordReader.LINK_TYPE_RAW, PcapRecordReader.LINK_TYPE_LINUX_SLL):
+            raise ValueError("Unsupported link type (" + str(self.link_type) + ") in pcap file: " + path)
+
+        self.record_header = struct.Struct(self.endian + "IIII")
+
+    def _ip_packet(self, data):
+        """Returns the IPv4 part of the given link layer frame, or None if it is not IPv4."""
+
+        if self.link_type == PcapRecordReader.LINK_TYPE_RAW:
+            return data
+
+        if self.link_type == PcapRecordReader.LINK_TYPE_LINUX_SLL:
+            ether_type_at = 14
+        else:
+            ether_type_at = 12
+
+        if len(data) < ether_type_at + 2:
+            return None
+
+        ether_type = struct.unpack_from(">H", data, ether_type_at)[0]
+
+        # Skip a VLAN tag, if present
+        if ether_type == 0x8100:
+            ether_type_at += 4
+            ether_type = struct.unpack_from(">H", data, ether_type_at)[0]
+
+        if ether_type != 0x0800:
+            return None
+
+        return data[ether_type_at + 2:]
+
+    def datagrams(self, offset=24):
+        """Yields (record offset, destination port, payload) for each UDP datagram in the file, starting
+        at the given byte offset, which must be the start of a record. The record offset of a reassembled
+        datagram is the offset of the first record holding one of its fragments."""
+
+        fragments = {}
+        position = offset
+
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+
+            while True:
+                record_offset = position
+
+                header = f.read(16)
+                if len(header) < 16:
+                    return
+
+                _, _, captured_length, _ = self.record_header.unpack(header)
+                data = f.read(captured_length)
+                if len(data) < captured_length:
+                    return
+
+                position += 16 + captured_length
+
+                ip = self._ip_packet(data)
+                if ip is None or len(ip) < 20 or ip[0] >> 4 != 4 or ip[9] != 17:
+                    continue
+
+                header_length = (ip[0] & 0x0F) * 4
+                total_length = struct.unpack_from(">H", ip, 2)[0]
+                identification, flags_and_offset = struct.unpack_from(">HH", ip, 4)
+
+                # Some captures (with segmentation offloading) have a total length of zero.
+                body = ip[header_length:total_length] if total_length > 0 else ip[header_length:]
+
+                more_fragments = flags_and_offset & 0x2000
+                fragment_offset = (flags_and_offset & 0x1FFF) * 8
+
+                if not more_fragments and fragment_offset == 0:
+                    udp = body
+                    first_offset = record_offset
+                else:
+                    key = (ip[12:20], identification)
+                    if key not in fragments:
+                        fragments[key] = [record_offset, {}, None]
+                    fragment = fragments[key]
+
+                    fragment[1][fragment_offset] = body
+                    if not more_fragments:
+                        fragment[2] = fragment_offset + len(body)
+
+                    if fragment[2] is None or sum(len(x) for x in fragment[1].values()) < fragment[2]:
+                        continue
+
+                    del fragments[key]
+                    udp = b"".join(fragment[1][x] for x in sorted(fragment[1]))
+                    first_offset = fragment[0]
+
+                if len(udp) < 8:
+                    continue
+
+                destination_port, udp_length = struct.unpack_from(">HH", udp, 2)
+
+                yield first_offset, destination_port, udp[8:udp_length] if udp_length >= 8 else udp[8:]
+
+class FrameIndex:
+    """
+    A byte-offset index over the frames in a PCAP file, with the file offset, frame_id, packet count
+    and timestamps of every frame. It is built by a single pass over the packet headers (without
+    decoding any scans), and makes it possible to read the packets of any frame directly.
+
+    Packets are parsed using the legacy Ouster lidar packet layout, where each column starts with a
+    16 byte header (timestamp, measurement_id, frame_id, encoder count).
+    """
+
+    # Increased when the index format or the way it is built changes, to invalidate cached indexes.
+    VERSION = 1
+
+    dtype = [
+        ("offset", np.int64),
+        ("frame_id", np.int32),
+        ("packets", np.int32),
+        ("first_timestamp", np.uint64),     # First column in the first packet of the frame
+        ("last_timestamp", np.uint64),      # Last column in the last packet of the frame
+        ("packet_timestamp", np.uint64)     # Last column in the first packet of the frame (see PcapReader.get_sbet_timestamp)
+    ]
+
+    def __init__(self, pcap_path, metadata, rows):
+        self.pcap_path = pcap_path
+        self.metadata = metadata
+        self.rows = rows
+        self.reader = PcapRecordReader(pcap_path)
+        (self.packet_size, self.column_size, self.columns_per_packet) = FrameIndex.get_packet_layout(metadata)
+
+    def __len__(self):
+        return len(self.rows)
+
+    @staticmethod
+    def get_packet_layout(metadata):
+        """Returns (packet size, column size, columns per packet) for lidar packets from the given sensor."""
+
+        columns_per_packet = metadata.format.columns_per_packet
+        column_size = 16 + metadata.format.pixels_per_column * 12 + 4
+
+        return columns_per_packet * column_size, column_size, columns_per_packet
+
+    @staticmethod
+    def build(pcap_path, metadata):
+
+        index = FrameIndex(pcap_path, metadata, np.zeros(0, dtype=FrameIndex.dtype))
+        last_column_at = (index.columns_per_packet - 1) * index.column_size
+
+        rows = []
+        last_frame_id = -1
+        for offset, _, payload in index.reader.datagrams():
+
+            if len(payload) != index.packet_size:
+                continue
+
+            first_timestamp, frame_id = struct.unpack_from("<Q2xH", payload, 0)
+            last_timestamp = struct.unpack_from("<Q", payload, last_column_at)[0]
+
+            if frame_id != last_frame_id:
+                rows.append([offset, frame_id, 1, first_timestamp, last_timestamp, last_timestamp])
+                last_frame_id = frame_id
+            else:
+                rows[-1][2] += 1
+                rows[-1][4] = last_timestamp
+
+        # No matching packets usually means another UDP profile (or a foreign capture), which the index can't handle.
+        if len(rows) < 1:
+            raise ValueError("Found no lidar packets of the expected size (" + str(index.packet_size) + " bytes) in " + pcap_path)
+
+        index.rows = np.array([tuple(x) for x in rows], dtype=FrameIndex.dtype)
+
+        return index
+
+    @staticmethod
+    def load(path, pcap_path, metadata):
+        return FrameIndex(pcap_path, metadata, np.load(path))
+
+    def save(self, path):
+        np.save(path, self.rows)
+
+    def get_time_bounds(self):
+        """Returns the (min, max) timestamps in the file, ignoring invalid (zero) timestamps."""
+
+        first = self.rows["first_timestamp"]
+        last = self.rows["last_timestamp"]
+        first = first[first > 0]
+        last = last[last > 0]
+
+        return int(np.min(first)), int(np.max(last))
+
+    def packets(self, frame_ix):
+        """Yields the lidar packets of the frame with the given index, reading only that part of the file."""
+
+        row = self.rows[frame_ix]
+        remaining = int(row["packets"])
+
+        for _, _, payload in self.reader.datagrams(int(row["offset"])):
+
+            if len(payload) != self.packet_size:
+                continue
+
+            if struct.unpack_from("<H", payload, 10)[0] != row["frame_id"]:
+                return
+
+            yield client.LidarPacket(payload, self.metadata)
+
+            remaining -= 1
+            if remaining <= 0:
+                return
+
+    def packet_source(self, frame_ix):
+        return IndexedPacketSource(self, frame_ix)
+
+class IndexedPacketSource:
+    """A packet source for client.Scans that contains only the packets of a single frame."""
+
+    def __init__(self, frame_index, frame_ix):
+        self.frame_index = frame_index
+        self.frame_ix = frame_ix
+
+    @property
+    def metadata(self):
+        return self.frame_index.metadata
+
+    def __iter__(self):
+        return self.frame_index.packets(self.frame_ix)
+
+    def close(self):
+        pass
@@ -0,0 +1,157 @@
+import numpy as np
+import json
+import os
+from datetime import datetime
+
+from sbet.trajectory import Trajectory
+
+class PcapMeta:
+    """
+    The internal cache of a PCAP file: frame count, time bounds, frame index (see FrameIndex) and the SBET coordinates
+    of each frame. It is stored as an uncompressed .npz file next to the PCAP file, with the frame index and coordinates
+    as structured arrays, so it is loaded as a few arrays without creating any objects per frame.
+
+    The cache is used as a dict (see load), with the keys frame_count, min_time_unix, max_time_unix, min_time_human,
+    max_time_human, frame_index (FrameIndex rows) and coordinates (Trajectory). All keys are optional.
+
+    Each artifact (frame_index, frame_count with the time bounds, and coordinates) is stored with a key describing
+    everything it depends on (for example the size and modification time of the PCAP file, or the SBET file and CRS
+    used for the coordinates). When the cache is loaded with a different key for an artifact, only that artifact
+    is thrown away (and recreated by the reader).
+
+    Older caches (.pcap.meta.json and .pcap.index.npy) are migrated automatically when there is no .npz cache.
+    """
+
+    scalars = ["frame_count", "min_time_unix", "max_time_unix"]
+
+    # The values belonging to each artifact.
+    artifacts = {
+        "frame_index": ["frame_index"],
+        "frame_count": ["frame_count", "min_time_unix", "max_time_unix", "min_time_human", "max_time_human"],
+        "coordinates": ["coordinates"]
+    }
+
+    @staticmethod
+    def get_path(pcap_path):
+        return pcap_path.replace(".pcap", ".pcap.meta.npz")
+
+    @staticmethod
+    def load(pcap_path, keys=None):
+        """Returns the cached meta data for the given PCAP file as a dict (empty if nothing is cached). Artifacts
+        where the given key (a dict from artifact to key) doesn't match the stored key are left out."""
+
+        keys = PcapMeta.normalize(keys)
+
+        path = PcapMeta.get_path(pcap_path)
+        if not os.path.isfile(path):
+            meta = PcapMeta.migrate(pcap_path, keys)
+        else:
+            meta = PcapMeta.read(path)
+
+        for artifact in PcapMeta.artifacts:
+            if artifact in keys and meta["manifest"].get(artifact) != keys[artifact]:
+                for name in PcapMeta.artifacts[artifact]:
+                    meta.pop(name, None)
+                meta["manifest"].pop(artifact, None)
+
+        return meta
+
+    @staticmethod
+    def normalize(keys):
+        """Returns the given keys as they will look after being stored (as JSON), so that they can be compared to stored keys."""
+        return json.loads(json.dumps(keys or {}, sort_keys=True))
+
+    @staticmethod
+    def read(path):
+        meta = { "manifest": {} }
+        with np.load(path, allow_pickle=False) as f:
+            if "manifest" in f:
+                meta["manifest"] = json.loads(str(f["manifest"]))
+            for name in PcapMeta.scalars:
+                if name in f:
+                    meta[name] = int(f[name])
+            if "frame_index" in f:
+                meta["frame_index"] = f["frame_index"]
+            if "coordinates" in f:
+                meta["coordinates"] = Trajectory.from_data(f["coordinates"])
+
+        if "min_time_unix" in meta:
+            PcapMeta.set_time_bounds(meta, meta["min_time_unix"], meta["max_time_unix"])
+
+        return meta
+
+    @staticmethod
+    def save(pcap_path, meta, keys=None):
+        """Saves the given meta data. The stored key of each artifact in the meta data is taken from the given keys,
+        or kept as it was loaded if the key of an artifact is not given."""
+
+        keys = PcapMeta.normalize(keys)
+        manifest = dict(meta.get("manifest", {}))
+        for artifact in PcapMeta.artifacts:
+            if artifact in keys and any(name in meta for name in PcapMeta.artifacts[artifact]):
+                manifest[artifact] = keys[artifact]
+        meta["manifest"] = manifest
+
+        arrays = { "manifest": np.array(json.dumps(manifest, sort_keys=True)) }
+        for name in PcapMeta.scalars:
+            if name in meta:
+                arrays[name] = np.array(meta[name], dtype=np.int64)
+        if meta.get("frame_index") is not None:
+            arrays["frame_index"] = meta["frame_index"]
+        if meta.get("coordinates") is not None:
+            arrays["coordinates"] = meta["coordinates"].array()
+
+        # Write to a temporary file first, so that an interrupted run never leaves a broken cache.
+        path = PcapMeta.get_path(pcap_path)
+        with open(path + ".tmp", "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(path + ".tmp", path)
+
+    @staticmethod
+    def migrate(pcap_path, keys):
+        """Reads the older JSON meta cache and frame index of the given PCAP file (if any), saves them as an .npz
+        cache, and deletes the old files. Returns the meta data as a dict.
+
+        The frame index and frame count only depend on the PCAP file, and are stored with the given keys. The old
+        coordinates are dropped, since it is unknown which SBET file (and noise) they were created with."""
+
+        json_path = pcap_path.replace(".pcap", ".pcap.meta.json")
+        index_path = pcap_path.replace(".pcap", ".pcap.index.npy")
+        meta = { "manifest": {} }
+
+        if os.path.isfile(json_path):
+            try:
+                with open(json_path) as f:
+                    old = json.load(f)
+                for name in PcapMeta.scalars:
+                    if name in old:
+                        meta[name] = int(old[name])
+            except:
+                meta = { "manifest": {} }
+
+        if os.path.isfile(index_path):
+            try:
+                meta["frame_index"] = np.load(index_path)
+            except:
+                pass
+
+        if len(meta) < 2:
+            return meta
+
+        PcapMeta.save(pcap_path, meta, { name: keys[name] for name in ["frame_index", "frame_count"] if name in keys })
+        for path in [json_path, index_path]:
+            if os.path.isfile(path):
+                os.remove(path)
+
+        if "min_time_unix" in meta:
+            PcapMeta.set_time_bounds(meta, meta["min_time_unix"], meta["max_time_unix"])
+
+        return meta
+
+    @staticmethod
+    def set_time_bounds(meta, min_time, max_time):
+        meta["min_time_unix"] = int(min_time)
+        meta["max_time_unix"] = int(max_time)
+
+        meta["min_time_human"] = datetime.utcfromtimestamp(min_time/1000000000).strftime("%Y-%m-%d %H:%M:%S")
+        meta["max_time_human"] = datetime.utcfromtimestamp(max_time/1000000000).strftime("%Y-%m-%d %H:%M:%S")
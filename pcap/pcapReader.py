@@ -1,13 +1,19 @@
 from ouster import client, pcap
 from ouster.client.core import ClientTimeout
 import open3d as o3d
-from pcap.colormaps import colorize, normalize
+from pcap.colormaps import normalize, colormap_indices, colorize_indices
+from pcap.frameCache import FrameCache
+from pcap.frameIndex import FrameIndex
+from pcap.pcapMeta import PcapMeta
+from pcap.frameFilter import FrameFilterPipeline, VehicleFilter, InvalidFilter, RadiusFilter, HeightBandFilter
+from pcap.pixelMask import StaticPixelMask
+from pcap.rangeImage import RangeImage
+from utils.sharedResources import SharedResources
 from sbet.sbetParser import SbetParser
-from sbet.sbetRow import SbetRow
+from sbet.sbetHelpers import timestamp_unix2sow
 import numpy as np
 import os
 import json
-from datetime import datetime
 
 class PcapReader:
 
@@ -17,17 +23,22 @@ class PcapReader:
         """
 
         self.pcap_path = pcap_path
+        self.args = args
         self.max_distance = args.max_frame_radius
+        self.min_height = getattr(args, "min_frame_height", None)
+        self.max_height = getattr(args, "max_frame_height", None)
+
+        # Custom filter stages (see pcap.frameFilter) that are added to every filter pipeline.
+        self.custom_filters = []
+        self.filter_pipelines = {}
 
         if meta_data_path is None or meta_data_path == "":
             meta_data_path = pcap_path.replace(".pcap", ".json")
 
         self.meta_data_path = meta_data_path
 
-        # Read the metadata from the JSON file.
-        with open(meta_data_path, "r") as f:
-            self.metadata = client.SensorInfo(f.read())
-        self.xyzLut = client.XYZLut(self.metadata)
+        # Read the metadata from the JSON file (shared by all readers using the same file).
+        (self.metadata, self.xyzLut) = SharedResources.get("sensor", os.path.abspath(meta_data_path), lambda: PcapReader.read_sensor(meta_data_path))
 
         self.source = pcap.Pcap(pcap_path, self.metadata)
 
@@ -36,17 +47,38 @@ class PcapReader:
         # If 0, every frame will be read. If 1, every second frame, etc.
         self.skip_frames = skip_frames
         
-        self.internal_meta_path = pcap_path.replace(".pcap", ".pcap.meta.json")
-        self.internal_meta = {}
         recreate_caches = True if args is not None and args.recreate_caches else False
-        if os.path.isfile(self.internal_meta_path) and not recreate_caches:
-            try:
-                with open(self.internal_meta_path) as f:
-                    self.internal_meta = json.load(f)
-                    if "coordinates" in self.internal_meta:
-                        self.internal_meta["coordinates"] = [SbetRow(None, None, None, x) for x in self.internal_meta["coordinates"]]
-            except:
-                self.internal_meta = {}
+
+        # The frame index (byte offsets of each frame in the PCAP file) is loaded or built on first use.
+        self.frame_index = None
+        self.frame_index_is_loaded = False
+
+        # Decoded frames can be cached on disk (one cache per set of filter parameters) to
+        # avoid decoding the same packets again on later runs.
+        self.use_frame_cache = getattr(args, "frame_cache", False)
+        self.recreate_frame_caches = recreate_caches
+        self.frame_caches = {}
+
+        # A static pixel mask (see StaticPixelMask) can be learned from the first frames, and is then used to drop
+        # the vehicle and empty pixels from the range image before it is projected to points.
+        self.pixel_mask_frames = getattr(args, "static_pixel_mask", 0) or 0
+        self.pixel_mask_path = StaticPixelMask.get_path(meta_data_path)
+        self.pixel_mask = None
+        self.recreate_pixel_mask = recreate_caches
+
+        # If activated, normals are estimated from the neighbours in the range image (see RangeImage) for every frame.
+        self.organized_normals = getattr(args, "organized_normals", False)
+        self.range_image = None
+
+        # If given, every frame is reduced to at most this many points by structured downsampling of the range image (see RangeImage).
+        self.structured_downsampling = getattr(args, "structured_downsampling", 0) or 0
+
+        # If activated, edge and planar feature points (see RangeImage.extract_features) are extracted from every frame.
+        self.extract_features = getattr(args, "range_image_features", False)
+        self.frame_features = None
+
+        # All of the above need to know the range image pixel of each point.
+        self.with_pixels = self.organized_normals or self.structured_downsampling > 0 or self.extract_features
 
         self.frame_coordinates = None
         self.sbet = None
@@ -58,12 +90,107 @@ class PcapReader:
             if getattr(args, "skip_last_frame_in_pcap_file", False):
                 self.skip_last_frame_in_pcap_file = True
 
+        # Frame count, time bounds, frame index and coordinates are cached in a binary file next to the PCAP file (see PcapMeta).
+        # Each of them is only recreated when something it depends on has changed (see get_cache_keys).
+        self.internal_meta = {}
+        if not recreate_caches:
+            self.reload_internal_meta()
+
         self.reset()
 
+    def reload_internal_meta(self):
+        """Loads the internal meta cache from disk (for example after it has been built by another process, see Preflight)."""
+
+        try:
+            self.internal_meta = PcapMeta.load(self.pcap_path, self.get_cache_keys())
+        except:
+            self.internal_meta = {}
+
+        self.frame_index = None
+        self.frame_index_is_loaded = False
+
+    def is_preflighted(self):
+        """Returns True if the internal meta cache has everything that is built by preflight."""
+        return "frame_count" in self.internal_meta and "min_time_unix" in self.internal_meta and (self.sbet is None or "coordinates" in self.internal_meta)
+
+    def preflight(self):
+        """Builds everything in the internal meta cache (frame index, frame count, time bounds and coordinates) in a single
+        pass over the file, and saves it. Used to prepare many files in parallel (see Preflight)."""
+
+        self.count_frames()
+
+        if self.sbet is not None and "coordinates" not in self.internal_meta:
+            self.internal_meta["coordinates"] = self.read_coordinates()
+            self.save_internal_meta()
+
+    def get_cache_keys(self):
+        """Returns the keys of the artifacts in the internal meta cache (see PcapMeta), describing what each of them depends on."""
+
+        stat = os.stat(self.pcap_path)
+        pcap_key = { "size": stat.st_size, "mtime": int(stat.st_mtime), "version": FrameIndex.VERSION }
+
+        keys = { "frame_index": pcap_key, "frame_count": pcap_key }
+        if self.sbet is not None:
+            keys["coordinates"] = { "pcap": pcap_key, "sbet": self.sbet.get_cache_key(), "skip_frames": self.skip_frames, "gps_week": self.gps_week }
+
+        return keys
+
+    @staticmethod
+    def read_sensor(meta_data_path):
+        with open(meta_data_path, "r") as f:
+            metadata = client.SensorInfo(f.read())
+        return metadata, client.XYZLut(metadata)
+
     def get_pcap_path(self):
         return self.pcap_path
 
+    def get_frame_index(self, show_progress = False):
+        """Returns the frame index of this PCAP file (see FrameIndex), building it with a fast pass over the packet
+        headers if it doesn't exist. Returns None if the file could not be indexed, in which case the reader falls
+        back to decoding all frames sequentially."""
+
+        if self.frame_index_is_loaded:
+            return self.frame_index
+
+        self.frame_index_is_loaded = True
+
+        if "frame_index" in self.internal_meta:
+            try:
+                self.frame_index = FrameIndex(self.pcap_path, self.metadata, self.internal_meta["frame_index"])
+            except:
+                self.frame_index = None
+
+        if self.frame_index is None:
+            if show_progress:
+                print("Indexing frames ...")
+            try:
+                self.frame_index = FrameIndex.build(self.pcap_path, self.metadata)
+            except ValueError as e:
+                print("Failed to index frames, falling back to sequential reading:", e)
+                self.frame_index = None
+                return None
+
+            self.internal_meta["frame_index"] = self.frame_index.rows
+            self.save_internal_meta()
+
+        if len(self.frame_index) > 0 and ("frame_count" not in self.internal_meta or "min_time_unix" not in self.internal_meta):
+            self.internal_meta["frame_count"] = len(self.frame_index)
+            self.set_time_bounds(*self.frame_index.get_time_bounds())
+            self.save_internal_meta()
+
+        return self.frame_index
+
+    def prepare(self):
+        """Makes the reader ready for reading frames by loading (or building) the frame index and frame count.
+        Can be run in a background thread before the reader is needed."""
+
+        self.count_frames()
+
     def count_frames(self, show_progress = False):
+        frame_index = self.get_frame_index(show_progress)
+        if frame_index is not None:
+            return len(frame_index)
+
         if "frame_count" not in self.internal_meta:
             if show_progress:
                 print("Counting frames ...")
@@ -71,33 +198,23 @@ class PcapReader:
         return self.internal_meta["frame_count"]
 
     def save_internal_meta(self):
-        with open(self.internal_meta_path, 'w') as f:
-            json.dump(self.internal_meta, f, default=vars)
+        PcapMeta.save(self.pcap_path, self.internal_meta, self.get_cache_keys())
+
+    def set_time_bounds(self, min_time, max_time):
+        PcapMeta.set_time_bounds(self.internal_meta, min_time, max_time)
 
     def reset(self):
         self.source.reset()
         self.scans = iter(client.Scans(self.source))
+        self.scan_position = 0
         self.last_read_frame_ix = -1
         self.last_read_frame_ix_including_skips = -1
+        self.close_frame_caches()
 
-    def skip_and_get(self, iterator):
-        try:
-            for _ in range(self.skip_frames):
-                self.last_read_frame_ix_including_skips += 1
-                next(iterator)
-            self.last_read_frame_ix += 1
-            self.last_read_frame_ix_including_skips += 1
-            
-            # If reading the frame fails (due to slow hard drive/lots of traffic),
-            # try again up to 20 times to avoid breaking a long-running analysis.
-            for i in range(20):
-                try:
-                    return next(iterator)
-                except ClientTimeout:
-                    continue
-
-        except StopIteration:
-            return None
+    def close_frame_caches(self):
+        """Saves and closes the frame caches of this file (they are opened again if more frames are read)."""
+        for frame_cache in self.frame_caches.values():
+            frame_cache.close()
 
     def print_info(self, frame_index=None, printFunc=print):
         """Print information about all the packets in this file."""
@@ -165,6 +282,16 @@ class PcapReader:
                     break
 
     def enumerate_lidar_packets(self):
+        """Yields the first lidar packet of each frame in the file."""
+
+        frame_index = self.get_frame_index()
+        if frame_index is not None:
+            for frame_ix in range(len(frame_index)):
+                packet = next(frame_index.packets(frame_ix), None)
+                if packet is not None:
+                    yield packet
+            return
+
         count = 0
         min_time = 9223372036854775807
         max_time = -9223372036854775807
@@ -190,12 +317,7 @@ class PcapReader:
 
         self.internal_meta["frame_count"] = count
         if find_bounds:
-
-            self.internal_meta["min_time_unix"] = int(min_time)
-            self.internal_meta["max_time_unix"] = int(max_time)
-            
-            self.internal_meta["min_time_human"] = datetime.utcfromtimestamp(min_time/1000000000).strftime("%Y-%m-%d %H:%M:%S")
-            self.internal_meta["max_time_human"] = datetime.utcfromtimestamp(max_time/1000000000).strftime("%Y-%m-%d %H:%M:%S")
+            self.set_time_bounds(min_time, max_time)
 
         if find_bounds or find_count:
             self.save_internal_meta()
@@ -208,35 +330,84 @@ class PcapReader:
         }
 
     def get_coordinates(self, rotate=True, show_progress=False):
-        """Returns a list of coordinates (SbetRow) corresponding to each LidarPacket in the current Pcap file."""
-
-        if "coordinates" in self.internal_meta:
-            return self.internal_meta["coordinates"]
+        """Returns the coordinates (a Trajectory) corresponding to each LidarPacket in the current Pcap file. The noise free
+        coordinates are cached, and any SBET noise (see --sbet-noise) is added to a copy of them every time."""
 
         if self.sbet is None:
             return None
 
-        positions = []
-        self.sbet.reset()
-        iterator = iter(self.enumerate_lidar_packets())
-        for packet in iterator:
-            pos = self.sbet.get_position(self.get_sbet_timestamp(packet), pcap_path=self.pcap_path, gps_week=self.gps_week, continue_from_previous=True, frame_ix=len(positions))
-            positions.append(pos)
+        if "coordinates" not in self.internal_meta:
+            self.internal_meta["coordinates"] = self.read_coordinates()
+            self.save_internal_meta()
 
-            for _ in range(self.skip_frames):
-                next(iterator, None)
+        positions = self.sbet.apply_noise(self.internal_meta["coordinates"].copy())
 
         if rotate:
             positions = SbetParser.rotate_points(positions, positions[0].heading - np.pi / 2)
 
-        self.internal_meta["coordinates"] = positions
-        self.save_internal_meta()
-
         return positions
 
+    def read_coordinates(self):
+        """Looks up the (noise free) coordinates of each frame in the SBET data."""
+
+        frame_index = self.get_frame_index()
+        if frame_index is not None:
+
+            # The timestamps are available directly from the index, so there is no need to read any packets.
+            timestamps = frame_index.rows["packet_timestamp"][::self.skip_frames + 1]
+
+        else:
+
+            timestamps = []
+            iterator = iter(self.enumerate_lidar_packets())
+            for packet in iterator:
+                timestamps.append(self.get_sbet_timestamp(packet))
+
+                for _ in range(self.skip_frames):
+                    next(iterator, None)
+
+        # Only the part of the SBET data that covers this file needs to be read.
+        time_window = self.get_sbet_time_window()
+        if time_window is not None:
+            self.sbet.set_time_window(*time_window)
+
+        # Look up (and transform) the positions of all frames at once.
+        return self.sbet.get_positions(timestamps, pcap_path=self.pcap_path, gps_week=self.gps_week, with_noise=False)
+
+    def get_sbet_time_window(self, margin=10):
+        """Returns the time window (seconds of week) covered by this file, with a margin (in seconds) on both sides, or
+        None if the time bounds of the file are not known."""
+
+        if "min_time_unix" not in self.internal_meta:
+            return None
+
+        start = timestamp_unix2sow(self.internal_meta["min_time_unix"] / 1000000000, self.gps_week)
+        end = timestamp_unix2sow(self.internal_meta["max_time_unix"] / 1000000000, self.gps_week)
+
+        return (start - margin, end + margin)
+
     def get_current_frame_index(self):
         return self.last_read_frame_ix
 
+    def get_frame_features(self):
+        """Returns (edge indices, planar indices) for the last frame returned by next_frame, or None if feature extraction
+        is not activated (see --range-image-features)."""
+        return self.frame_features
+
+    def skip(self, count):
+        """Skips the given number of frames, exactly as if next_frame had been called that many times, but without
+        reading or decoding any packets. Returns the number of frames that were skipped, which is lower than the
+        given count if the end of the file is reached first."""
+
+        # A frame (index including skips) is only returned by next_frame if it is before the last frame in the file.
+        available = (self.count_frames() - 2 - self.last_read_frame_ix_including_skips) // (self.skip_frames + 1)
+        skipped = max(0, min(count, available))
+
+        self.last_read_frame_ix += skipped
+        self.last_read_frame_ix_including_skips += skipped * (self.skip_frames + 1)
+
+        return skipped
+
     def is_first_frame_in_file(self):
         return self.last_read_frame_ix == 0
 
@@ -257,27 +428,199 @@ class PcapReader:
         if cloud is None:
             cloud = frame
 
-        vw = 0.7
-        vl = 2.2
-        return cloud[((frame[:, 0] > 0.2) | (frame[:, 0] < -vl)) | ((frame[:, 1] > vw) | (frame[:, 1] < -vw)) | ((frame[:, 2] > 0.3) | (frame[:, 2] < -2))]
+        return cloud[VehicleFilter().mask(frame)]
 
     def remove_invalid(self, frame, cloud = None):
-        # Remove the vehicle, which is always stationary at the center. We don't want that
-        # to interfere with the point cloud alignment.
+        # Remove invalid points, which are placed in the origin.
 
         if cloud is None:
             cloud = frame
 
-        return cloud[(frame[:, 0] != 0) & (frame[:, 1] != 0) & (frame[:, 2] != 0)]
+        return cloud[InvalidFilter().mask(frame)]
 
     def remove_outside_distance(self, meters, frame, cloud = None):
-        # Remove the vehicle, which is always stationary at the center. We don't want that
-        # to interfere with the point cloud alignment.
+        # Remove all points that are further away from the origin than the given distance.
 
         if cloud is None:
             cloud = frame
 
-        return cloud[np.sqrt(frame[:,0]**2+frame[:,1]**2+frame[:,2]**2) <= meters]
+        return cloud[RadiusFilter(meters).mask(frame)]
+
+    def add_frame_filter(self, stage):
+        """Adds a custom filter stage (see pcap.frameFilter) that is applied to all frames read after this."""
+
+        self.custom_filters.append(stage)
+        self.filter_pipelines = {}
+
+    def get_filter_pipeline(self, remove_vehicle, max_distance):
+        """Returns the filter pipeline for the given filter parameters. The vehicle filter also removes
+        invalid points, so only one of them is used."""
+
+        key = (bool(remove_vehicle), max_distance)
+        if key not in self.filter_pipelines:
+            pipeline = FrameFilterPipeline()
+            pipeline.add(VehicleFilter() if remove_vehicle else InvalidFilter())
+
+            if max_distance is not None:
+                pipeline.add(RadiusFilter(max_distance))
+
+            if self.min_height is not None or self.max_height is not None:
+                pipeline.add(HeightBandFilter(self.min_height, self.max_height))
+
+            for stage in self.custom_filters:
+                pipeline.add(stage)
+
+            self.filter_pipelines[key] = pipeline
+
+        return self.filter_pipelines[key]
+
+    def get_pixel_mask(self, show_progress = False):
+        """Returns the static pixel mask, loading it from the file next to the sensor metadata, or learning it from the first
+        frames of this file if it doesn't exist. Returns None if the static pixel mask is not activated."""
+
+        if self.pixel_mask_frames < 1:
+            return None
+
+        if self.pixel_mask is None:
+            # The mask is shared by all readers using the same sensor metadata, so it is only loaded (or learned from the first file) once.
+            self.pixel_mask = SharedResources.get("pixel mask", os.path.abspath(self.pixel_mask_path), lambda: self.load_or_calibrate_pixel_mask(show_progress))
+
+        return self.pixel_mask
+
+    def load_or_calibrate_pixel_mask(self, show_progress = False):
+
+        pixel_mask = None
+        if os.path.isfile(self.pixel_mask_path) and not self.recreate_pixel_mask:
+            try:
+                pixel_mask = StaticPixelMask.load(self.pixel_mask_path, self.xyzLut)
+            except:
+                pass
+
+        if pixel_mask is None:
+            if show_progress:
+                print("Calibrating static pixel mask ...")
+
+            # Use a separate scan iterator, so that the calibration doesn't affect the frames read by next_frame.
+            scans = iter(client.Scans(pcap.Pcap(self.pcap_path, self.metadata)))
+            pixel_mask = StaticPixelMask.calibrate(scans, self.xyzLut, self.pixel_mask_frames)
+            pixel_mask.save(self.pixel_mask_path)
+
+        # The masked projection assumes that XYZLut is linear in the range, so check it against a real scan.
+        scan = next(iter(client.Scans(pcap.Pcap(self.pcap_path, self.metadata))), None)
+        if scan is not None and not pixel_mask.verify(scan, self.xyzLut):
+            raise Exception("The points projected with the static pixel mask don't match XYZLut for " + self.pcap_path + ", run without --static-pixel-mask.")
+
+        return pixel_mask
+
+    def get_frame_cache(self, remove_vehicle, max_distance):
+        """Returns the frame cache for the given filter parameters, or None if frame caching is not activated."""
+
+        if not self.use_frame_cache:
+            return None
+
+        parameters = {
+            "filters": self.get_filter_pipeline(remove_vehicle, max_distance).get_parameters(),
+            "max_distance": max_distance
+        }
+
+        pixel_mask = self.get_pixel_mask()
+        if pixel_mask is not None:
+            parameters["pixel_mask"] = pixel_mask.get_parameters()
+
+        # The pixels are needed to estimate organized normals, downsample and extract features from cached frames.
+        if self.with_pixels:
+            parameters["pixels"] = True
+
+        key = json.dumps(parameters, sort_keys=True)
+        if key not in self.frame_caches:
+            self.frame_caches[key] = FrameCache(self.pcap_path, parameters, self.count_frames(), self.recreate_frame_caches)
+
+        return self.frame_caches[key]
+
+    def read_scan(self, frame_ix):
+        """Reads the scan with the given index (including skips). If the file is indexed, only the packets
+        of this frame are read. Otherwise, the scan is read from the scan iterator, and scans before it that
+        have not been read yet (for example because they were skipped) are decoded and thrown away."""
+
+        frame_index = self.get_frame_index()
+        if frame_index is not None:
+            if frame_ix >= len(frame_index):
+                return None
+
+            # If reading the frame fails (due to slow hard drive/lots of traffic),
+            # try again up to 20 times to avoid breaking a long-running analysis.
+            for i in range(20):
+                try:
+                    return next(iter(client.Scans(frame_index.packet_source(frame_ix))), None)
+                except ClientTimeout:
+                    continue
+
+            return None
+
+        # Without an index, the file can only be read sequentially, so start from the beginning to go backwards.
+        if frame_ix < self.scan_position:
+            self.source.reset()
+            self.scans = iter(client.Scans(self.source))
+            self.scan_position = 0
+
+        try:
+            while self.scan_position < frame_ix:
+                next(self.scans)
+                self.scan_position += 1
+
+            # If reading the frame fails (due to slow hard drive/lots of traffic),
+            # try again up to 20 times to avoid breaking a long-running analysis.
+            for i in range(20):
+                try:
+                    scan = next(self.scans)
+                    self.scan_position += 1
+                    return scan
+                except ClientTimeout:
+                    continue
+
+        except StopIteration:
+            return None
+
+    def get_range_image(self):
+        if self.range_image is None:
+            self.range_image = SharedResources.get("range image", os.path.abspath(self.meta_data_path), lambda: RangeImage(self.metadata))
+        return self.range_image
+
+    def decode_scan(self, scan, remove_vehicle, max_distance, with_colors, timer=None, with_pixels=False):
+        """Converts the given scan to an array of points, (if with_colors is True) an array of colormap
+        indices based on the reflectivity, and (if with_pixels is True) an array with the range image
+        pixel of each point, then filters all of them using a single combined mask."""
+
+        pixel_mask = self.get_pixel_mask()
+
+        # Prepare the frame for visualization. If there is a static pixel mask, only the kept pixels are projected.
+        if pixel_mask is not None:
+            xyz = pixel_mask.project(scan.field(client.ChanField.RANGE), remove_vehicle)
+            if timer is not None: timer.time("frame masked projection")
+        else:
+            xyz = self.xyzLut(scan)
+            xyz = xyz.reshape((-1, 3))
+            if timer is not None: timer.time("frame reshaping")
+
+        key = None
+        if with_colors:
+            key = scan.field(self.channels[4]) # Channel REFLECTIVITY
+
+            # apply colormap to field values (normalized over the entire image, so that the colors don't depend on the mask)
+            key = colormap_indices(normalize(key)).reshape(-1)
+
+            if pixel_mask is not None:
+                key = np.take(key, pixel_mask.get_kept_pixels(remove_vehicle))
+
+            if timer is not None: timer.time("frame colorization")
+
+        pixels = None
+        if with_pixels:
+            pixels = pixel_mask.get_kept_pixels(remove_vehicle) if pixel_mask is not None else np.arange(len(xyz))
+
+        xyz, key, pixels = self.get_filter_pipeline(remove_vehicle, max_distance).apply(xyz, key, pixels, timer=timer)
+
+        return xyz, key, pixels
 
     def next_frame(self, remove_vehicle:bool=False, timer=None, colored=True, max_distance=None):
         """Retrieves the next frame"""
@@ -287,55 +630,77 @@ class PcapReader:
 
         if timer is not None: timer.reset()
 
-        scan = self.skip_and_get(self.scans)
+        frame_cache = self.get_frame_cache(remove_vehicle, max_distance)
 
-        if timer is not None: timer.time("frame retrieval")
+        self.last_read_frame_ix += 1
+        self.last_read_frame_ix_including_skips += self.skip_frames + 1
+        frame_ix = self.last_read_frame_ix_including_skips
 
-        if scan is None:
+        if frame_ix >= self.count_frames() - 1:
+            self.close_frame_caches()
             return None
 
-        if self.last_read_frame_ix_including_skips >= self.internal_meta["frame_count"] - 1:
-            return None
-            
-        # Prepare the frame for visualization
-        xyz = self.xyzLut(scan)
-        xyz = xyz.reshape((-1, 3))
+        if frame_cache is not None and frame_cache.contains(frame_ix):
 
-        if timer is not None: timer.time("frame reshaping")
+            xyz, key, pixels = frame_cache.read(frame_ix)
 
-        if colored:
-            key = scan.field(self.channels[4]) # Channel REFLECTIVITY
+            if timer is not None: timer.time("frame cache retrieval")
 
-            # apply colormap to field values
-            key_img = normalize(key)
-            color_img = colorize(key_img)
-            color_img = color_img.reshape((-1, 3))
+        else:
 
-            if timer is not None: timer.time("frame colorization")
+            scan = self.read_scan(frame_ix)
 
-        if remove_vehicle:
-            if colored:
-                color_img = self.remove_vehicle(xyz, color_img)
-            xyz = self.remove_vehicle(xyz)
-            if timer is not None: timer.time("frame vehicle removal")
-        else:
-            if colored:
-                color_img = self.remove_invalid(xyz, color_img)
-            xyz = self.remove_invalid(xyz)
-            if timer is not None: timer.time("frame invalid values removal")
+            if timer is not None: timer.time("frame retrieval")
+
+            if scan is None:
+                self.close_frame_caches()
+                return None
+
+            # The colors are always cached, so that the same cache can be used for both colored and uncolored frames.
+            xyz, key, pixels = self.decode_scan(scan, remove_vehicle, max_distance, colored or frame_cache is not None, timer, self.with_pixels)
+
+            if frame_cache is not None:
+                frame_cache.write(frame_ix, xyz, key, pixels)
+                if timer is not None: timer.time("frame cache writing")
 
-        if max_distance is not None:
-            if colored:
-                color_img = self.remove_outside_distance(max_distance, xyz, color_img)
-            xyz = self.remove_outside_distance(max_distance, xyz)
-            if timer is not None: timer.time("frame max distance removal")
+        # Normals are estimated before downsampling, so that all the neighbours of each point are used.
+        normals = None
+        if self.organized_normals:
+            normals = self.get_range_image().estimate_normals(xyz, pixels)
+            if timer is not None: timer.time("frame organized normal estimation")
+
+        features = None
+        if self.extract_features:
+            features = self.get_range_image().extract_features(xyz, pixels)
+            if timer is not None: timer.time("frame feature extraction")
+
+        if self.structured_downsampling > 0:
+            kept = self.get_range_image().structured_downsample(xyz, pixels, self.structured_downsampling)
+
+            # Keep the feature points, and update their indices to match the downsampled frame.
+            if features is not None:
+                kept = np.union1d(kept, np.concatenate(features))
+                positions = np.full(len(xyz), -1, dtype=np.int64)
+                positions[kept] = np.arange(len(kept))
+                features = (positions[features[0]], positions[features[1]])
+
+            xyz = xyz[kept]
+            if key is not None:
+                key = key[kept]
+            if normals is not None:
+                normals = normals[kept]
+            if timer is not None: timer.time("frame structured downsampling")
 
         cloud = o3d.geometry.PointCloud(o3d.utility.Vector3dVector(xyz))
         if colored:
-            cloud.colors = o3d.utility.Vector3dVector(color_img)
+            cloud.colors = o3d.utility.Vector3dVector(colorize_indices(key))
+        if normals is not None:
+            cloud.normals = o3d.utility.Vector3dVector(normals)
 
         if timer is not None: timer.time("frame cloud generation")
 
+        self.frame_features = features
+
         return cloud
 
     def read_all_frames(self, remove_vehicle:bool=False):
@@ -29,7 +29,7 @@ class PcapReaderHelper:
             return
 
         parser.add_argument('--sbet', type=str, required=True, help="The path to a corresponding SBET file with GNSS coordinates.")
-        parser.add_argument('--sbet-noise', type=float, nargs=3, required=False, help="If given, all SBET coordinates will be randomized by adding a random value between +/- this value to the X, Y and Z coordinates. A value must be provided for each dimension (three values). This should be used together with --recreate-caches, otherwise any cached coordinates will be loaded and override the randomization.")
+        parser.add_argument('--sbet-noise', type=float, nargs=3, required=False, help="If given, all SBET coordinates will be randomized by adding a random value between +/- this value to the X, Y and Z coordinates. A value must be provided for each dimension (three values). The noise is added to the cached coordinates on every run, so --recreate-caches is not needed.")
         parser.add_argument('--sbet-noise-from-frame-ix', type=int, default=0, required=False, help="If SBET noise is activated, the noise will start from this frame index (frames before this index will use the actual unchanged coordinates).")
 
     @staticmethod
@@ -37,7 +37,11 @@ class PcapReaderHelper:
         parser.add_argument('--pcap', type=str, nargs='+', required=True, help="The path to one or more PCAP files to visualize, relative or absolute. A path to a directory containing multiple pcap files can also be provided.")
         parser.add_argument('--json', type=str, nargs='+', required=False, help="The path to corresponding JSON file(s) for each of the PCAP file(s) with the sensor metadata, relative or absolute. If this is not given, the PCAP location is used (by replacing .pcap with .json). A path to a directory containing multiple json files can also be provided.")
         parser.add_argument('--max-frame-radius', type=float, default=None, required=False, help="If given as a number larger than 0, all PCAP frames will be reduced in size by removing all points that are further away from the origin than this value (measured in meters).")
+        parser.add_argument('--min-frame-height', type=float, default=None, required=False, help="If given, all points that are further below the sensor than this value (measured in meters, usually negative) are removed from all PCAP frames.")
+        parser.add_argument('--max-frame-height', type=float, default=None, required=False, help="If given, all points that are higher above the sensor than this value (measured in meters) are removed from all PCAP frames.")
+        parser.add_argument('--static-pixel-mask', type=int, default=0, required=False, help="If given as a number larger than 0, a static mask over the range image pixels (vehicle, beams that never return anything, and pixels with very short noisy returns) is learned from this number of frames at the start of the first PCAP file, and saved next to the sensor metadata (.pixelmask.npy). The masked pixels are dropped before the range image is projected to points. The mask is reused on later runs until --recreate-caches is given.")
         parser.add_argument('--recreate-caches', action='store_true')
+        parser.add_argument('--frame-cache', action='store_true', help="If given, decoded and filtered frames are cached on disk next to each PCAP file (one cache per set of filter parameters), so that later runs on the same files can skip decoding the lidar packets. Coordinates are stored with millimetre precision.")
 
         PcapReaderHelper.add_sbet_arguments(parser, browsing_only)
 
@@ -0,0 +1,145 @@
+from ouster import client
+from itertools import islice
+import numpy as np
+import hashlib
+
+from pcap.frameFilter import VehicleFilter
+
+class StaticPixelMask:
+    """
+    A static mask over the pixels of the (staggered) range image, learned from the first frames of a trip.
+    The vehicle, beams that never return anything, and pixels with very short (noisy) returns are always
+    found at the same pixels, so these can be dropped from the range image before it is projected to points,
+    instead of projecting them and then testing every point against the vehicle box.
+
+    Every pixel is given a combination of flags that tells why it is masked. Empty pixels are always dropped,
+    while vehicle and noisy pixels are only dropped when the vehicle is to be removed.
+    """
+
+    EMPTY = 1
+    VEHICLE = 2
+    NOISY = 4
+
+    def __init__(self, flags, xyzLut):
+        self.flags = flags
+        self.shape = flags.shape
+
+        # The lookup table is linear (xyz = direction * range + offset) in the range of each pixel, so the direction
+        # and offset of each pixel can be found by projecting two constant range images. Zero ranges can't be used for
+        # this, since XYZLut places pixels without a return in the origin.
+        near = xyzLut(np.full(self.shape, 1000, dtype=np.uint32)).reshape((-1, 3))
+        far = xyzLut(np.full(self.shape, 2000, dtype=np.uint32)).reshape((-1, 3))
+        self.direction = (far - near) / 1000
+        self.offset = near - 1000 * self.direction
+
+        self.projections = {}
+
+    @staticmethod
+    def get_path(meta_data_path):
+        return meta_data_path.replace(".json", ".pixelmask.npy")
+
+    @staticmethod
+    def load(path, xyzLut):
+        return StaticPixelMask(np.load(path), xyzLut)
+
+    def save(self, path):
+        np.save(path, self.flags)
+
+    @staticmethod
+    def calibrate(scans, xyzLut, frame_count, threshold=0.95, min_range=1.0):
+        """Learns a mask from the first frame_count scans in the given iterable. A pixel is flagged as empty if it has no
+        return in any of the scans, and as vehicle or noisy if it hits the vehicle box, or is closer to the sensor than
+        min_range (in meters), in at least the given fraction of the scans."""
+
+        vehicle_filter = VehicleFilter()
+
+        counted = 0
+        empty_count = None
+        for scan in islice(scans, frame_count):
+
+            ranges = scan.field(client.ChanField.RANGE)
+            xyz = xyzLut(scan).reshape((-1, 3))
+
+            empty = ranges.reshape(-1) == 0
+            vehicle = ~vehicle_filter.mask(xyz) & ~empty
+            noisy = (ranges.reshape(-1) < min_range * 1000) & ~empty & ~vehicle
+
+            if empty_count is None:
+                shape = ranges.shape
+                empty_count = np.zeros(empty.shape, dtype=np.int32)
+                vehicle_count = np.zeros(empty.shape, dtype=np.int32)
+                noisy_count = np.zeros(empty.shape, dtype=np.int32)
+
+            empty_count += empty
+            vehicle_count += vehicle
+            noisy_count += noisy
+            counted += 1
+
+        if counted < 1:
+            raise Exception("Found no frames to calibrate the pixel mask from.")
+
+        limit = threshold * counted
+
+        flags = np.zeros(empty_count.shape, dtype=np.uint8)
+        flags[empty_count >= counted] |= StaticPixelMask.EMPTY
+        flags[vehicle_count >= limit] |= StaticPixelMask.VEHICLE
+        flags[(noisy_count + vehicle_count >= limit) & (vehicle_count < limit)] |= StaticPixelMask.NOISY
+
+        return StaticPixelMask(flags.reshape(shape), xyzLut)
+
+    def get_parameters(self):
+        """Returns a short description of the mask, used to tell frame caches for different masks apart."""
+
+        return ["pixel mask", hashlib.sha1(self.flags.tobytes()).hexdigest()[:10]]
+
+    def get_dropped_flags(self, remove_vehicle):
+        if remove_vehicle:
+            return StaticPixelMask.EMPTY | StaticPixelMask.VEHICLE | StaticPixelMask.NOISY
+        return StaticPixelMask.EMPTY
+
+    def get_kept_pixels(self, remove_vehicle):
+        """Returns the flat indices of the pixels that are kept."""
+
+        return self._get_projection(remove_vehicle)[0]
+
+    def _get_projection(self, remove_vehicle):
+
+        key = bool(remove_vehicle)
+        if key not in self.projections:
+            kept = np.flatnonzero((self.flags.reshape(-1) & self.get_dropped_flags(remove_vehicle)) == 0)
+            self.projections[key] = (kept, self.direction[kept], self.offset[kept])
+
+        return self.projections[key]
+
+    def project(self, ranges, remove_vehicle):
+        """Projects the kept pixels of the given range image to an (n, 3) array of points. The points are the same as the
+        corresponding points from XYZLut (see verify), but no points are calculated for the masked pixels."""
+
+        (kept, direction, offset) = self._get_projection(remove_vehicle)
+
+        r = np.take(ranges.reshape(-1), kept).astype(np.float64)
+
+        xyz = direction * r[:, None] + offset
+
+        # Like XYZLut, place pixels without a return in the origin, so that they are removed by InvalidFilter.
+        xyz[r == 0] = 0
+
+        return xyz
+
+    def verify(self, scan, xyzLut, tolerance=0.001):
+        """Returns True if the points projected for the given scan match the points from XYZLut within the given
+        tolerance (in meters)."""
+
+        kept = self.get_kept_pixels(False)
+        if len(kept) < 1:
+            return True
+
+        expected = xyzLut(scan).reshape((-1, 3))[kept]
+        projected = self.project(scan.field(client.ChanField.RANGE), False)
+
+        return np.max(np.abs(projected - expected)) <= tolerance
+
+    def coverage(self, remove_vehicle):
+        """Returns the fraction of the pixels that are dropped."""
+
+        return 1 - len(self.get_kept_pixels(remove_vehicle)) / self.flags.size
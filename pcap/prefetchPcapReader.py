@@ -0,0 +1,162 @@
+import threading
+import queue
+from utils.taskTimer import TaskTimer
+
+class PrefetchPcapReader:
+    """
+    Wraps a PcapReader or SerialPcapReader, and reads (decodes, filters and converts) the next frames
+    in a background thread while the current frame is being processed. Up to prefetch_count frames
+    are kept ready in a bounded queue.
+
+    The frame index, file and first-frame-in-file state of the wrapped reader runs ahead of the
+    frames that have actually been handed out, so these are recorded for each prefetched frame and
+    returned from here instead. Everything else is passed directly to the wrapped reader.
+    """
+
+    def __init__(self, reader, prefetch_count):
+        self.reader = reader
+        self.prefetch_count = prefetch_count
+
+        self.worker = None
+        self.worker_arguments = None
+        self.stop_event = None
+        self.frames = None
+        self.worker_timer = TaskTimer()
+
+        # The number of frames that have been handed out (or skipped) since the last reset, used
+        # to rewind the wrapped reader when the prefetched frames must be thrown away.
+        self.consumed_frames = 0
+
+        # The state of the wrapped reader right after reading the last frame that was handed out.
+        self.state = None
+
+    def __getattr__(self, name):
+        return getattr(self.reader, name)
+
+    def _get_state(self):
+        return {
+            "frame_index": self.reader.get_current_frame_index(),
+            "frame_index_including_skips": self.reader.get_current_frame_index_including_skips(),
+            "is_first_frame_in_file": self.reader.is_first_frame_in_file(),
+            "pcap_path": self.reader.get_pcap_path(),
+            "frame_features": self.reader.get_frame_features()
+        }
+
+    def _work(self, stop_event, frames, arguments):
+        (remove_vehicle, colored, max_distance) = arguments
+
+        while not stop_event.is_set():
+
+            try:
+                frame = self.reader.next_frame(remove_vehicle, self.worker_timer, colored, max_distance)
+                item = (frame, None if frame is None else self._get_state(), None, dict(self.worker_timer.timings))
+            except Exception as e:
+                item = (None, None, e, dict(self.worker_timer.timings))
+
+            # Wait for room in the queue, but give up if the worker has been stopped in the meantime.
+            while not stop_event.is_set():
+                try:
+                    frames.put(item, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+
+            if item[0] is None:
+                return
+
+    def _start(self, arguments):
+        self.stop_event = threading.Event()
+        self.frames = queue.Queue(maxsize=self.prefetch_count)
+        self.worker_arguments = arguments
+        self.worker = threading.Thread(target=self._work, args=(self.stop_event, self.frames, arguments), daemon=True)
+        self.worker.start()
+
+    def _stop(self):
+        """Stops the worker, throws away any prefetched frames, and rewinds the wrapped reader to the last frame that was handed out."""
+
+        if self.worker is None:
+            return
+
+        self.stop_event.set()
+        self.worker.join()
+
+        self.worker = None
+        self.worker_arguments = None
+        self.frames = None
+        self.state = None
+
+        self.reader.reset()
+        self.reader.skip(self.consumed_frames)
+
+    def next_frame(self, remove_vehicle:bool=False, timer=None, colored=True, max_distance=None):
+
+        if timer is not None: timer.reset()
+
+        arguments = (remove_vehicle, colored, max_distance)
+        if self.worker is not None and self.worker_arguments != arguments:
+            self._stop()
+        if self.worker is None:
+            self._start(arguments)
+
+        (frame, state, exception, timings) = self.frames.get()
+
+        if timer is not None:
+            timer.time("frame prefetch wait")
+            for key in timings:
+                timer.timings["prefetch " + key] = timings[key]
+
+        # The worker stops after the last frame (or an exception), so it must be restarted on the next call.
+        if frame is None:
+            self.worker.join()
+            self.worker = None
+            self.worker_arguments = None
+            self.frames = None
+
+        if exception is not None:
+            raise exception
+
+        if frame is not None:
+            self.consumed_frames += 1
+            self.state = state
+
+        return frame
+
+    def skip(self, count):
+        self._stop()
+        skipped = self.reader.skip(count)
+        self.consumed_frames += skipped
+        return skipped
+
+    def reset(self):
+        self._stop()
+        self.reader.reset()
+        self.consumed_frames = 0
+        self.state = None
+
+    def read_all_frames(self, remove_vehicle:bool=False):
+
+        frames = []
+        while True:
+            frame = self.next_frame(remove_vehicle)
+            if frame is None:
+                return frames
+            frames.append(frame)
+
+    def get_current_frame_index(self):
+        return self.reader.get_current_frame_index() if self.state is None else self.state["frame_index"]
+
+    def get_current_frame_index_including_skips(self):
+        return self.reader.get_current_frame_index_including_skips() if self.state is None else self.state["frame_index_including_skips"]
+
+    def is_first_frame_in_file(self):
+        return self.reader.is_first_frame_in_file() if self.state is None else self.state["is_first_frame_in_file"]
+
+    def get_pcap_path(self):
+        return self.reader.get_pcap_path() if self.state is None else self.state["pcap_path"]
+
+    def get_frame_features(self):
+        return self.reader.get_frame_features() if self.state is None else self.state["frame_features"]
+
+    @property
+    def pcap_path(self):
+        return self.get_pcap_path()
@@ -0,0 +1,70 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from tqdm import tqdm
+
+from pcap.pcapReader import PcapReader
+
+def preflight_file(pcap_path, meta_data_path, skip_frames, args):
+    """Runs the preflight of a single PCAP file (see PcapReader.preflight), unless its caches are already complete (and
+    not recreated, see --recreate-caches). Returns None if successful, otherwise the error message. Defined at module
+    level so that it can be run in a worker process."""
+
+    try:
+        reader = PcapReader(pcap_path, meta_data_path, skip_frames, args=args)
+        if not reader.is_preflighted():
+            reader.preflight()
+        return None
+    except Exception as e:
+        return str(e)
+
+class Preflight:
+    """
+    Builds the internal meta cache (frame index, frame count, time bounds and coordinates, see PcapMeta) of many PCAP
+    files in parallel, using a pool of worker processes. Every file is processed in a single pass, and its cache is
+    saved as soon as it is finished, so an interrupted preflight continues where it stopped when it is run again
+    (files with complete caches are skipped).
+    """
+
+    @staticmethod
+    def run_readers(reader, workers=4, show_progress=True):
+        """Runs the preflight for all files in the given reader (a PcapReader or SerialPcapReader) that don't have complete
+        caches, and reloads their caches afterwards. Returns a list of (pcap path, error message) for the files that failed."""
+
+        readers = reader.readers if hasattr(reader, "readers") else [reader]
+        pending = [x for x in readers if not x.is_preflighted()]
+
+        failures = Preflight.run([(x.pcap_path, x.meta_data_path, x.skip_frames, x.args) for x in pending], workers, show_progress)
+
+        for x in pending:
+            x.reload_internal_meta()
+
+        return failures
+
+    @staticmethod
+    def run(jobs, workers=4, show_progress=True):
+        """Runs the preflight for the given jobs, each a tuple of (pcap path, metadata path, skip frames, args).
+        Returns a list of (pcap path, error message) for the files that failed."""
+
+        failures = []
+        if len(jobs) < 1:
+            return failures
+
+        with tqdm(total=len(jobs), ascii=True, desc="Preflight", disable=not show_progress) as pbar:
+
+            # With a single worker (or a single file), there's nothing to gain from starting new processes.
+            if workers <= 1 or len(jobs) == 1:
+                for job in jobs:
+                    error = preflight_file(*job)
+                    if error is not None:
+                        failures.append((job[0], error))
+                    pbar.update(1)
+                return failures
+
+            with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as executor:
+                futures = { executor.submit(preflight_file, *job): job[0] for job in jobs }
+                for future in as_completed(futures):
+                    error = future.result()
+                    if error is not None:
+                        failures.append((futures[future], error))
+                    pbar.update(1)
+
+        return failures
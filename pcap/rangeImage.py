@@ -0,0 +1,193 @@
+from ouster import client
+import numpy as np
+
+class RangeImage:
+    """
+    Organizes the points of a frame in the (destaggered) 2D range image grid of the sensor, where the
+    neighbours of a pixel are also its spatial neighbours. This makes it possible to find neighbouring
+    points directly from the image, without building a KD-tree.
+
+    Points are identified by their pixel, which is the flat index into the staggered image returned by
+    scan.field() and XYZLut (which is also the order of the points before any filtering).
+    """
+
+    def __init__(self, metadata):
+        self.height = metadata.format.pixels_per_column
+        self.width = metadata.format.columns_per_frame
+        self.size = self.height * self.width
+
+        # The staggered pixel at each position in the destaggered image.
+        self.destaggered_pixels = client.destagger(metadata, np.arange(self.size, dtype=np.uint32).reshape((self.height, self.width))).astype(np.int64)
+
+        # The (destaggered) row and column of each staggered pixel.
+        positions = np.empty(self.size, dtype=np.int64)
+        positions[self.destaggered_pixels.reshape(-1)] = np.arange(self.size)
+        self.pixel_rows = positions // self.width
+        self.pixel_columns = positions % self.width
+
+        # The angle between neighbouring columns and (on average) between neighbouring beams, in radians.
+        altitudes = np.radians(np.asarray(metadata.beam_altitude_angles))
+        self.column_angle = 2 * np.pi / self.width
+        self.beam_angle = np.abs(altitudes[0] - altitudes[-1]) / max(self.height - 1, 1)
+
+    def organize(self, xyz, pixels):
+        """Places the given points in the destaggered grid. Returns the (H, W, 3) grid of points, and an (H, W) boolean
+        grid that is True for the positions that have a point."""
+
+        points = np.zeros((self.size, 3), dtype=np.float64)
+        valid = np.zeros(self.size, dtype=bool)
+        points[pixels] = xyz
+        valid[pixels] = True
+
+        return points[self.destaggered_pixels], valid[self.destaggered_pixels]
+
+    def disorganize(self, grid, pixels):
+        """Returns the values in the given (H, W, ...) destaggered grid for the given pixels."""
+
+        values = np.empty((self.size,) + grid.shape[2:], dtype=grid.dtype)
+        values[self.destaggered_pixels.reshape(-1)] = grid.reshape((self.size,) + grid.shape[2:])
+
+        return values[pixels]
+
+    @staticmethod
+    def _tangents(points, valid, axis, wrap, max_distance_ratio):
+        """Calculates tangent vectors along the given image axis, using central differences where both neighbours
+        are valid, and one-sided differences where only one of them is. Neighbours that are much further away than
+        the point is from the sensor (depth discontinuities) are ignored."""
+
+        forward = np.roll(points, -1, axis=axis) - points
+        backward = points - np.roll(points, 1, axis=axis)
+
+        forward_valid = valid & np.roll(valid, -1, axis=axis)
+        backward_valid = valid & np.roll(valid, 1, axis=axis)
+
+        # Rows are not continuous across the top and bottom of the image (columns are, since the sensor rotates 360 degrees).
+        if not wrap:
+            if axis == 0:
+                forward_valid[-1, :] = False
+                backward_valid[0, :] = False
+            else:
+                forward_valid[:, -1] = False
+                backward_valid[:, 0] = False
+
+        limit = np.einsum("ijk,ijk->ij", points, points) * (max_distance_ratio * max_distance_ratio)
+        forward_valid &= np.einsum("ijk,ijk->ij", forward, forward) <= limit
+        backward_valid &= np.einsum("ijk,ijk->ij", backward, backward) <= limit
+
+        tangents = np.where((forward_valid & backward_valid)[..., None], forward + backward, np.where(forward_valid[..., None], forward, backward))
+
+        return tangents, forward_valid | backward_valid
+
+    def estimate_normals(self, xyz, pixels, max_distance_ratio=0.25):
+        """Estimates normals for the given points (with the given pixels) from the cross product of the tangents along the
+        rows and columns of the range image. The normals are oriented towards the sensor. Points without any usable
+        neighbours in one of the directions are given a zero normal, which makes them contribute nothing to point-to-plane
+        registration."""
+
+        points, valid = self.organize(xyz, pixels)
+
+        horizontal, horizontal_valid = RangeImage._tangents(points, valid, 1, True, max_distance_ratio)
+        vertical, vertical_valid = RangeImage._tangents(points, valid, 0, False, max_distance_ratio)
+
+        normals = np.cross(horizontal, vertical)
+        lengths = np.linalg.norm(normals, axis=2)
+
+        usable = horizontal_valid & vertical_valid & (lengths > 1e-12)
+        normals = np.divide(normals, lengths[..., None], out=np.zeros_like(normals), where=usable[..., None])
+
+        # Flip the normals that point away from the sensor.
+        away = np.einsum("ijk,ijk->ij", normals, points) > 0
+        normals[away] *= -1
+
+        return self.disorganize(normals, pixels)
+
+    @staticmethod
+    def _stride_exponents(spacing, base, max_exponent):
+        return np.clip(np.floor(np.log2(spacing) + base), 0, max_exponent).astype(np.int64)
+
+    def structured_downsample(self, xyz, pixels, budget, iterations=12):
+        """Decimates the rows and columns of the range image with a stride that depends on the distance to each point, so
+        that the remaining points have a roughly uniform spatial density, instead of the near range being much denser than
+        the far range. The strides are powers of two, so the points kept at a given distance are also kept closer to the
+        sensor. The spacing between the kept points is found by a binary search, so that at most budget points are kept.
+        Returns the indices of the points to keep."""
+
+        if len(xyz) <= budget:
+            return np.arange(len(xyz))
+
+        rows = self.pixel_rows[pixels]
+        columns = self.pixel_columns[pixels]
+        distances = np.maximum(np.sqrt(np.einsum("ij,ij->i", xyz, xyz)), 1e-3)
+
+        # The stride along an axis is the wanted spacing divided by the distance between neighbouring points along that axis
+        # (log2 of the latter is subtracted here, so that only log2 of the spacing must be added in each iteration).
+        column_base = -np.log2(distances * self.column_angle)
+        row_base = -np.log2(distances * self.beam_angle)
+        max_column_exponent = int(np.log2(self.width))
+        max_row_exponent = int(np.log2(self.height))
+
+        def keep(spacing):
+            column_strides = np.left_shift(1, RangeImage._stride_exponents(spacing, column_base, max_column_exponent))
+            row_strides = np.left_shift(1, RangeImage._stride_exponents(spacing, row_base, max_row_exponent))
+            return (np.bitwise_and(columns, column_strides - 1) == 0) & (np.bitwise_and(rows, row_strides - 1) == 0)
+
+        # Binary search (on a logarithmic scale) for the smallest spacing that keeps at most budget points.
+        low = np.log(1e-3)
+        high = np.log(1e3)
+        for i in range(iterations):
+            middle = (low + high) / 2
+            if np.count_nonzero(keep(np.exp(middle))) > budget:
+                low = middle
+            else:
+                high = middle
+
+        return np.flatnonzero(keep(np.exp(high)))
+
+    def extract_features(self, xyz, pixels, sectors=8, edges_per_sector=4, planes_per_sector=8, neighbours=5, edge_threshold=0.1, plane_threshold=0.1, max_distance_ratio=0.25):
+        """Extracts LOAM-style edge and planar feature points. The curvature of each point is calculated from its neighbours
+        on the same beam (row), and each row is divided into sectors, which are again divided into one bin per feature.
+        The point with the highest curvature in each edge bin is an edge point if the curvature is above edge_threshold,
+        and the point with the lowest curvature in each planar bin is a planar point if it is below plane_threshold. This
+        spreads the features evenly around the sensor, with at most (edges|planes)_per_sector features per sector and row.
+
+        Points that are missing neighbours, or are next to a depth discontinuity (where the curvature is unreliable due to
+        occlusion), are never selected. Returns (edge indices, planar indices) into the given points."""
+
+        points, valid = self.organize(xyz, pixels)
+        distances = np.sqrt(np.einsum("ijk,ijk->ij", points, points))
+
+        # Sum of the differences to the neighbours on both sides (the columns wrap around).
+        differences = np.zeros_like(points)
+        usable = valid.copy()
+        for offset in range(1, neighbours + 1):
+            for direction in [-offset, offset]:
+                neighbour = np.roll(points, direction, axis=1)
+                neighbour_distances = np.roll(distances, direction, axis=1)
+                differences += neighbour - points
+                usable &= np.roll(valid, direction, axis=1)
+                usable &= np.abs(neighbour_distances - distances) <= max_distance_ratio * distances
+
+        # The curvature is the squared length of the summed differences, as in A-LOAM (zero on a straight line or flat surface).
+        curvature = np.einsum("ijk,ijk->ij", differences, differences)
+
+        edge_curvature = np.where(usable, curvature, -np.inf)
+        plane_curvature = np.where(usable, curvature, np.inf)
+
+        def select(values, bins, best, accept):
+            if self.width % bins != 0:
+                raise ValueError("The number of feature bins per row (" + str(bins) + ") must divide the number of columns (" + str(self.width) + ").")
+            binned = values.reshape((self.height, bins, self.width // bins))
+            columns = best(binned, axis=2)
+            rows = np.repeat(np.arange(self.height), bins)
+            columns = (columns + np.arange(bins) * (self.width // bins)).reshape(-1)
+            keep = accept(values[rows, columns])
+            return self.destaggered_pixels[rows[keep], columns[keep]]
+
+        edge_pixels = select(edge_curvature, sectors * edges_per_sector, np.argmax, lambda c: (c > edge_threshold) & np.isfinite(c))
+        plane_pixels = select(plane_curvature, sectors * planes_per_sector, np.argmin, lambda c: c < plane_threshold)
+
+        # Convert the selected pixels back to indices into the given points.
+        indices = np.full(self.size, -1, dtype=np.int64)
+        indices[pixels] = np.arange(len(pixels))
+
+        return indices[edge_pixels], indices[plane_pixels]
@@ -1,55 +1,70 @@
 from pcap.pcapReader import PcapReader
+import threading
 from tqdm import tqdm
 from sbet.sbetParser import SbetParser
+from sbet.trajectory import Trajectory
 import numpy as np
 
 class SerialPcapReader:
 
     def __init__(self, pcap_paths, meta_data_paths, skip_frames=0, args=None):
+
+        # The readers share the sensor metadata, SBET data and static pixel mask (see SharedResources), so these are only read once.
         self.readers = [PcapReader(x[0], x[1], skip_frames, args=args) for x in zip(pcap_paths, meta_data_paths)]
         self.current_reader_index = 0
         self._set_metadata()
 
+        # If prefetching is activated, the next file is prepared in the background while the current one is being read.
+        self.prepare_next_reader = getattr(args, "prefetch", 0) > 0
+        self.preparing_thread = None
+
     def count_frames(self, show_progress):
         return sum([x.count_frames(False) for x in tqdm(self.readers, ascii=True, desc="Counting frames", disable=not show_progress)])
 
     def reset(self):
+        if self.preparing_thread is not None:
+            self.preparing_thread.join()
+            self.preparing_thread = None
+
         for reader in self.readers:
             reader.reset()
         self.current_reader_index = 0
         self._set_metadata()
 
     def _next_reader(self):
+        if self.preparing_thread is not None:
+            self.preparing_thread.join()
+            self.preparing_thread = None
+
         self.current_reader_index += 1
         self._set_metadata()
 
-    def _set_metadata(self):
-        self.pcap_path = None if self.current_reader_index >= len(self.readers) else self.readers[self.current_reader_index].pcap_path
-
-    def skip_and_get(self, iterator):
+    def _prepare_next_reader(self):
+        """Prepares the reader after the current one in a background thread, so that it is ready when the current one runs out."""
 
-        if self.current_reader_index >= len(self.readers):
-            return None
+        if not self.prepare_next_reader or self.preparing_thread is not None or self.current_reader_index + 1 >= len(self.readers):
+            return
 
-        frame = self.readers[self.current_reader_index].skip_and_get(iterator)
-        if frame is None:
-            self._next_reader()
-            return self.skip_and_get(iterator)
+        self.preparing_thread = threading.Thread(target=self.readers[self.current_reader_index + 1].prepare, daemon=True)
+        self.preparing_thread.start()
 
-        return frame
+    def _set_metadata(self):
+        self.pcap_path = None if self.current_reader_index >= len(self.readers) else self.readers[self.current_reader_index].pcap_path
 
     def get_sbet_data(self):
         return self.readers[self.current_reader_index].get_sbet_data()
 
     def get_coordinates(self, rotate=True, show_progress=False):
-        """Returns a list of coordinates (SbetRow) corresponding to each LidarPacket in the current Pcap file."""
+        """Returns the coordinates (a Trajectory) corresponding to each LidarPacket in all the Pcap files."""
 
-        coordinates = []
+        trajectories = []
         self.readers_first_coordinate_index = []
         
         for reader in tqdm(self.readers, ascii=True, desc="Extracting coordinates", disable=not show_progress):
-            self.readers_first_coordinate_index.append(len(coordinates))
-            coordinates.extend(reader.get_coordinates(False))
+            self.readers_first_coordinate_index.append(sum([len(x) for x in trajectories]))
+            trajectories.append(reader.get_coordinates(False))
+
+        coordinates = Trajectory.concatenate(trajectories)
         
         return SbetParser.rotate_points(coordinates, coordinates[0].heading - np.pi / 2) if rotate else coordinates
 
@@ -60,6 +75,20 @@ class SerialPcapReader:
 
         return ix
 
+    def get_frame_features(self):
+        return self.readers[min(self.current_reader_index, len(self.readers) - 1)].get_frame_features()
+
+    def skip(self, count):
+        """Skips the given number of frames (across file boundaries) without decoding them. Returns the number of frames that were skipped."""
+
+        skipped = 0
+        while skipped < count and self.current_reader_index < len(self.readers):
+            skipped += self.readers[self.current_reader_index].skip(count - skipped)
+            if skipped < count:
+                self._next_reader()
+
+        return skipped
+
     def print_info(self, frame_index=None, print_func=print):
         for reader in self.readers:
             reader.print_info(frame_index, print_func)
@@ -67,6 +96,10 @@ class SerialPcapReader:
     def remove_vehicle(self, frame, cloud=None):
         return self.readers[0].remove_vehicle(frame, cloud)
 
+    def add_frame_filter(self, stage):
+        for reader in self.readers:
+            reader.add_frame_filter(stage)
+
     def next_frame(self, remove_vehicle:bool=False, timer=None, colored=True, max_distance=None):
         if self.current_reader_index >= len(self.readers):
             return None
@@ -76,6 +109,9 @@ class SerialPcapReader:
             self._next_reader()
             return self.next_frame(remove_vehicle, timer, colored, max_distance)
 
+        if self.is_first_frame_in_file():
+            self._prepare_next_reader()
+
         return frame
 
     def get_pcap_path(self):
@@ -91,4 +127,7 @@ class SerialPcapReader:
             frames.append(frame)
 
     def is_first_frame_in_file(self):
-        return self.readers[self.current_reader_index].is_first_frame_in_file()
\ No newline at end of file
+        return self.readers[self.current_reader_index].is_first_frame_in_file()
+
+    def get_current_frame_index_including_skips(self):
+        return self.readers[self.current_reader_index].get_current_frame_index_including_skips()
\ No newline at end of file
@@ -1,5 +1,6 @@
 from pcap.bufferedPcapReader import BufferedPcapReader
 from pcap.pcapReaderHelper import PcapReaderHelper
+from pcap.frameFilter import VehicleFilter
 from utils.open3dVisualizer import Open3DVisualizer
 import argparse
 import open3d as o3d
@@ -17,15 +18,15 @@ class PcapBrowser:
         self.vis = Open3DVisualizer()
         self.save_screenshots_to = args.save_screenshots_to
 
-        browser = self
         class RemoveVehicleProcessor:
 
             def process(self, cloud):
                 xyz = np.asarray(cloud.points)
                 colors = np.asarray(cloud.colors)
                 
-                colors = browser.reader.remove_vehicle(xyz, colors)
-                xyz = browser.reader.remove_vehicle(xyz)
+                mask = VehicleFilter().mask(xyz)
+                xyz = xyz[mask]
+                colors = colors[mask]
 
                 cloud = o3d.geometry.PointCloud(o3d.utility.Vector3dVector(xyz))
                 cloud.colors = o3d.utility.Vector3dVector(colors)
@@ -66,7 +67,7 @@ class PcapBrowser:
             self.reader.max_distance += 1
             print("Max distance:", self.reader.max_distance)
             
-            self.reader.invalidate_cache()
+            # The reader filters the buffered frames every time they are retrieved, so there is no need to read them again.
             self.set_frame(self._currentFrame)
 
         def key_decrease_max_distance(vis):
@@ -79,7 +80,7 @@ class PcapBrowser:
 
             print("Max distance:", self.reader.max_distance)
             
-            self.reader.invalidate_cache()
+            # The reader filters the buffered frames every time they are retrieved, so there is no need to read them again.
             self.set_frame(self._currentFrame)
 
         self.vis.register_key_callback(262, key_next) # Arrow right
@@ -135,6 +136,7 @@ if __name__ == "__main__":
 
     parser = argparse.ArgumentParser()
     PcapReaderHelper.add_path_arguments(parser, browsing_only=True)
+    parser.add_argument('--frame-buffer-size', type=int, default=1024, required=False, help="The maximum size (in MB) of the buffer with raw frames. When the buffer is full, the least recently shown frames are thrown out, and must be read again from the PCAP file if they are needed.")
     parser.add_argument('--save-screenshots-to', type=str, default=None, required=False, help="If given, point cloud screenshots will be saved in this directory with their indices as filenames (0.png, 1.png, 2.png, etc). Only works if --preview is set to 'always'.")
     args = parser.parse_args()
 
@@ -4,9 +4,18 @@ import laspy
 import numpy as np
 import open3d as o3d
 import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
 
 from tqdm import tqdm
 from utils.open3dVisualizer import Open3DVisualizer
+from cloud.tiledCloud import TiledCloud
+from cloud.compactCloud import CompactCloud
+from cloud.corridor import Corridor
+from cloud.voxelDownsampler import VoxelDownsampler
+from cloud.cloudPyramid import CloudPyramid
+from sbet.sbetParser import SbetParser
+from pcap.pcapReaderHelper import PcapReaderHelper
 
 class PointCloudPart:
 
@@ -17,6 +26,9 @@ class PointCloudPart:
     def is_relevant(self, x, y):
         return self.file.header.x_min < x and self.file.header.x_max > x and self.file.header.y_min < y and self.file.header.y_max > y
 
+    def is_relevant_for_corridor(self, corridor):
+        return corridor.intersects([self.file.header.x_min, self.file.header.y_min], [self.file.header.x_max, self.file.header.y_max])
+
     def load(self):
         self.contents = laspy.read(self.location)
         return self.contents
@@ -35,76 +47,121 @@ class PointCloud:
     def get_relevant(self, x, y):
 
         for f in self.files:
-            if True:#f.is_relevant(x, y):
+            if f.is_relevant(x, y):
                 yield f.load()
             else:
-                pass #f.unload()
+                f.unload()
 
-    def to_absolute(self, vector, lowest):
+    @staticmethod
+    def to_absolute(vector, lowest):
         return int(lowest) + vector / 1000.0
 
-    def read_all(self, preview = 'never', max_files=-1, voxel_size=None):
+    @staticmethod
+    def to_cloud(points):
+        cloud = o3d.geometry.PointCloud()
+        cloud.points = o3d.utility.Vector3dVector(points)
+        return cloud
+
+    @staticmethod
+    def run_jobs(function, jobs, workers, desc, finish):
+        """Runs function(*job) for each of the given jobs in a pool of worker processes, and calls finish(job index, result)
+        (in this process) as each job is finished."""
+
+        with tqdm(total=len(jobs), desc=desc) as pbar:
+
+            # With a single worker (or a single file), there's nothing to gain from starting new processes.
+            if workers <= 1 or len(jobs) == 1:
+                for (i, job) in enumerate(jobs):
+                    finish(i, function(*job))
+                    pbar.update(1)
+                return
+
+            with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as executor:
+                futures = { executor.submit(function, *job): i for (i, job) in enumerate(jobs) }
+                for future in as_completed(futures):
+                    finish(futures[future], future.result())
+                    pbar.update(1)
 
-        full_cloud = o3d.geometry.PointCloud()
+    def read_all(self, preview = 'never', max_files=-1, voxel_sizes=None, corridor=None, workers=1, chunk_size=0):
+        """Reads (and optionally downsamples) the point cloud. Returns a list of (cloud, metadata), with one cloud for each
+        of the given voxel sizes (from the smallest to the largest), or a single cloud if no voxel sizes are given."""
 
         # List all .laz files in the given directory
         files = [os.path.join(self.location, x) for x in os.listdir(self.location) if x.lower().endswith(".laz")]
 
+        # If a corridor is given, only use the files that intersect it
+        if corridor is not None:
+            files = [x.location for x in tqdm(self.files, "Finding files in corridor") if x.is_relevant_for_corridor(corridor)]
+            if len(files) < 1:
+                raise Exception("None of the .laz files intersect the corridor.")
+
         if max_files > 0 and len(files) > max_files:
             files = files[0:max_files]
 
         offsets = []
+        maxes = []
+        counts = []
         for file in tqdm(files, "Calculating common offset"):
-            # Use laspy.open to read only the header, and extract the min values.
+            # Use laspy.open to read only the header, and extract the min/max values and point count.
             with laspy.open(file) as las:
                 offsets.append([las.header.x_min, las.header.y_min, las.header.z_min])
+                maxes.append([las.header.x_max, las.header.y_max, las.header.z_max])
+                counts.append(las.header.point_count)
 
         x_min_all = min([x[0] for x in offsets])
         y_min_all = min([x[1] for x in offsets])
         z_min_all = min([x[2] for x in offsets])
 
         self.common_offset = [x_min_all, y_min_all, z_min_all]
-        
-        for file in tqdm(files, "Reading point cloud"):
-                
-            # Read the .laz file (which is one part of the total point cloud)
-            las = laspy.read(file)
-
-            # Transform coordinates to fit the actual coordinate system
-            x = self.to_absolute(las.X, las.header.x_min - x_min_all)
-            y = self.to_absolute(las.Y, las.header.y_min - y_min_all)
-            z = self.to_absolute(las.Z, las.header.z_min - z_min_all)
-
-            # Merge X, Y and Z values together to a 3D array
-            point_data = np.stack([x, y, z], axis=0).transpose((1, 0))
-
-            # Create an open3d point cloud
-            partial_cloud = o3d.geometry.PointCloud()
-            partial_cloud.points = o3d.utility.Vector3dVector(point_data)
-
-            full_cloud += partial_cloud
-
-            if preview == 'always':
-                self.visualizer.show_frame(full_cloud)
-                self.visualizer.refresh_non_blocking()
 
-        if voxel_size is not None:
-            with tqdm(total=1, desc="Downsampling") as pbar:
-                self.original_point_count = len(full_cloud.points)
-                full_cloud = full_cloud.voxel_down_sample(voxel_size=voxel_size)
-                self.downsampled_point_count = len(full_cloud.points)
-                pbar.update(1)
+        voxel_sizes = sorted(voxel_sizes or [])
+
+        # The files are only read once. When downsampling in chunks, the larger voxel sizes are derived from the smaller
+        # ones: from the largest smaller voxel size that it is a multiple of (which gives the exact same result as
+        # downsampling the original points), or from the smallest voxel size. Otherwise, every voxel size is downsampled
+        # from the full cloud. (levels is a list of (voxel size, cloud, original point count))
+        levels = []
+        if len(voxel_sizes) > 0 and chunk_size > 0:
+            downsamplers = [self.read_downsampled(files, np.amin(offsets, axis=0), np.amax(maxes, axis=0), voxel_sizes[0], corridor, workers, chunk_size)]
+
+            for voxel_size in tqdm(voxel_sizes, "Downsampling"):
+                if voxel_size != downsamplers[-1].voxel_size:
+                    source = next((x for x in reversed(downsamplers) if x.divides(voxel_size)), downsamplers[0])
+                    downsamplers.append(source.coarsen(voxel_size))
+                levels.append((voxel_size, PointCloud.to_cloud(downsamplers[-1].get_points()), downsamplers[-1].point_count))
+        else:
+            full_cloud = self.read_points(files, counts, preview, corridor, workers)
+
+            if len(voxel_sizes) < 1:
+                levels.append((None, full_cloud, None))
+            else:
+                # Downsampling an already downsampled cloud would average the averages, giving sparse voxels too much weight.
+                for voxel_size in tqdm(voxel_sizes, "Downsampling"):
+                    levels.append((voxel_size, full_cloud.voxel_down_sample(voxel_size=voxel_size), len(full_cloud.points)))
+                del full_cloud
 
         if preview != 'never':
             #self.visualizer.show_frame(full_cloud)
             #self.visualizer.run()
-            o3d.visualization.draw_geometries([full_cloud])
+            o3d.visualization.draw_geometries([levels[0][1]])
+
+        # All clouds are moved with the offset of the first (most detailed) cloud, so that they can be used together
+        # (see CloudPyramid).
+        results = [self.finish_cloud(*levels[0])]
+        for level in levels[1:]:
+            results.append(self.finish_cloud(*level, offset=np.array(results[0][1]["point_cloud_offset"])))
+
+        return results
+
+    def finish_cloud(self, voxel_size, full_cloud, original_point_count, offset=None):
+        """Moves the given cloud towards the origin (with the given offset, or an offset calculated from the cloud), and
+        returns it together with its metadata."""
 
         with tqdm(total=1, desc="Counting") as pbar:
             points = np.asarray(full_cloud.points)
             self.cloud_mins = np.amin(points, axis=0)
             self.cloud_maxes = np.amax(points, axis=0)
-            self.full_point_cloud_offset = (self.cloud_maxes - self.cloud_mins) / 2
+            self.full_point_cloud_offset = (self.cloud_maxes - self.cloud_mins) / 2 if offset is None else offset
             
             points -= self.full_point_cloud_offset
             full_cloud = o3d.geometry.PointCloud()
@@ -114,7 +171,71 @@ class PointCloud:
 
             pbar.update(1)
 
-        return full_cloud
+        metadata = { 
+            "offset": self.total_offset, 
+            "common_offset": self.common_offset, 
+            "point_cloud_offset": self.full_point_cloud_offset.tolist(), 
+            "mins": self.cloud_mins.tolist(), 
+            "maxes": self.cloud_maxes.tolist()
+        }
+        if voxel_size is not None:
+            metadata["voxel_size"] = voxel_size
+            metadata["original_point_count"] = original_point_count
+            metadata["downsampled_point_count"] = len(full_cloud.points)
+
+        return (full_cloud, metadata)
+
+    def read_points(self, files, counts, preview, corridor, workers):
+        """Reads all points in the given files into a single point cloud."""
+
+        # Preallocate a single (shared) array for all points using the point counts from the headers. Each file is
+        # decoded (in a pool of worker processes) directly into its own part of the array, instead of merging the
+        # files into a growing cloud (which copies the entire cloud once per file).
+        starts = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        total = int(starts[-1])
+        shared = shared_memory.SharedMemory(create=True, size=max(total * 3 * 8, 1))
+        points = np.ndarray((total, 3), dtype=np.float64, buffer=shared.buf)
+
+        try:
+            jobs = [(file, shared.name, total, int(starts[i]), self.common_offset, corridor) for (i, file) in enumerate(files)]
+
+            # The number of points actually written for each file (fewer than the header count if a corridor is given)
+            written = [0] * len(files)
+
+            def finish(i, count):
+                written[i] = count
+
+                if preview == 'always':
+                    self.visualizer.show_frame(PointCloud.to_cloud(np.concatenate([points[starts[j]:starts[j] + written[j]] for j in range(len(files))])))
+                    self.visualizer.refresh_non_blocking()
+
+            PointCloud.run_jobs(read_part, jobs, workers, "Reading point cloud", finish)
+
+            # Move the parts together if some points were left out, then copy the points into an open3d point cloud
+            filled = 0
+            for i in range(len(files)):
+                if filled != starts[i]:
+                    points[filled:filled + written[i]] = points[starts[i]:starts[i] + written[i]]
+                filled += written[i]
+
+            return PointCloud.to_cloud(points[:filled])
+
+        finally:
+            del points
+            shared.close()
+            shared.unlink()
+
+    def read_downsampled(self, files, mins, maxes, voxel_size, corridor, workers, chunk_size):
+        """Reads and downsamples the given files chunk by chunk (see VoxelDownsampler), so that the full resolution cloud
+        is never kept in memory. Each worker process downsamples one file, and the results are merged into the returned
+        VoxelDownsampler."""
+
+        downsampler = VoxelDownsampler(voxel_size, mins, maxes)
+        jobs = [(file, chunk_size, voxel_size, mins, maxes, self.common_offset, corridor) for file in files]
+
+        PointCloud.run_jobs(downsample_part, jobs, workers, "Reading and downsampling point cloud", lambda i, run: downsampler.add_run(*run))
+
+        return downsampler
 
 
 def load_point_cloud(path):
@@ -124,6 +245,86 @@ def load_point_cloud(path):
 
     o3d.visualization.draw_geometries([full_cloud])
 
+def read_part(file, shared_name, total, start, common_offset, corridor=None):
+    """Reads a single .laz file into the shared point array (with the given name and total size), starting at the given
+    index. Returns the number of points that were written. Defined at module level so that it can be run in a worker process."""
+
+    # Read the .laz file (which is one part of the total point cloud)
+    las = laspy.read(file)
+
+    # Transform coordinates to fit the actual coordinate system
+    x = PointCloud.to_absolute(las.X, las.header.x_min - common_offset[0])
+    y = PointCloud.to_absolute(las.Y, las.header.y_min - common_offset[1])
+    z = PointCloud.to_absolute(las.Z, las.header.z_min - common_offset[2])
+
+    # Merge X, Y and Z values together to a 3D array
+    point_data = np.stack([x, y, z], axis=0).transpose((1, 0))
+
+    # Only keep the points within the corridor (using the actual coordinates of the points)
+    if corridor is not None:
+        point_data = point_data[corridor.contains(np.column_stack([las.x, las.y]))]
+
+    shared = shared_memory.SharedMemory(name=shared_name)
+    try:
+        points = np.ndarray((total, 3), dtype=np.float64, buffer=shared.buf)
+        points[start:start + len(point_data)] = point_data
+        del points
+    finally:
+        shared.close()
+
+    return len(point_data)
+
+def downsample_part(file, chunk_size, voxel_size, mins, maxes, common_offset, corridor=None):
+    """Reads and downsamples a single .laz file chunk by chunk. Returns the voxels as a reduced run (see VoxelDownsampler.get_run).
+    Defined at module level so that it can be run in a worker process."""
+
+    downsampler = VoxelDownsampler(voxel_size, mins, maxes)
+
+    with laspy.open(file) as las:
+        for chunk in las.chunk_iterator(chunk_size):
+
+            # Transform coordinates to fit the actual coordinate system (see read_part)
+            x = PointCloud.to_absolute(chunk.X, las.header.x_min - common_offset[0])
+            y = PointCloud.to_absolute(chunk.Y, las.header.y_min - common_offset[1])
+            z = PointCloud.to_absolute(chunk.Z, las.header.z_min - common_offset[2])
+            point_data = np.stack([x, y, z], axis=0).transpose((1, 0))
+
+            # The voxels are found using the actual coordinates of the points, so that the grid is the same for all files
+            xyz = np.column_stack([chunk.x, chunk.y, chunk.z])
+
+            if corridor is not None:
+                mask = corridor.contains(xyz)
+                xyz = xyz[mask]
+                point_data = point_data[mask]
+
+            downsampler.add(xyz, point_data)
+
+    return downsampler.get_run()
+
+def create_corridor(args):
+    """Creates the corridor around the route given by --corridor-from-sbet (and --corridor-from-pcap), or returns None."""
+
+    if args.corridor_from_sbet is None:
+        if args.corridor_from_pcap is not None:
+            raise Exception("--corridor-from-pcap requires --corridor-from-sbet (the SBET file with the coordinates of the PCAP files).")
+        return None
+
+    with tqdm(total=1, desc="Reading corridor route") as pbar:
+
+        if args.corridor_from_pcap is not None:
+            # Use only the part of the route that is covered by the given PCAP files.
+            reader_args = argparse.Namespace(sbet=args.corridor_from_sbet, sbet_noise=None, sbet_noise_from_frame_ix=0, sbet_crs_from=args.sbet_crs_from, sbet_crs_to=args.sbet_crs_to, max_frame_radius=None, recreate_caches=False)
+            route = PcapReaderHelper.from_lists(args.corridor_from_pcap, args=reader_args).get_coordinates(rotate=False)
+        else:
+            # Without PCAP files there are no file names to derive the GPS epoch from, so it must be given explicitly.
+            sbet = SbetParser(args.corridor_from_sbet, None, 0, args.sbet_crs_from, args.sbet_crs_to)
+            sbet.gps_epoch = args.corridor_gps_epoch
+            route = sbet.get_rows()
+
+        pbar.update(1)
+
+    return Corridor(route.xyz(), args.corridor_width)
+
 def process_args(args):
     if args.show is not None:
         load_point_cloud(args.show)
@@ -133,40 +334,105 @@ def process_args(args):
         raise Exception("The following arguments are required unless --show is given: --create-from")
         return
 
+    if args.write_pyramid is not None and args.voxel_size is None:
+        raise Exception("--write-pyramid requires one or more voxel sizes (--voxel-size).")
+
+    if args.chunk_size > 0 and args.voxel_size is not None and args.preview == "always":
+        raise Exception("--preview always can't be used when downsampling in chunks (--chunk-size), since the full cloud is never assembled.")
+
+    corridor = create_corridor(args)
+
     reader = PointCloud(args.create_from)
-    cloud = reader.read_all(args.preview, args.max_files, args.voxel_size)
+    levels = reader.read_all(args.preview, args.max_files, args.voxel_size, corridor, args.workers, args.chunk_size)
+
+    for (cloud, metadata) in levels:
+        if corridor is not None:
+            metadata["corridor_width"] = args.corridor_width
+
+        # With multiple voxel sizes, each cloud is written with the voxel size (in millimeters) added to the paths.
+        voxel_size = metadata.get("voxel_size") if len(levels) > 1 else None
+        write_cloud(args, cloud, metadata, voxel_size)
 
-    if args.write_to is not None:
-        with tqdm(total=1, desc="Estimating normals") as pbar:
-            cloud.estimate_normals(search_param=o3d.geometry.KDTreeSearchParamHybrid(radius=0.1, max_nn=30))
+    if args.write_pyramid is not None:
+        with tqdm(total=1, desc="Writing pyramid manifest") as pbar:
+            CloudPyramid.write_manifest(args.write_pyramid, [(metadata["voxel_size"], metadata) for (_, metadata) in levels])
             pbar.update(1)
+
+def get_level_path(path, voxel_size):
+    """Adds the given voxel size (in millimeters) to the given path (for example combined.pcd -> combined_050.pcd), if given."""
+
+    if path is None or voxel_size is None:
+        return path
+
+    (root, extension) = os.path.splitext(path)
+    return root + "_" + str(int(round(voxel_size * 1000))).zfill(3) + extension
+
+def estimate_normals(cloud, radius):
+    with tqdm(total=1, desc="Estimating normals") as pbar:
+        cloud.estimate_normals(search_param=o3d.geometry.KDTreeSearchParamHybrid(radius=radius, max_nn=30))
+        pbar.update(1)
+
+def write_cloud(args, cloud, metadata, voxel_size=None):
+
+    write_to = get_level_path(args.write_to, voxel_size)
+    write_tiles = get_level_path(args.write_tiles, voxel_size)
+    write_compact = get_level_path(args.write_compact, voxel_size)
+    write_pyramid = CloudPyramid.get_level_path(args.write_pyramid, metadata["voxel_size"]) if args.write_pyramid is not None else None
+
+    if write_to is not None or write_tiles is not None or write_compact is not None:
+        estimate_normals(cloud, 0.1)
+
+    if write_to is not None:
         with tqdm(total=1, desc="Writing cloud") as pbar:
-            o3d.io.write_point_cloud(args.write_to, cloud, compressed=False)
+            o3d.io.write_point_cloud(write_to, cloud, compressed=False)
             pbar.update(1)
         with tqdm(total=1, desc="Writing metadata") as pbar:
-            with open(args.write_to.replace(".pcd", "-meta.json"), "w") as outfile:
-                metadata = { 
-                    "offset": reader.total_offset, 
-                    "common_offset": reader.common_offset, 
-                    "point_cloud_offset": reader.full_point_cloud_offset.tolist(), 
-                    "mins": reader.cloud_mins.tolist(), 
-                    "maxes": reader.cloud_maxes.tolist()
-                }
-                if args.voxel_size is not None:
-                    metadata["voxel_size"] = args.voxel_size
-                    metadata["original_point_count"] = reader.original_point_count
-                    metadata["downsampled_point_count"] = reader.downsampled_point_count
+            with open(write_to.replace(".pcd", "-meta.json"), "w") as outfile:
                 json.dump(metadata, outfile)
             pbar.update(1)
 
+    if write_tiles is not None:
+        with tqdm(total=1, desc="Writing tiles") as pbar:
+            TiledCloud.write(cloud, write_tiles, args.tile_size, metadata)
+            pbar.update(1)
+
+    if write_compact is not None:
+        with tqdm(total=1, desc="Writing compact cloud") as pbar:
+            CompactCloud.write(write_compact, cloud, metadata, cell_size=args.index_cell_size, normal_format=args.normals_format)
+            pbar.update(1)
+
+    if write_pyramid is not None:
+        # The coarse levels of a pyramid have too few points within the usual radius, so it grows with the voxel size
+        # (only for the pyramid level, so that the other outputs get the same normals as without --write-pyramid).
+        radius = max(0.1, 3 * metadata["voxel_size"])
+        if radius != 0.1 or not cloud.has_normals():
+            estimate_normals(cloud, radius)
+
+        with tqdm(total=1, desc="Writing pyramid level") as pbar:
+            CompactCloud.write(write_pyramid, cloud, metadata, cell_size=args.index_cell_size, normal_format="int8" if args.normals_format == "none" else args.normals_format)
+            pbar.update(1)
+
 if __name__ == "__main__":
 
     parser = argparse.ArgumentParser()
     parser.add_argument('--create-from', type=str, help="A directory containing the point cloud as .laz files.")
-    parser.add_argument('--voxel-size', type=float, default=None, help="If given, the point cloud will be downsampled with this voxel size.")
+    parser.add_argument('--voxel-size', type=float, nargs='+', default=None, help="If given, the point cloud will be downsampled with this voxel size. If multiple voxel sizes are given, the files are only read once, and one cloud is written for each voxel size (with the voxel size in millimeters added to the output paths, for example combined_050.pcd). Each voxel size is downsampled from the full cloud, or (with --chunk-size) derived from a smaller voxel size, exactly when it is a multiple of it (for example 0.05, 0.1 and 0.2).")
+    parser.add_argument('--chunk-size', type=int, default=0, help="If given (for example 5000000) together with --voxel-size, the .laz files are read and downsampled in chunks of this many points, so that the full resolution cloud is never kept in memory. The voxel grid is then aligned to the origin of the coordinate system instead of the bounds of the cloud (as in Open3D), so the result differs slightly from the default, where the full cloud is read and downsampled afterwards. Can't be combined with --preview always.")
     parser.add_argument('--preview', type=str, default="never", choices=['always', 'end', 'never'], help="Show constantly updated point cloud and data plot previews while processing ('always'), show them only at the end ('end'), or don't show them at all ('never').")
     parser.add_argument('--max-files', type=int, default=-1, help="Stop reading after the given number of files (useful for saving time while testing).")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="The number of worker processes used to decode the .laz files.")
     parser.add_argument('--write-to', type=str, default=None, help="Write the assembled point cloud to this location.")
+    parser.add_argument('--write-tiles', type=str, default=None, help="Write the assembled point cloud to this directory as tiles (one .pcd file per tile, and a manifest.json), which can be loaded lazily by absoluteNavigator.py (give the directory as --point-cloud).")
+    parser.add_argument('--tile-size', type=float, default=100, help="The size (in meters) of the tiles written by --write-tiles.")
+    parser.add_argument('--write-compact', type=str, default=None, help="Write the assembled point cloud to this location in the compact, memory mapped format (a .cloud file with float32 coordinates, see CompactCloud), which can be given as --point-cloud to absoluteNavigator.py.")
+    parser.add_argument('--write-pyramid', type=str, default=None, help="Write a point cloud pyramid with one level per --voxel-size (for example --voxel-size 0.1 0.2 0.5) to this manifest (a .pyramid.json file), with each level as a compact cloud next to it. When given as --point-cloud to absoluteNavigator.py, the early registration iterations are run against the coarse levels.")
+    parser.add_argument('--index-cell-size', type=float, default=5, help="The cell size (in meters) of the grid index stored in the files written by --write-compact and --write-pyramid. The --cloud-index-cell-size of absoluteNavigator.py can't change it for these files.")
+    parser.add_argument('--normals-format', type=str, default="int8", choices=CompactCloud.normal_formats, help="How normals are stored by --write-compact.")
+    parser.add_argument('--corridor-from-sbet', type=str, default=None, help="If given, only the points within --corridor-width from the route in this SBET file are kept (and only the .laz files intersecting the route are read).")
+    parser.add_argument('--corridor-from-pcap', type=str, nargs='+', default=None, help="If given (together with --corridor-from-sbet), the corridor only covers the part of the SBET route driven in these PCAP files (or directories with PCAP files).")
+    parser.add_argument('--corridor-width', type=float, default=40, help="The distance (in meters) from the route within which points are kept when --corridor-from-sbet is given. Should be larger than the --cloud-part-radius used for navigation.")
+    parser.add_argument('--corridor-gps-epoch', type=float, default=None, help="The GPS epoch (a decimal year, for example 2021.45) used to transform the --corridor-from-sbet route when --corridor-from-pcap isn't given (otherwise it is derived from the PCAP file names). If not given, the route is transformed without an epoch.")
+    PcapReaderHelper.add_sbet_arguments(parser, browsing_only=True)
     parser.add_argument("--show", type=str, help="A .pcd file to show -- will not do any processing, just show it.")
 
     args = parser.parse_args()
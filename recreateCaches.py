@@ -4,7 +4,7 @@ from tqdm import tqdm
 import os
 from glob import glob
 
-from pcap.pcapReader import PcapReader
+from pcap.preflight import Preflight
 from pcap.pcapReaderHelper import PcapReaderHelper
 
 if __name__ == "__main__":
@@ -12,6 +12,7 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('--root-directory', type=str, required=True, help="Recreate caches for all pcap files found recursively under the given root directory.")
     parser.add_argument('--recreate-caches', action='store_true', required=False, help="If True, existing caches will be re-created. If False, files with existing caches will be skipped.")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), required=False, help="The number of worker processes used to build the caches.")
     PcapReaderHelper.add_sbet_arguments(parser)
     args = parser.parse_args()
 
@@ -21,17 +22,11 @@ if __name__ == "__main__":
 
     files = list([x for x in chain.from_iterable(glob(os.path.join(x[0], '*.pcap')) for x in os.walk(args.root_directory)) if not x.endswith(".pcap.meta.json")])
 
-    failures = []
-    successes = 0
-    for pcap in tqdm(files, ascii=True, desc="Recreating caches"):
-        try:
-            reader = PcapReader(pcap, args=args)
-            reader.count_frames()
-            reader.get_coordinates()
-            successes += 1
-        except Exception as e:
-            failures.append(pcap)
-            tqdm.write(f"ERROR: {e}")
+    # Build the caches of all files in parallel. Each cache is saved as soon as its file is finished, so running this
+    # again (without --recreate-caches) after an interruption continues with the remaining files.
+    failures = Preflight.run([(pcap, None, 0, args) for pcap in files], args.workers)
+    for (pcap, error) in failures:
+        tqdm.write(f"ERROR ({pcap}): {error}")
 
-    tqdm.write(f"Succesful: {successes}")
-    tqdm.write(f"Failed: {failures}")
\ No newline at end of file
+    tqdm.write(f"Succesful: {len(files) - len(failures)}")
+    tqdm.write(f"Failed: {[x[0] for x in failures]}")
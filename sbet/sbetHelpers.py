@@ -7,6 +7,7 @@ Created on Mon Aug 29 13:34:01 2022
 
 import numpy as np
 import datetime
+import os
 
 # LEAP SECONDS
 DELTA_UNIX_GPS = 18
@@ -70,7 +71,14 @@ def read_sbet(sbet_filename, smrmsg_filename) -> np.array:
         ("unknown2", np.float64),
         ("unknown3", np.float64)
     ]
-    sbet_np = np.fromfile(sbet_filename, dtype=np.dtype(sbet_record_types))
-    smrmsg_np = np.fromfile(smrmsg_filename, dtype=np.dtype(smrmsg_record_types))
+    sbet_np = memmap_records(sbet_filename, np.dtype(sbet_record_types))
+    smrmsg_np = memmap_records(smrmsg_filename, np.dtype(smrmsg_record_types))
 
-    return sbet_np, smrmsg_np
\ No newline at end of file
+    return sbet_np, smrmsg_np
+
+# minnemapper filen (read-only), slik at bare radene som brukes faktisk leses fra disk
+def memmap_records(filename, dtype):
+    count = os.path.getsize(filename) // dtype.itemsize
+    if count < 1:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(filename, dtype=dtype, mode="r", shape=(count,))
\ No newline at end of file
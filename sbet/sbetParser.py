@@ -1,28 +1,35 @@
 from sbet.sbetHelpers import read_sbet, filename2gpsweek, filename2utc, timestamp_unix2sow, timestamp_sow2unix
 import os
 import numpy as np
-import open3d as o3d
-import csv
-import random
 from pyproj import Transformer
 
-from sbet.sbetRow import SbetRow
+from sbet.trajectory import Trajectory
+from utils.sharedResources import SharedResources
 
 class SbetParser:
 
-    def __init__(self, filename, random_noise, noise_from_frame_ix=0, crs_from=4258, crs_to=5972):
+    # Increased when the calculation of positions changes, to invalidate cached positions.
+    VERSION = 3
 
-        if filename.lower().endswith(".csv"):
-            self.rows = SbetParser.read_csv(filename)
-        else:
-            self.rows = SbetParser.read_latlon(filename, filename.replace(".out", "-smrmsg.out"))
+    # The columns that are read from the SBET files (all as float64).
+    columns = ["time", "lat", "lon", "alt", "roll", "pitch", "heading"]
+
+    def __init__(self, filename, random_noise, noise_from_frame_ix=0, crs_from=4258, crs_to=5972, time_window=None):
+
+        # The parsed rows and the transformer are shared by all parsers for the same file/CRS (for example
+        # one for each PCAP file in a SerialPcapReader), and must not be modified. The rows are read when they
+        # are first used, and only rows within the time window (if given, see set_time_window) are read.
+        self.filename = filename
+        self.filename_key = os.path.abspath(filename)
+        self.time_window = time_window
+        self.loaded_rows = None
+        self.loaded_columns = None
 
         self.random_noise = random_noise
         self.add_noise = random_noise is not None and (random_noise[0] > 0 or random_noise[1] > 0 or random_noise[2] > 0)
         self.noise_from_frame_ix = noise_from_frame_ix
 
         self.current_index = 0
-        self.row_count = len(self.rows)
 
         # Used for transforming read coordinates to the correct reference frame upon request.
         # Must be initialized with self.create_transformer, which is automatically called in 
@@ -33,16 +40,54 @@ class SbetParser:
 
         self.crs_from = crs_from
         self.crs_to = crs_to
-        self.transformer = Transformer.from_crs(self.crs_from, self.crs_to)
+        self.transformer = SharedResources.get("transformer", (self.crs_from, self.crs_to), lambda: Transformer.from_crs(self.crs_from, self.crs_to))
 
     def reset(self):
         self.current_index = 0
 
+    def set_time_window(self, start, end):
+        """Limits the rows that are read to the given time window (seconds of week). Must be set before the rows are used
+        to have any effect on the memory usage."""
+
+        if self.time_window != (start, end):
+            self.time_window = (start, end)
+            self.loaded_rows = None
+            self.loaded_columns = None
+
+    @property
+    def rows(self):
+        """The SBET rows (within the time window, if set) as a structured array with the columns in SbetParser.columns."""
+
+        if self.loaded_rows is None:
+            self.loaded_rows = SharedResources.get("sbet", (self.filename_key, self.time_window), lambda: SbetParser.read_rows(self.filename, self.time_window))
+        return self.loaded_rows
+
     def create_transformer(self, pcap_filename):
         self.gps_epoch = self.get_gps_epoch(pcap_filename)
         self.current_filename = pcap_filename
 
     def get_position(self, timestamp=None, pcap_filename=None, pcap_path=None, gps_week=None, continue_from_previous=False, frame_ix=-1):
+        """Returns the position (SbetRow) at the given timestamp (see get_positions). The lookup is a binary search, so
+        continue_from_previous is no longer needed, and only kept for compatibility."""
+
+        return self.get_positions([timestamp], pcap_filename, pcap_path, gps_week, frame_ix)[0]
+
+    def get_columns(self):
+        """Returns the SBET data as a dict of column arrays (time, lat, lon, alt, roll, pitch, heading)."""
+
+        if self.loaded_columns is None:
+            self.loaded_columns = SharedResources.get("sbet columns", (self.filename_key, self.time_window), lambda: SbetParser.to_columns(self.rows))
+        return self.loaded_columns
+
+    @staticmethod
+    def to_columns(rows):
+        return { name: np.ascontiguousarray(rows[name], dtype=np.float64) for name in SbetParser.columns }
+
+    def get_positions(self, timestamps, pcap_filename=None, pcap_path=None, gps_week=None, first_frame_ix=0, with_noise=True):
+        """Returns the positions (as a Trajectory) at the given timestamps (unix time in nanoseconds). All timestamps are looked up
+        at once using a binary search over the SBET time column, the position is interpolated between the SBET rows
+        before and after each timestamp, and all coordinates are transformed using a single call to the transformer.
+        If with_noise is True, noise is added (see apply_noise), where the frame index of the first timestamp is first_frame_ix."""
 
         if pcap_path is not None:
             pcap_filename = os.path.basename(pcap_path)
@@ -52,30 +97,75 @@ class SbetParser:
 
         if gps_week is None:
             gps_week = self.get_gps_week(pcap_path, pcap_filename)
-        
+
+        columns = self.get_columns()
+        times = columns["time"]
+
         # Calculate "Seconds of week", which is the time format used in the sbet files
-        sow = timestamp_unix2sow(timestamp / 1000000000, gps_week)
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        sow = timestamp_unix2sow(timestamps / 1000000000, gps_week)
 
-        start_ix = self.current_index if continue_from_previous else 1
-        for i in range(start_ix, self.row_count):
+        # The first row at or after each timestamp (timestamps before the first row use the first row).
+        following = np.maximum(np.searchsorted(times, sow, side="left"), 1)
 
-            if self.rows[i]["time"] >= sow:
-                self.current_index = i
-                sbetRow = SbetRow(self.rows[i-1], sow, i)
-                sbetRow.calculate_transformed(self.transformer, self.gps_epoch)
+        outside = following >= len(times)
+        if np.any(outside):
+            i = int(np.argmax(outside))
+            raise Exception(f"Failed to find a coordinate for the frame at index={first_frame_ix + i}, time={timestamps[i]}, sow={sow[i]}. Sbet file has coordinates from sow={times[0]} to sow={times[-1]}")
 
-                if self.add_noise and frame_ix > self.noise_from_frame_ix:
-                    sbetRow.x += random.uniform(-self.random_noise[0], self.random_noise[0])
-                    sbetRow.y += random.uniform(-self.random_noise[1], self.random_noise[1])
-                    sbetRow.alt += random.uniform(-self.random_noise[2], self.random_noise[2])
+        previous = following - 1
+        weights = np.clip((sow - times[previous]) / np.maximum(times[following] - times[previous], 1e-12), 0, 1)
 
-                return sbetRow
+        def interpolate(name):
+            values = columns[name]
+            return values[previous] + weights * (values[following] - values[previous])
 
-        self.current_index = 0
+        lat = interpolate("lat")
+        lon = interpolate("lon")
+        alt = interpolate("alt")
+        roll = interpolate("roll")
+        pitch = interpolate("pitch")
+
+        # The heading must be interpolated the shortest way around the circle.
+        headings = columns["heading"]
+        heading = SbetParser.wrap_angle(headings[previous] + weights * SbetParser.wrap_angle(headings[following] - headings[previous]))
 
-        raise Exception(f"Failed to find a coordinate for the frame at index={frame_ix}, time={timestamp}, sow={sow}. Sbet file has coordinates from sow={self.rows[0]['time']} to sow={self.rows[-1]['time']}")
+        x, y, z = self.transform_coordinates(lat, lon, alt)
+        x = np.array(x, dtype=np.float64)
+        y = np.array(y, dtype=np.float64)
+        z = np.array(z, dtype=np.float64)
 
-        return None
+        positions = Trajectory.from_columns(x=x, y=y, alt=z, roll=roll, pitch=pitch, heading=heading, sow=sow, age=sow - times[previous], lat=lat, lon=lon, alt_raw=alt, index=following)
+
+        if with_noise:
+            self.apply_noise(positions, first_frame_ix)
+
+        return positions
+
+    def apply_noise(self, positions, first_frame_ix=0):
+        """Adds random noise (see --sbet-noise) to the given positions (a Trajectory), for all frames after noise_from_frame_ix.
+        The frame index of the first position is given by first_frame_ix."""
+
+        if not self.add_noise:
+            return positions
+
+        count = len(positions)
+        noisy = first_frame_ix + np.arange(count) > self.noise_from_frame_ix
+        for (column, noise) in zip(["x", "y", "alt"], self.random_noise):
+            positions.column(column)[:] += np.where(noisy, np.random.uniform(-noise, noise, count), 0)
+
+        return positions
+
+    def get_cache_key(self):
+        """Returns everything the (noise free) positions depend on, used to invalidate cached positions when the SBET file or CRS changes."""
+
+        return {
+            "sbet": self.filename_key,
+            "sbet_mtime": int(os.path.getmtime(self.filename_key)),
+            "crs_from": self.crs_from,
+            "crs_to": self.crs_to,
+            "version": SbetParser.VERSION
+        }
 
     def get_gps_epoch(self, pcap_filename):
 
@@ -96,55 +186,125 @@ class SbetParser:
         return filename2gpsweek(pcap_filename)
 
     @staticmethod
-    def read_csv(filename):
-        # Can also read CSV files with the headers index,time,lat,lon,alt,heading (since some SBET files didn't work with this reader).
-        rows = []
-        with open(filename, newline='') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                row["index"] = int(row["index"])
-                row["time"] = float(row["time"])
-                row["lat"] = float(row["lat"])
-                row["lon"] = float(row["lon"])
-                row["alt"] = float(row["alt"])
-                row["roll"] = float(row["roll"])
-                row["pitch"] = float(row["pitch"])
-                row["heading"] = float(row["heading"])
-                rows.append(row)
+    def read_rows(filename, time_window=None):
+        if filename.lower().endswith(".csv"):
+            return SbetParser.read_csv(filename, time_window)
+        return SbetParser.read_latlon(filename, filename.replace(".out", "-smrmsg.out"), time_window)
+
+    @staticmethod
+    def get_window_slice(times, time_window):
+        """Returns the slice of the given (sorted) times that covers the time window, including the rows just outside
+        it (needed for interpolation). Only a few of the times are read, so this is cheap on memory mapped files."""
+
+        if time_window is None:
+            return slice(0, len(times))
+
+        start = max(int(np.searchsorted(times, time_window[0], side="left")) - 1, 0)
+        end = min(int(np.searchsorted(times, time_window[1], side="right")) + 1, len(times))
+
+        return slice(start, end)
+
+    @staticmethod
+    def to_rows(data, time_window=None):
+        """Copies the SBET columns of the rows within the time window to a compact structured array."""
+
+        data = data[SbetParser.get_window_slice(data["time"], time_window)]
+
+        rows = np.empty(len(data), dtype=[(name, np.float64) for name in SbetParser.columns])
+        for name in SbetParser.columns:
+            rows[name] = data[name]
+
         return rows
 
+    @staticmethod
+    def read_csv(filename, time_window=None):
+        # Can also read CSV files with the headers index,time,lat,lon,alt,roll,pitch,heading (since some SBET files didn't work with this reader).
+        with open(filename, newline='') as csvfile:
+            headers = [x.strip() for x in csvfile.readline().split(",")]
+            data = np.loadtxt(csvfile, delimiter=",", usecols=[headers.index(name) for name in SbetParser.columns], ndmin=2)
+
+        data = np.rec.fromarrays(data.T, names=SbetParser.columns, formats=[np.float64] * len(SbetParser.columns))
+
+        return SbetParser.to_rows(data, time_window)
 
     @staticmethod
-    def read_latlon(sbet_filename, smrmsg_filename):
+    def read_latlon(sbet_filename, smrmsg_filename, time_window=None):
 
+        # The files are memory mapped, so only the rows within the time window are actually read.
         (sbet, mmr) = read_sbet(sbet_filename, smrmsg_filename)
-        sbet = sbet[["time", "lat", "lon", "alt", "roll", "pitch", "heading"]]
-        sbet["lat"] = sbet["lat"] * 180 / np.pi
-        sbet["lon"] = sbet["lon"] * 180 / np.pi
-        
-        return sbet
-
-    def get_rows(self, rotate=False):
-        coords = [SbetRow(row).calculate_transformed(self.transformer, self.gps_epoch) for row in self.rows]
+        return SbetParser.to_degrees(SbetParser.to_rows(sbet, time_window))
+
+    @staticmethod
+    def to_degrees(rows):
+        rows["lat"] = rows["lat"] * 180 / np.pi
+        rows["lon"] = rows["lon"] * 180 / np.pi
+        return rows
+
+    @staticmethod
+    def read_row_chunks(filename, chunk_size=100000):
+        """Yields all rows in the given file in chunks of (at most) the given size. SBET files are memory mapped, so
+        only one chunk is in memory at a time."""
+
+        if filename.lower().endswith(".csv"):
+            rows = SbetParser.read_csv(filename)
+            for start in range(0, len(rows), chunk_size):
+                yield rows[start:start + chunk_size]
+            return
+
+        (sbet, mmr) = read_sbet(filename, filename.replace(".out", "-smrmsg.out"))
+        for start in range(0, len(sbet), chunk_size):
+            yield SbetParser.to_degrees(SbetParser.to_rows(sbet[start:start + chunk_size]))
+
+    @staticmethod
+    def count_rows(filename):
+        if filename.lower().endswith(".csv"):
+            return len(SbetParser.read_csv(filename))
+        return len(read_sbet(filename, filename.replace(".out", "-smrmsg.out"))[0])
+
+    def transform_coordinates(self, lat, lon, alt):
+        """Returns the given coordinates transformed to the target CRS as (x, y, z). The GPS epoch is only passed to the
+        transformer if it is known (otherwise the coordinates are transformed without a time)."""
+
+        if self.gps_epoch is None:
+            return self.transformer.transform(lat, lon, alt)
+
+        x, y, z, _ = self.transformer.transform(lat, lon, alt, np.full(len(lat), self.gps_epoch))
+        return x, y, z
+
+    def transform_rows(self, rows, indices):
+        """Returns the given rows (with the given row indices) as a Trajectory, with all coordinates transformed using a single call to the transformer."""
+
+        x, y, z = self.transform_coordinates(rows["lat"], rows["lon"], rows["alt"])
+
+        return Trajectory.from_columns(x=x, y=y, alt=z, roll=rows["roll"], pitch=rows["pitch"], heading=rows["heading"], sow=rows["time"], lat=rows["lat"], lon=rows["lon"], alt_raw=rows["alt"], index=indices)
+
+    def get_rows(self, rotate=False, decimate=1):
+        """Returns all rows (within the time window, if set) as a Trajectory with transformed coordinates. If decimate is larger
+        than 1, only every n-th row is returned."""
+
+        rows = self.rows[::decimate]
+        coords = self.transform_rows(rows, np.arange(len(rows)) * decimate)
+
         if not rotate:
             return coords
         return SbetParser.rotate_points(coords, coords[0].heading)
 
+    def get_row_chunks(self, chunk_size=100000):
+        """Yields all rows in the SBET file (ignoring the time window) as Trajectories with transformed coordinates, in
+        chunks of the given size, so that large files can be processed with a flat memory usage."""
+
+        first_index = 0
+        for rows in SbetParser.read_row_chunks(self.filename, chunk_size):
+            yield self.transform_rows(rows, first_index + np.arange(len(rows)))
+            first_index += len(rows)
+
+    @staticmethod
+    def wrap_angle(angles):
+        """Returns the given angles (in radians) wrapped to [-pi, pi)."""
+        return (angles + np.pi) % (2 * np.pi) - np.pi
+
     @staticmethod
     def rotate_points(coords, heading):
-        """ Returns all coordinates rotated by the given heading. """
-
-        transformed_path = o3d.geometry.LineSet(
-            points = o3d.utility.Vector3dVector([[p.x, p.y, p.alt] for p in coords]), lines = o3d.utility.Vector2iVector([])
-        )
-        R = transformed_path.get_rotation_matrix_from_xyz((0, 0, heading))
-        transformed_path.rotate(R, center=transformed_path.points[0])
-
-        for i in range(len(coords)):
-            c = coords[i]
-            c.lat = -1
-            c.lon = -1
-            c.x = transformed_path.points[i][0]
-            c.y = transformed_path.points[i][1]
-        
-        return coords
\ No newline at end of file
+        """ Returns all coordinates (a Trajectory) rotated by the given heading around the first coordinate. """
+
+        return coords.rotate(heading)
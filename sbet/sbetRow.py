@@ -5,31 +5,47 @@ class SbetRow:
     """
     A data row from an SBET file. Contains the original coordinates as lat/lon, and transformed (to 5972) as x and y. The heading is in radians,
     0 means straight north, positive PI/2 means straight east, negative PI/2 straight west.
+
+    An SbetRow is a view into one row of a Trajectory (or into its own single row, if created on its own), so that long
+    lists of positions can be stored as a single NumPy array. Changing the attributes of a row changes the trajectory.
     """
 
+    # The columns of each row (and of the Trajectory arrays). A frame_ix of -1 means that the row isn't tied to a frame.
+    # alt_raw is the altitude from the SBET file, which alt is transformed from (see calculate_transformed).
+    dtype = np.dtype([
+        ("x", np.float64), ("y", np.float64), ("alt", np.float64),
+        ("roll", np.float64), ("pitch", np.float64), ("heading", np.float64),
+        ("sow", np.float64), ("age", np.float64), ("frame_ix", np.int64),
+        ("lat", np.float64), ("lon", np.float64), ("alt_raw", np.float64), ("index", np.int64)
+    ])
+
+    __slots__ = ("source", "ix", "data", "radius")
+
     def __init__(self, row, sow=0, index=0, original=None, x=None, y=None):
 
+        # A row created on its own has its own single row array.
+        self.data = np.zeros(1, dtype=SbetRow.dtype)
+        self.data["frame_ix"] = -1
+        self.source = None
+        self.ix = 0
+
         if row is None and x is not None and y is not None:
             self.x = x
             self.y = y
-            self.alt = 0
-            self.sow = 0
-            self.lat = 0
-            self.lon = 0
-            self.age = 0
-            self.index = 0
-            self.roll = 0
-            self.pitch = 0
-            self.heading = 0
             return
 
         if original is not None:
 
+            if isinstance(original, SbetRow):
+                self.data[0] = original.record()
+                return
+
             if type(original) is not dict:
                 original = original.__dict__
 
             for key in original:
-                self.__dict__[key] = original[key]
+                if key in SbetRow.dtype.names:
+                    setattr(self, key, original[key])
 
             return
 
@@ -46,6 +62,20 @@ class SbetRow:
         self.x = -1
         self.y = -1
 
+    @staticmethod
+    def view(source, ix):
+        """Returns a row that is a view into row ix of the given source (an object with a data array, such as a Trajectory)."""
+
+        row = SbetRow.__new__(SbetRow)
+        row.source = source
+        row.ix = ix
+        return row
+
+    def record(self):
+        """Returns the NumPy record (a view) holding the values of this row."""
+
+        return (self.data if self.source is None else self.source.data)[self.ix]
+
     def __str__(self, include_lat_lon=True):
         return f'ix={self.index}' + (f', lat={self.lat}, lon={self.lon}, roll={self.roll}, pitch={self.pitch}, heading={self.heading}' if include_lat_lon else '') + f', alt={self.alt}, x={self.x}, y={self.y}, time={self.sow}, age={self.age}'
 
@@ -72,7 +102,7 @@ class SbetRow:
             json["age"] = self.age
             json["index"] = self.index
 
-        if "frame_ix" in self.__dict__:
+        if self.frame_ix >= 0:
             json["frame_ix"] = self.frame_ix
 
         return json
@@ -104,4 +134,17 @@ class SbetRow:
         return np.array([self.x, self.y, self.alt])
 
     def short_str(self):
-        return f"{self.x:.2f}, {self.y:.2f}"
\ No newline at end of file
+        return f"{self.x:.2f}, {self.y:.2f}"
+
+def _column_property(name):
+    def get(self):
+        return (self.data if self.source is None else self.source.data)[name][self.ix].item()
+
+    def set(self, value):
+        (self.data if self.source is None else self.source.data)[name][self.ix] = value
+
+    return property(get, set)
+
+# Each column is available as an attribute on the row (row.x, row.heading, etc).
+for _name in SbetRow.dtype.names:
+    setattr(SbetRow, _name, _column_property(_name))
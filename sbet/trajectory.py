@@ -0,0 +1,145 @@
+import numpy as np
+
+from sbet.sbetRow import SbetRow
+
+class Trajectory:
+    """
+    A list of positions (for example the SBET position of each frame), stored as one structured NumPy array with the
+    columns given by SbetRow.dtype (x, y, alt, roll, pitch, heading, sow, age, frame_ix, lat, lon, alt_raw and index).
+    Individual positions are returned as SbetRow views into the array, and operations on the whole trajectory
+    (translation, rotation, distances) are done on the columns directly.
+
+    The array grows by doubling its capacity when positions are appended, so views should not be kept across appends.
+    """
+
+    def __init__(self, count=0, capacity=None):
+        self.data = np.zeros(max(count, capacity or 0), dtype=SbetRow.dtype)
+        self.data["frame_ix"] = -1
+        self.count = count
+
+    @staticmethod
+    def from_columns(**columns):
+        """Creates a trajectory from the given columns (arrays of the same length). Columns that are not given are set to zero (or -1 for frame_ix)."""
+
+        count = len(next(iter(columns.values()))) if len(columns) > 0 else 0
+        trajectory = Trajectory(count)
+        for name in columns:
+            trajectory.data[name] = columns[name]
+        return trajectory
+
+    @staticmethod
+    def from_data(data):
+        """Creates a trajectory using the given structured array (with SbetRow.dtype) as storage."""
+
+        trajectory = Trajectory()
+        trajectory.data = data
+        trajectory.count = len(data)
+        return trajectory
+
+    @staticmethod
+    def from_dicts(rows):
+        """Creates a trajectory from a list of dicts (for example SbetRows saved as JSON). Unknown keys are ignored."""
+
+        trajectory = Trajectory(len(rows))
+        for name in SbetRow.dtype.names:
+            if len(rows) > 0 and name in rows[0]:
+                trajectory.data[name] = [row[name] for row in rows]
+        return trajectory
+
+    @staticmethod
+    def concatenate(trajectories):
+        if len(trajectories) < 1:
+            return Trajectory()
+        return Trajectory.from_data(np.concatenate([t.array() for t in trajectories]))
+
+    def array(self):
+        """Returns a view of the used part of the structured array."""
+        return self.data[:self.count]
+
+    def to_dicts(self):
+        names = SbetRow.dtype.names
+        return [dict(zip(names, row)) for row in self.array().tolist()]
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, ix):
+
+        if isinstance(ix, slice):
+            return self._copy_rows(ix)
+
+        if ix < 0:
+            ix += self.count
+        if ix < 0 or ix >= self.count:
+            raise IndexError("Trajectory index out of range")
+
+        return SbetRow.view(self, ix)
+
+    def __iter__(self):
+        for ix in range(self.count):
+            yield SbetRow.view(self, ix)
+
+    def _copy_rows(self, indices):
+        return Trajectory.from_data(self.array()[indices].copy())
+
+    def copy(self):
+        return self._copy_rows(slice(None))
+
+    def append(self, row):
+        """Appends a copy of the given SbetRow, and returns the view of the new row."""
+
+        if self.count >= len(self.data):
+            data = np.zeros(max(16, len(self.data) * 2), dtype=SbetRow.dtype)
+            data[:self.count] = self.data[:self.count]
+            self.data = data
+
+        self.data[self.count] = row.record()
+        self.count += 1
+
+        return SbetRow.view(self, self.count - 1)
+
+    def column(self, name):
+        """Returns a view of the given column."""
+        return self.data[name][:self.count]
+
+    def xyz(self):
+        """Returns an (N, 3) array with the x, y and alt columns."""
+        return np.column_stack([self.column("x"), self.column("y"), self.column("alt")])
+
+    def translate(self, t):
+        self.column("x")[:] += t[0]
+        self.column("y")[:] += t[1]
+        self.column("alt")[:] += t[2]
+        return self
+
+    def rotate(self, heading, center=None):
+        """Rotates all positions by the given angle around the Z axis, around the given center (or the first position).
+        The lat/lon columns no longer correspond to the positions, and are set to -1."""
+
+        if self.count < 1:
+            return self
+
+        if center is None:
+            center = (self.data["x"][0], self.data["y"][0])
+
+        x = self.column("x") - center[0]
+        y = self.column("y") - center[1]
+        cos = np.cos(heading)
+        sin = np.sin(heading)
+
+        self.column("x")[:] = cos * x - sin * y + center[0]
+        self.column("y")[:] = sin * x + cos * y + center[1]
+        self.column("lat")[:] = -1
+        self.column("lon")[:] = -1
+
+        return self
+
+    def distances2d(self, x, y):
+        """Returns the 2D distance from each position to the given point."""
+        return np.hypot(self.column("x") - x, self.column("y") - y)
+
+    def first_entering_circle(self, x, y, radius):
+        """Returns the index of the first position within the given circle, or -1 if no position is inside it."""
+
+        inside = np.flatnonzero(self.distances2d(x, y) <= radius)
+        return int(inside[0]) if len(inside) > 0 else -1
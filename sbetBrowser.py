@@ -3,10 +3,96 @@ import numpy as np
 from tqdm import tqdm
 from datetime import datetime
 import open3d as o3d
-import csv
 from sbet.sbetParser import SbetParser
+from sbet.sbetHelpers import timestamp_sow2unix
 from pcap.pcapReaderHelper import PcapReaderHelper
 
+# The exported columns, as (name in the exported file, Trajectory column).
+export_columns = [("index", "index"), ("time", "sow"), ("lat", "lat"), ("lon", "lon"), ("alt", "alt"), ("roll", "roll"), ("pitch", "pitch"), ("heading", "heading"), ("x", "x"), ("y", "y")]
+
+def export(parser, csv_path=None, npy_path=None, chunk_size=100000):
+    """Transforms all rows in the SBET file chunk by chunk (with one transformer call per chunk), and writes them to a CSV
+    file and/or a binary (structured .npy) file. Only one chunk is kept in memory at a time. Returns the statistics of the
+    exported rows (see print_statistics), collected while exporting."""
+
+    count = SbetParser.count_rows(parser.filename)
+
+    csv_file = None
+    if csv_path is not None:
+        csv_file = open(csv_path, "w", newline='')
+        csv_file.write(",".join([x[0] for x in export_columns]) + "\n")
+
+    npy_file = None
+    if npy_path is not None:
+        dtype = [(x[0], np.int64 if x[0] == "index" else np.float64) for x in export_columns]
+        npy_file = np.lib.format.open_memmap(npy_path, mode="w+", dtype=dtype, shape=(count,))
+
+    statistics = None
+    written = 0
+    with tqdm(total=count, ascii=True, desc="Exporting") as pbar:
+        for chunk in parser.get_row_chunks(chunk_size):
+
+            if csv_file is not None:
+                np.savetxt(csv_file, np.column_stack([chunk.column(x[1]) for x in export_columns]), delimiter=",", fmt=["%d"] + ["%.15g"] * (len(export_columns) - 1))
+
+            if npy_file is not None:
+                for (name, column) in export_columns:
+                    npy_file[name][written:written + len(chunk)] = chunk.column(column)
+
+            # The statistics are collected while exporting, so that the rows don't have to be read again.
+            statistics = add_statistics(statistics, chunk)
+
+            written += len(chunk)
+            pbar.update(len(chunk))
+
+    if csv_file is not None:
+        csv_file.close()
+    if npy_file is not None:
+        npy_file.flush()
+
+    return statistics
+
+def add_statistics(statistics, chunk):
+    """Returns the given statistics (or None) updated with the rows in the given chunk (a Trajectory)."""
+
+    if len(chunk) < 1:
+        return statistics
+
+    if statistics is None:
+        statistics = { "count": 0, "first": chunk[0].clone() }
+
+    statistics["count"] += len(chunk)
+    for (name, column) in [("time", "sow"), ("lat", "lat"), ("lon", "lon")]:
+        statistics["min_" + name] = min(statistics.get("min_" + name, np.inf), np.min(chunk.column(column)))
+        statistics["max_" + name] = max(statistics.get("max_" + name, -np.inf), np.max(chunk.column(column)))
+
+    return statistics
+
+def print_statistics(min_time, max_time, min_lat, max_lat, min_lon, max_lon, initial_heading, gps_week=-1):
+
+    print("Min time:", min_time)
+    print("Max time:", max_time)
+
+    if gps_week >= 0:
+
+        print("With GPS week:", gps_week)
+
+        min_unix_time = timestamp_sow2unix(min_time, gps_week)
+        max_unix_time = timestamp_sow2unix(max_time, gps_week)
+        print("Min unix time:", min_unix_time)
+        print("Max unix time:", max_unix_time)
+
+        print("Min human time:", datetime.utcfromtimestamp(min_unix_time).strftime("%Y-%m-%d %H:%M:%S"))
+        print("Max human time:", datetime.utcfromtimestamp(max_unix_time).strftime("%Y-%m-%d %H:%M:%S"))
+
+    print("Min lat:", min_lat)
+    print("Max lat:", max_lat)
+
+    print("Min lon:", min_lon)
+    print("Max lon:", max_lon)
+
+    print("Initial heading:", initial_heading)
+
 if __name__ == "__main__":
 
     import argparse
@@ -15,66 +101,48 @@ if __name__ == "__main__":
     parser.add_argument('--gps-week', type=int, default=-1, required=False, help="If given, this GPS week will be used to transform the timestamps to unix and human readable time.")
     parser.add_argument('--gps-epoch', type=int, default=-1, required=False, help="If given, this GPS epoch will be used to transform the coordinates.")
     parser.add_argument('--out-csv', type=str, required=False, help="If given, coordinates will be saved to this CSV file instead of being visualized.")
+    parser.add_argument('--out-npy', type=str, required=False, help="If given, coordinates will be saved to this binary file (a structured NumPy array with the same columns as --out-csv) instead of being visualized.")
+    parser.add_argument('--chunk-size', type=int, default=100000, required=False, help="The number of rows that are transformed and written at a time by --out-csv and --out-npy.")
+    parser.add_argument('--decimate', type=int, default=1, required=False, help="If larger than 1, only every n-th row is shown in the visualization.")
     args = parser.parse_args()
 
     # Create and start a visualization
     parser = SbetParser(args.sbet, args.sbet_noise, args.sbet_noise_from_frame_ix, args.sbet_crs_from, args.sbet_crs_to)
     parser.gps_epoch = args.gps_epoch
-    
-    min_time = np.min(parser.rows["time"])
-    max_time = np.max(parser.rows["time"])
 
     print("From CRS:", parser.crs_from)
     print("To CRS:", parser.crs_to)
     print("To CRS:", parser.gps_epoch)
 
-    print("Min time:", min_time)
-    print("Max time:", max_time)
-
-    if args.gps_week >= 0:
+    if args.out_csv is not None or args.out_npy is not None:
 
-        print("With GPS week:", args.gps_week)
-        
-        min_unix_time = timestamp_sow2unix(min_time, args.gps_week)
-        max_unix_time = timestamp_sow2unix(max_time, args.gps_week)
-        print("Min unix time:", min_unix_time)
-        print("Max unix time:", max_unix_time)
-        
-        print("Min human time:", datetime.utcfromtimestamp(min_unix_time).strftime("%Y-%m-%d %H:%M:%S"))
-        print("Max human time:", datetime.utcfromtimestamp(max_unix_time).strftime("%Y-%m-%d %H:%M:%S"))
+        statistics = export(parser, args.out_csv, args.out_npy, args.chunk_size)
 
-    print("Min lat:", np.min(parser.rows["lat"]))
-    print("Max lat:", np.max(parser.rows["lat"]))
-    
-    print("Min lon:", np.min(parser.rows["lon"]))
-    print("Max lon:", np.max(parser.rows["lon"]))
+        if statistics is not None:
+            print("Rows:", statistics["count"])
+            print_statistics(statistics["min_time"], statistics["max_time"], statistics["min_lat"], statistics["max_lat"], statistics["min_lon"], statistics["max_lon"], statistics["first"].heading, args.gps_week)
+            print("First coordinate:", statistics["first"])
 
-    print("Initial heading:", parser.rows[0]["heading"])
-
-    print("First row:", parser.rows[0])
+    else:
 
-    coords = parser.get_rows()
+        rows = parser.rows
+        print_statistics(np.min(rows["time"]), np.max(rows["time"]), np.min(rows["lat"]), np.max(rows["lat"]), np.min(rows["lon"]), np.max(rows["lon"]), rows[0]["heading"], args.gps_week)
 
-    print("First coordinate:", coords[0])
+        print("First row:", parser.rows[0])
 
-    if args.out_csv is not None:
+        coords = parser.get_rows(decimate=args.decimate)
 
-        with open(args.out_csv, "w", newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow(coords[0].get_csv_headers())
-            for c in coords:
-                writer.writerow(c.get_csv())
-
-    else:
+        print("First coordinate:", coords[0])
 
         path = o3d.geometry.LineSet(
-            points = o3d.utility.Vector3dVector([[p.x, p.y, p.alt] for p in coords]), lines=o3d.utility.Vector2iVector([[i, i+1] for i in range(len(coords) - 1)])
+            points = o3d.utility.Vector3dVector(coords.xyz()), lines=o3d.utility.Vector2iVector([[i, i+1] for i in range(len(coords) - 1)])
         )
         path.paint_uniform_color([1, 0, 0])
-        
-        coords = parser.get_rows(rotate=True)
+
+        # Rotate a copy of the already transformed coordinates (instead of reading and transforming them again).
+        coords = SbetParser.rotate_points(coords.copy(), coords[0].heading)
         transformed_path = o3d.geometry.LineSet(
-            points = o3d.utility.Vector3dVector([[p.x, p.y, p.alt] for p in coords]), lines=o3d.utility.Vector2iVector([[i, i+1] for i in range(len(coords) - 1)])
+            points = o3d.utility.Vector3dVector(coords.xyz()), lines=o3d.utility.Vector2iVector([[i, i+1] for i in range(len(coords) - 1)])
         )
         transformed_path.paint_uniform_color([0, 0, 1])
 
@@ -94,4 +162,4 @@ if __name__ == "__main__":
             vis.update_geometry(actual_position_cylinder)
             vis.refresh_non_blocking()
 
-        vis.run()
\ No newline at end of file
+        vis.run()
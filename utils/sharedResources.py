@@ -0,0 +1,27 @@
+import threading
+
+class SharedResources:
+    """
+    A registry of resources that are expensive to create, and can be shared by all readers in a run (for example
+    the parsed SBET data, coordinate transformers, and sensor metadata/lookup tables). Each resource is identified
+    by a kind and a key, and is created by the given function the first time it is requested.
+
+    Shared resources must not be modified by the users.
+    """
+
+    resources = {}
+    lock = threading.RLock()
+
+    @staticmethod
+    def get(kind, key, create):
+        """Returns the resource with the given kind and key, creating it by calling create() if it doesn't exist."""
+
+        with SharedResources.lock:
+            if (kind, key) not in SharedResources.resources:
+                SharedResources.resources[(kind, key)] = create()
+            return SharedResources.resources[(kind, key)]
+
+    @staticmethod
+    def clear():
+        with SharedResources.lock:
+            SharedResources.resources = {}